@@ -0,0 +1,382 @@
+"""
+Times and memory-profiles each pipeline stage in isolation on a synthetic corpus, and appends
+the results to a JSON history so runs can be compared.
+
+    python -m benchmarks.run_benchmarks --posts 1000 10000
+    python -m benchmarks.run_benchmarks --posts 100000 --stages clean_texts tag_posts --no-memory
+    python -m benchmarks.run_benchmarks --sample
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from src import config
+from src.metrics import peak_rss_mb
+from src.logger import setup_logger
+from benchmarks.synthetic import generate_corpus, synthetic_embeddings
+
+logger = setup_logger("Benchmarks")
+
+HISTORY_PATH = "benchmarks/history.json"
+# Shipped sample corpus with real mpnet embeddings, used for the two-stage agreement check
+SAMPLE_POSTS_PATH = f"{config.DATA_SAVE_DIR}/reddit_posts.csv"
+SAMPLE_EMBEDDINGS_PATH = f"{config.EMBEDDINGS_DIR}/reddit_embeddings_mpnet_v1.npy"
+SAMPLE_SEEDS = (0, 1, 2)
+# Lowest ARI against exact HDBSCAN any seed may reach on the sample before --sample fails
+SAMPLE_MIN_ARI = 0.85
+# Read-only inputs every stage may need, linked into each temp working directory
+SHARED_DIRS = [config.TEMPLATE_DIR, os.path.dirname(config.LEXICON_PATH)]
+
+
+@contextmanager
+def _workdir():
+    """
+    Runs a stage in a fresh temp directory, so relative paths (stores, caches, outputs) start empty.
+    """
+    cwd = os.getcwd()
+    path = tempfile.mkdtemp(prefix="whisperwatch-bench-")
+    for shared in SHARED_DIRS:
+        os.symlink(os.path.abspath(shared), os.path.join(path, shared))
+    os.chdir(path)
+    try:
+        os.makedirs(config.EMBEDDINGS_DIR, exist_ok=True)
+        os.makedirs(config.DATA_SAVE_DIR, exist_ok=True)
+        yield path
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_clean_texts(corpus):
+    from src.utils import clean_texts
+    bodies = corpus["comments"]["body"].tolist()
+    clean_texts(bodies, workers=1)
+    return len(bodies)
+
+
+def bench_tag_posts(corpus):
+    from src.tagger import tag_posts
+    tag_posts(corpus["posts"])
+    return len(corpus["posts"])
+
+
+def bench_add_top_comments(corpus):
+    from src.pooling import add_top_comments
+    add_top_comments(corpus["posts"], corpus["comments"], n=config.POOLING_TOP_COMMENTS)
+    return len(corpus["comments"])
+
+
+# Storage writers: (call, what is counted as items)
+WRITERS = {
+    "append_jsonl": (lambda storage, posts, comments: storage.append_jsonl(comments, "data/comments.jsonl"), "comments"),
+    "append_csv": (lambda storage, posts, comments: storage.append_csv(comments, "data/comments.csv"), "comments"),
+    "write_parquet": (lambda storage, posts, comments: storage.write_columnar(posts, "data/posts.parquet"), "posts"),
+    "write_feather": (lambda storage, posts, comments: storage.write_columnar(posts, "data/posts.feather"), "posts"),
+    "save_json": (lambda storage, posts, comments: storage.save_json(posts, comments, "data"), "both"),
+    "save_csv": (lambda storage, posts, comments: storage.save_csv(posts, comments, "data"), "both"),
+    "save_sqlite": (lambda storage, posts, comments: storage.save_sqlite(posts, comments, "data/reddit_data.db"), "both"),
+}
+
+
+def _writer(name):
+    def bench(corpus):
+        from src import storage
+        write, counted = WRITERS[name]
+        posts, comments = corpus["posts"], corpus["comments"]
+        write(storage, posts, comments)
+        return {"posts": len(posts), "comments": len(comments), "both": len(posts) + len(comments)}[counted]
+    return bench
+
+
+def bench_reduce(corpus):
+    from src.reducer import fit_reducer, transform
+    if "embeddings" not in corpus:
+        corpus["embeddings"] = synthetic_embeddings(corpus["posts"]["cluster_labels"].to_numpy(), seed=corpus["seed"])
+    np.save("embeddings/posts.npy", corpus["embeddings"])
+    embeddings = np.load("embeddings/posts.npy", mmap_mode="r")
+    scaler, pca = fit_reducer(embeddings)
+    transform(embeddings, scaler, pca, out_path=config.REDUCED_EMBEDDINGS_PATH)
+    return len(embeddings)
+
+
+def _cluster(corpus, algorithm):
+    from src.clustering import Clustering
+    posts = corpus["posts"]
+    embeddings = synthetic_embeddings(posts["cluster_labels"].to_numpy(), seed=corpus["seed"])
+    corpus[f"{algorithm}_labels"] = Clustering(posts=posts, comments=corpus["comments"]).create_hdbscan_clusters(
+        embeddings, algorithm=algorithm)
+    return len(posts)
+
+
+def bench_pca_hdbscan(corpus):
+    return _cluster(corpus, "exact")
+
+
+def bench_two_stage(corpus):
+    return _cluster(corpus, "two_stage")
+
+
+def check_two_stage(corpus) -> dict:
+    """
+    Agreement of the two-stage labels with the exact HDBSCAN path (run here, untimed, unless the
+    pca_hdbscan stage already did) and of both with the planted topics.
+    """
+    from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+    if "exact_labels" not in corpus:
+        with _workdir():
+            _cluster(corpus, "exact")
+    exact, two_stage = corpus["exact_labels"], corpus["two_stage_labels"]
+    truth = corpus["posts"]["cluster_labels"].to_numpy()
+    return {
+        "ari_vs_exact": round(float(adjusted_rand_score(exact, two_stage)), 4),
+        "nmi_vs_exact": round(float(normalized_mutual_info_score(exact, two_stage)), 4),
+        "ari_vs_truth": round(float(adjusted_rand_score(truth, two_stage)), 4),
+        "exact_ari_vs_truth": round(float(adjusted_rand_score(truth, exact)), 4),
+        "noise_share": round(float((two_stage == -1).mean()), 4),
+        "exact_noise_share": round(float((exact == -1).mean()), 4),
+    }
+
+
+def sample_agreement(posts_path: str = SAMPLE_POSTS_PATH, embeddings_path: str = SAMPLE_EMBEDDINGS_PATH,
+                     seeds=SAMPLE_SEEDS) -> dict:
+    """
+    Agreement of two-stage clustering with exact HDBSCAN on the shipped sample (real embeddings
+    instead of synthetic topics). Both run on the same reduced embeddings; two-stage runs once per
+    seed, since its micro-clusters depend on the k-means initialization.
+    """
+    import pandas as pd
+    from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score
+    from src.clustering import Clustering
+    from src.two_stage import two_stage_hdbscan
+
+    posts = pd.read_csv(posts_path)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    if len(embeddings) != len(posts):
+        raise ValueError(f"{embeddings_path} has {len(embeddings)} rows but {posts_path} has {len(posts)} posts")
+    with _workdir():
+        clustering = Clustering(posts=posts, comments=None)
+        exact = clustering.create_hdbscan_clusters(embeddings, algorithm="exact")
+        reduced = clustering.reduced_embeddings
+        times, runs = [], []
+        for seed in seeds:
+            start = time.perf_counter()
+            runs.append(two_stage_hdbscan(reduced, seed=seed))
+            times.append(time.perf_counter() - start)
+
+    def n_clusters(labels):
+        return len(set(labels.tolist()) - {-1})
+
+    ari = [round(float(adjusted_rand_score(exact, labels)), 4) for labels in runs]
+    nmi = [round(float(normalized_mutual_info_score(exact, labels)), 4) for labels in runs]
+    # Two-stage absorbs much of exact HDBSCAN's noise into clusters; this isolates agreement on the rest
+    clustered = exact != -1
+    ari_clustered = [round(float(adjusted_rand_score(exact[clustered], labels[clustered])), 4) for labels in runs]
+    result = {
+        "seconds": round(min(times), 4), "items": len(posts), "items_per_second": round(len(posts) / max(min(times), 1e-9), 1),
+        "seeds": list(seeds),
+        "ari_vs_exact": ari, "nmi_vs_exact": nmi,
+        "mean_ari_vs_exact": round(float(np.mean(ari)), 4), "mean_nmi_vs_exact": round(float(np.mean(nmi)), 4),
+        "ari_vs_exact_clustered": ari_clustered,
+        "clusters": [n_clusters(labels) for labels in runs], "exact_clusters": n_clusters(exact),
+        "noise_share": [round(float((labels == -1).mean()), 4) for labels in runs],
+        "exact_noise_share": round(float((exact == -1).mean()), 4),
+    }
+    if "cluster_labels" in posts:
+        # Labels stored with the sample by the pipeline that produced it
+        result["exact_ari_vs_stored"] = round(float(adjusted_rand_score(posts["cluster_labels"], exact)), 4)
+    return result
+
+
+def run_sample(posts_path: str = SAMPLE_POSTS_PATH, embeddings_path: str = SAMPLE_EMBEDDINGS_PATH) -> dict:
+    logger.info("Checking two-stage clustering against exact HDBSCAN on %s...", embeddings_path)
+    result = sample_agreement(posts_path, embeddings_path)
+    logger.info("two_stage_sample: ARI vs exact %s (mean %.3f; %s on posts exact did not mark as noise), NMI %s; "
+                "%s clusters vs %d exact, noise %s vs %.3f exact", result["ari_vs_exact"], result["mean_ari_vs_exact"],
+                result["ari_vs_exact_clustered"], result["nmi_vs_exact"], result["clusters"], result["exact_clusters"],
+                result["noise_share"], result["exact_noise_share"])
+    if min(result["ari_vs_exact"]) < SAMPLE_MIN_ARI:
+        logger.error("two_stage_sample: ARI vs exact %s is below the %.2f floor", result["ari_vs_exact"], SAMPLE_MIN_ARI)
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "params": {"sample": os.path.basename(embeddings_path), "n_posts": result["items"]},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "stages": {"two_stage_sample": result},
+    }
+
+
+def bench_report(corpus):
+    from src.generate_report import ReportGenerator
+    ReportGenerator(posts=corpus["posts"], comments=corpus["comments"], template_dir=config.TEMPLATE_DIR,
+                    output_dir="reports").run()
+    return len(corpus["posts"])
+
+
+STAGES = {
+    "clean_texts": bench_clean_texts,
+    "tag_posts": bench_tag_posts,
+    "add_top_comments": bench_add_top_comments,
+    **{name: _writer(name) for name in WRITERS},
+    "reduce": bench_reduce,
+    "pca_hdbscan": bench_pca_hdbscan,
+    "two_stage": bench_two_stage,
+    "report": bench_report,
+}
+
+# Quality checks run once after a stage is timed; their results are stored with its timings
+CHECKS = {
+    "two_stage": check_two_stage,
+}
+
+
+def measure(stage, corpus, memory: bool = True, repeat: int = 1) -> dict:
+    """
+    Best wall time over `repeat` runs, then (with `memory`) one more run under tracemalloc for the
+    peak Python/numpy allocation of the stage (Arrow's own memory pool is not traced). Each run
+    gets its own temp working directory.
+    """
+    times = []
+    for _ in range(repeat):
+        with _workdir():
+            start = time.perf_counter()
+            items = STAGES[stage](corpus)
+            times.append(time.perf_counter() - start)
+    result = {"seconds": round(min(times), 4), "items": items, "items_per_second": round(items / max(min(times), 1e-9), 1)}
+    if stage in CHECKS:
+        result.update(CHECKS[stage](corpus))
+    if memory:
+        with _workdir():
+            tracemalloc.start()
+            try:
+                STAGES[stage](corpus)
+                result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            finally:
+                tracemalloc.stop()
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str = HISTORY_PATH) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_history(history: list[dict], path: str = HISTORY_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def compare(run: dict, history: list[dict], threshold: float) -> list[str]:
+    """
+    Compares every stage with the latest earlier run on the same corpus parameters and machine.
+    Returns the stages that got slower by more than `threshold` (e.g. 0.25 = 25%).
+    """
+    previous = next((r for r in reversed(history)
+                     if r["params"] == run["params"] and r["machine"] == run["machine"]), None)
+    if previous is None:
+        logger.info("No earlier run with n_posts=%d on this machine to compare against", run["params"]["n_posts"])
+        return []
+    regressions = []
+    for stage, result in run["stages"].items():
+        before = previous["stages"].get(stage)
+        if not before or "seconds" not in before or "seconds" not in result:
+            continue
+        change = result["seconds"] / max(before["seconds"], 1e-9) - 1
+        logger.info("%-18s %8.3fs  (was %.3fs at %s, %+.0f%%)", stage, result["seconds"], before["seconds"],
+                    previous.get("commit") or "?", 100 * change)
+        if change > threshold:
+            regressions.append(stage)
+    return regressions
+
+
+def run(n_posts: int, comments_per_post: float, stages: list[str], seed: int, memory: bool, repeat: int) -> dict:
+    logger.info("Generating synthetic corpus with %d posts...", n_posts)
+    start = time.perf_counter()
+    posts, comments, truth = generate_corpus(n_posts, comments_per_post=comments_per_post, seed=seed)
+    logger.info("Generated %d posts and %d comments in %.1fs", len(posts), len(comments), time.perf_counter() - start)
+    corpus = {"posts": posts, "comments": comments, "truth": truth, "seed": seed}
+
+    results = {}
+    for stage in stages:
+        try:
+            results[stage] = measure(stage, corpus, memory=memory, repeat=repeat)
+            logger.info("%-18s %8.3fs  %12.1f items/s%s", stage, results[stage]["seconds"], results[stage]["items_per_second"],
+                        f"  peak {results[stage]['peak_mb']:.1f} MB" if "peak_mb" in results[stage] else "")
+        except Exception as e:
+            logger.error("Benchmark %s failed: %s", stage, str(e))
+            results[stage] = {"error": str(e)}
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "params": {"n_posts": n_posts, "comments_per_post": comments_per_post, "seed": seed, "n_comments": len(comments)},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "max_rss_mb": round(peak, 1) if (peak := peak_rss_mb()) is not None else None,
+        "stages": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage WhisperWatch benchmarks on synthetic data.")
+    parser.add_argument("--posts", type=int, nargs="+", default=[1000, 10_000], help="Corpus sizes to run (posts)")
+    parser.add_argument("--comments-per-post", type=float, default=10.0, help="Mean comment fan-out")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES), help="Stages to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage; the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--history", default=HISTORY_PATH, help="JSON history file to append results to")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown vs the previous comparable run reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any stage regressed")
+    parser.add_argument("--sample", action="store_true",
+                        help="Instead of the synthetic runs, check two-stage against exact clustering on the shipped sample data; "
+                             f"exits with status 1 if any seed's ARI vs exact is below {SAMPLE_MIN_ARI}")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    history = load_history(args.history)
+    regressions = []
+    below_floor = False
+    if args.sample:
+        result = run_sample()
+        regressions += [f"{stage}@sample" for stage in compare(result, history, args.threshold)]
+        history.append(result)
+        save_history(history, args.history)
+        below_floor = min(result["stages"]["two_stage_sample"]["ari_vs_exact"]) < SAMPLE_MIN_ARI
+    for n_posts in [] if args.sample else args.posts:
+        result = run(n_posts, args.comments_per_post, args.stages, args.seed, not args.no_memory, args.repeat)
+        regressions += [f"{stage}@{n_posts}" for stage in compare(result, history, args.threshold)]
+        history.append(result)
+        save_history(history, args.history)
+    if regressions:
+        logger.warning("Slower than the previous comparable run by more than %.0f%%: %s", 100 * args.threshold, ", ".join(regressions))
+        if args.fail_on_regression:
+            sys.exit(1)
+    if below_floor:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
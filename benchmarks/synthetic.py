@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from src.batches import posts_batch, comments_batch, POST_COLUMNS, COMMENT_COLUMNS
+from src.models import Post, Comment
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "te", "su", "no", "vi", "de", "pa", "ze", "gu", "fi", "ro", "an", "el"]
+SUBREDDITS = ["politics", "conspiracy", "worldnews", "Conservative", "news", "ukpolitics", "europe", "technology"]
+MARKUP = ["", "", "", " see https://example.com/{w}", " [source](https://example.org/{w})", " via r/{w}", " ping u/{w}", "\n\n**{w}**"]
+COPYPASTA = [
+    "wake up people, they do not want you to know what {w} really means. share this before it gets deleted",
+    "i am a long time lurker and i have never seen {w} covered like this. the media is silent",
+    "this is exactly what they said would happen with {w}. do your own research",
+]
+
+
+def _words(rng: np.random.Generator, n: int, min_syllables: int = 2, max_syllables: int = 4) -> np.ndarray:
+    lengths = rng.integers(min_syllables, max_syllables + 1, n)
+    parts = rng.choice(SYLLABLES, (n, max_syllables))
+    return np.array(["".join(p[:k]) for p, k in zip(parts, lengths)])
+
+
+def _texts(rng: np.random.Generator, vocab: np.ndarray, topic_words: np.ndarray, topics: np.ndarray,
+           lengths: np.ndarray, markup: bool = False) -> list[str]:
+    """
+    One text per row: words drawn from the row's topic (60%) or the shared vocabulary, with
+    optional Reddit markup (URLs, markdown links, r/ and u/ mentions) for the cleaner to strip.
+    """
+    total = int(lengths.sum())
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    from_topic = rng.random(total) < 0.6
+    words = np.where(
+        from_topic,
+        topic_words[topics[rows], rng.integers(0, topic_words.shape[1], total)],
+        vocab[rng.integers(0, len(vocab), total)],
+    )
+    texts = [" ".join(chunk) for chunk in np.split(words, np.cumsum(lengths)[:-1])]
+    if markup:
+        extras = rng.choice(MARKUP, len(texts))
+        texts = [t + m.format(w=t[:6]) if t else t for t, m in zip(texts, extras)]
+    return texts
+
+
+def _zipf_choice(rng: np.random.Generator, n_items: int, size: int, a: float = 1.2) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n_items + 1) ** a
+    return rng.choice(n_items, size, p=weights / weights.sum())
+
+
+def generate_corpus(n_posts: int = 1000, comments_per_post: float = 10.0, n_topics: int | None = None,
+                    n_authors: int | None = None, days: int = 30, n_bursts: int | None = None, burst_size: int = 20,
+                    copypasta_rate: float = 0.01, noise_rate: float = 0.2, start: str = "2025-01-01", seed: int = 0):
+    """
+    Deterministic synthetic Reddit corpus with the same columns as scraped data.
+
+    - Posts belong to topics (each with its own pseudo-words), so titles cluster; `cluster_labels`
+      holds the topic, or -1 for a `noise_rate` share of posts.
+    - Authors are Zipf-distributed; comment counts per post are Poisson(`comments_per_post`).
+    - `n_bursts` planted bursts: one author posting `burst_size` posts on one topic in one subreddit within an hour.
+    - A `copypasta_rate` share of comments are one of a few template texts posted by many authors.
+    - Selftexts and comment bodies carry raw markup (URLs, markdown, mentions), as before cleaning.
+
+    Returns (posts, comments, truth) with posts/comments as batches (see src/batches.py) and `truth`
+    describing the planted bursts and copypasta.
+    """
+    rng = np.random.default_rng(seed)
+    n_topics = n_topics or max(5, n_posts // 200)
+    n_authors = n_authors or max(50, n_posts // 4)
+    n_bursts = max(1, n_posts // 1000) if n_bursts is None else n_bursts
+    vocab = _words(rng, 5000)
+    topic_words = _words(rng, n_topics * 40).reshape(n_topics, 40)
+    authors = np.array([f"user_{i}" for i in range(n_authors)])
+    t0 = pd.Timestamp(start).value // 10**9
+    span = days * 86400
+
+    topics = rng.integers(0, n_topics, n_posts)
+    author_ids = _zipf_choice(rng, n_authors, n_posts)
+    subreddits = rng.choice(SUBREDDITS, n_posts)
+    times = t0 + rng.integers(0, span, n_posts)
+
+    # Planted bursts overwrite the first posts: same author, topic and subreddit within one hour
+    bursts = []
+    burst_size = min(burst_size, n_posts // max(n_bursts, 1))
+    for b in range(n_bursts if burst_size else 0):
+        rows = np.arange(b * burst_size, (b + 1) * burst_size)
+        burst_start = t0 + int(rng.integers(0, span - 3600))
+        author_ids[rows] = rng.integers(0, n_authors)
+        topics[rows] = rng.integers(0, n_topics)
+        subreddits[rows] = rng.choice(SUBREDDITS)
+        times[rows] = burst_start + np.sort(rng.integers(0, 3600, len(rows)))
+        bursts.append({"author": str(authors[author_ids[rows[0]]]), "subreddit": str(subreddits[rows[0]]),
+                       "topic": int(topics[rows[0]]), "start": int(burst_start), "size": len(rows)})
+
+    title_lengths = rng.integers(5, 14, n_posts)
+    body_lengths = np.where(rng.random(n_posts) < 0.4, 0, rng.integers(10, 120, n_posts))
+    n_comments = rng.poisson(comments_per_post, n_posts)
+    labels = np.where(rng.random(n_posts) < noise_rate, -1, topics)
+    post_ids = np.array([f"p{i:07d}" for i in range(n_posts)])
+
+    posts = pd.DataFrame({
+        "post_id": post_ids,
+        "subreddit": subreddits,
+        "author": authors[author_ids],
+        "title": _texts(rng, vocab, topic_words, topics, title_lengths),
+        "selftext": _texts(rng, vocab, topic_words, topics, body_lengths, markup=True),
+        "score": rng.lognormal(4, 2, n_posts).astype(np.int64),
+        "num_comments": n_comments,
+        "created_utc": pd.to_datetime(times, unit="s"),
+        "flair": rng.choice(np.array(["News", "Discussion", "Opinion", None], dtype=object), n_posts),
+        "url": [f"https://example.com/{p}" for p in post_ids],
+        "collection_date": pd.Timestamp(t0 + span, unit="s"),
+        "tags": [[] for _ in range(n_posts)],
+        "top_comments": [[] for _ in range(n_posts)],
+        "cluster_labels": labels,
+    }, columns=POST_COLUMNS)
+
+    n_total = int(n_comments.sum())
+    parent = np.repeat(np.arange(n_posts), n_comments)
+    comment_lengths = rng.integers(3, 60, n_total)
+    bodies = _texts(rng, vocab, topic_words, topics[parent], comment_lengths, markup=True)
+    copypasta = np.flatnonzero(rng.random(n_total) < copypasta_rate)
+    templates = [t.format(w=topic_words[0, i]) for i, t in enumerate(COPYPASTA)]
+    for i in copypasta:
+        bodies[i] = templates[i % len(templates)]
+    comments = pd.DataFrame({
+        "comment_id": [f"c{i:08d}" for i in range(n_total)],
+        "post_id": post_ids[parent],
+        "subreddit": subreddits[parent],
+        "author": authors[_zipf_choice(rng, n_authors, n_total)],
+        "body": bodies,
+        "score": rng.geometric(0.05, n_total) - 3,
+        "created_utc": pd.to_datetime(times[parent] + rng.exponential(6 * 3600, n_total).astype(np.int64), unit="s"),
+        "parent_id": ["t3_" + p for p in post_ids[parent]],
+        "collection_date": pd.Timestamp(t0 + span, unit="s"),
+    }, columns=COMMENT_COLUMNS)
+
+    truth = {"bursts": bursts, "copypasta": templates, "n_copypasta": len(copypasta), "n_topics": n_topics}
+    return posts_batch(posts), comments_batch(comments), truth
+
+
+def synthetic_embeddings(labels: np.ndarray, dim: int = 768, spread: float = 0.6, seed: int = 0) -> np.ndarray:
+    """
+    Random embeddings with one Gaussian blob per label (-1 rows are uniform noise), float32.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    centers = rng.normal(size=(max(int(labels.max()) + 1, 1), dim)).astype(np.float32)
+    X = rng.normal(scale=spread, size=(len(labels), dim)).astype(np.float32)
+    clustered = labels >= 0
+    X[clustered] += centers[labels[clustered]]
+    X[~clustered] *= 1 / spread
+    return X
+
+
+def to_records(batch: pd.DataFrame, cls=Post) -> list:
+    """
+    Post/Comment records of a batch, for the per-record APIs (e.g. `tag_post`, the storage writers).
+    """
+    names = POST_COLUMNS if cls is Post else COMMENT_COLUMNS
+    columns = [batch[name].tolist() for name in names]
+    return [cls(*values) for values in zip(*columns)]
@@ -1,64 +1,315 @@
-import pandas as pd
+import argparse
+import json
+import os
 
-from src.reddit_scraper import RedditScraper
 from src import config
-from src.storage import save_json, save_csv, save_sqlite
-from src.tagger import tag_post
-from src.logger import setup_logger
-from src.clustering import Clustering
-from src.generate_report import ReportGenerator
+from src import metrics
+from src.logger import setup_logger, LOG_DIR
 from src.utils import ensure_all_dirs
 
+# Heavy dependencies (torch, sentence-transformers, sklearn, matplotlib, praw) are imported
+# inside the stage that needs them, so a report-only or scrape-only run starts quickly.
+
 logger = setup_logger()
 
 # Ensure necessary directories exist
 ensure_all_dirs()
 
-def main(run_scraper: bool = False, run_clustering: bool = False, run_report: bool = True, embeddings_file: str = "reddit_posts_mpnet.npy"):
-    logger.info("Starting WhisperWatch collection pipeline...")
-    logger.debug("Running with config: %s", config.SUBREDDITS)
-    if run_scraper:
-        logger.info("Running Reddit scraper...")
-        scraper = RedditScraper(
-            subreddits=config.SUBREDDITS,
-            top_limit=config.TOP_POSTS,
-            hot_limit=config.HOT_POSTS,
-            min_comments=config.MIN_COMMENTS,
-            min_score=config.MIN_SCORE,
-            max_comments_per_post=config.MAX_COMMENTS_PER_POST
-        )
 
+def scrape(subreddits: list[str] | None = None):
+    """
+    Scrapes the configured subreddits, then tags the posts collected by this run and patches them
+    into the posts snapshots. Returns the number of posts and comments collected by this run.
+    """
+    from src.reddit_scraper import RedditScraper
+    from src.checkpoint import ScrapeCheckpoint
+    from src.storage import COMMENTS_FILE
+
+    logger.info("Running Reddit scraper...")
+    # Comments are append-only, so each checkpoint flush appends its new comments to these files
+    comments_path = f"{config.DATA_SAVE_DIR}/{COMMENTS_FILE}"
+    checkpoint = ScrapeCheckpoint(config.DB_PATH, comment_paths=[f"{comments_path}.jsonl", f"{comments_path}.csv"])
+    scraper = RedditScraper(
+        subreddits=subreddits or config.SUBREDDITS,
+        top_limit=config.TOP_POSTS,
+        hot_limit=config.HOT_POSTS,
+        new_limit=config.NEW_POSTS,
+        min_comments=config.MIN_COMMENTS,
+        min_score=config.MIN_SCORE,
+        max_comments_per_post=config.MAX_COMMENTS_PER_POST,
+        max_workers=config.SCRAPER_WORKERS,
+        checkpoint=checkpoint,
+        checkpoint_every=config.CHECKPOINT_EVERY
+    )
+
+    try:
         scraper._run()
-        posts, comments = scraper.get_results()
-        
-        logger.info("Tagging posts...")
-        tagged_posts = [tag_post(post) for post in posts]
+    finally:
+        checkpoint.close()
 
-        logger.info("Collected %d posts and %d comments. Saving...", len(tagged_posts), len(comments))
+    # The scraper only collects this run's delta (new posts and posts whose score or comment count
+    # moved), and only those need new top comments and tags
+    _enrich_and_save(scraper.posts["post_id"], streamed_top_comments=scraper.complete_top_comments())
 
-        save_json(tagged_posts, comments, config.DATA_SAVE_DIR)
-        save_csv(tagged_posts, comments, config.DATA_SAVE_DIR)
-        save_sqlite(tagged_posts, comments, config.DB_PATH)
+    logger.info("All data saved. WhisperWatch collection complete.")
+    return len(scraper.posts), scraper.n_comments
+
+
+def ingest(paths: list[str], subreddits: list[str] | None = None, start: str | None = None, end: str | None = None):
+    """
+    Backfills the store from Reddit dump files (see src/archive_ingest.py), then tags the posts it
+    wrote or added comments to and patches them into the snapshots like `scrape`. Returns the
+    number of posts and comments kept.
+    """
+    from src.archive_ingest import ingest_dumps
+
+    logger.info("Ingesting %d dump file(s)...", len(paths))
+    totals, post_ids = ingest_dumps(paths, db_path=config.DB_PATH, subreddits=subreddits or config.SUBREDDITS,
+                                    start=start, end=end)
+    _enrich_and_save(post_ids)
+    logger.info("All data saved. WhisperWatch ingestion complete.")
+    return totals.get("posts", {}).get("kept", 0), totals.get("comments", {}).get("kept", 0)
+
+
+def _enrich_and_save(post_ids=None, streamed_top_comments: dict | None = None, chunk_size: int = config.ENRICH_CHUNK_SIZE) -> int:
+    """
+    Attaches top comments to and tags the stored posts in `post_ids` (every stored post when None),
+    then patches them into the posts snapshots: the other rows are carried over from the old
+    snapshot (or read from the store when there is none yet) without being re-enriched. Posts are
+    handled `chunk_size` at a time, so memory is bounded by the chunk rather than the corpus.
+    Posts in `streamed_top_comments` ({post_id: bodies}, kept by the scraper during collection)
+    keep those; only the others have theirs recomputed from their stored comments.
+    Returns the number of posts enriched.
+    """
+    streamed_top_comments = streamed_top_comments or {}
+    import pandas as pd
+    from src.pooling import add_top_comments
+    from src.tagger import tag_posts
+    from src.storage import SQLiteStore, SnapshotWriter, POSTS_FILE
+
+    snapshot_paths = [f"{config.DATA_SAVE_DIR}/{POSTS_FILE}.parquet", f"{config.DATA_SAVE_DIR}/{POSTS_FILE}.csv"]
+    if post_ids is not None:
+        post_ids = sorted({str(p) for p in post_ids})
+        if not post_ids and all(os.path.exists(path) for path in snapshot_paths):
+            logger.info("No new or changed posts, the snapshots are up to date")
+            return 0
+
+    # Posts change between runs (scores, tags), so their snapshot rows are replaced; comments are append-only
+    n_posts = 0
+    with metrics.stage("tag") as stage, SQLiteStore(config.DB_PATH) as store, \
+            SnapshotWriter(snapshot_paths[0]) as parquet, SnapshotWriter(snapshot_paths[1]) as csv:
+        if post_ids is None:
+            chunks = store.post_id_chunks(chunk_size)
+        else:
+            for path, snapshot in zip(snapshot_paths, (parquet, csv)):
+                for rows in _unchanged_posts(path, store, set(post_ids), chunk_size):
+                    snapshot.write(rows)
+            chunks = (post_ids[start:start + chunk_size] for start in range(0, len(post_ids), chunk_size))
+        for ids in chunks:
+            posts = store.query_posts(post_ids=ids)
+            recompute = [post_id for post_id in ids if post_id not in streamed_top_comments]
+            comments = store.query_comments(post_ids=recompute, columns=["comment_id", "post_id", "body", "score"])
+            posts, _ = add_top_comments(posts, comments, n=10)
+            if streamed_top_comments:
+                posts["top_comments"] = pd.Series(
+                    [streamed_top_comments.get(post_id, top) for post_id, top in zip(posts["post_id"], posts["top_comments"])],
+                    index=posts.index, dtype=object)
+            posts["tags"] = tag_posts(posts)
+            store.upsert_posts(posts)
+            parquet.write(posts)
+            csv.write(posts)
+            n_posts += len(posts)
+            logger.info("Tagged and saved %d posts", n_posts)
+        stage.items(posts=n_posts)
+    return n_posts
+
+
+def _unchanged_posts(snapshot_path: str, store, post_ids: set, chunk_size: int):
+    """
+    Batches of the stored posts not in `post_ids`: streamed from the snapshot at `snapshot_path`
+    when it exists, else read from the store.
+    """
+    from src.storage import iter_snapshot
+
+    if os.path.exists(snapshot_path):
+        for rows in iter_snapshot(snapshot_path, chunk_size):
+            yield rows[~rows["post_id"].astype(str).isin(post_ids)]
+        return
+    for ids in store.post_id_chunks(chunk_size):
+        ids = [post_id for post_id in ids if post_id not in post_ids]
+        if ids:
+            yield store.query_posts(post_ids=ids)
+
+
+def load_data(subreddits: list[str] | None = None, start: str | None = None, end: str | None = None):
+    """
+    Loads stored posts and comments as batches, only the requested subreddit/time window when the DB
+    holds posts. Otherwise (no DB, or one without posts) the posts snapshot and comments CSV are read.
+    """
+    import pandas as pd
+    from src.batches import posts_batch, comments_batch
+    from src.storage import SQLiteStore, load_columnar, POSTS_FILE, COMMENTS_FILE
+
+    logger.info("Loading stored posts and comments...")
+    snapshot = f"{config.DATA_SAVE_DIR}/{POSTS_FILE}.parquet"
+    comments_csv = f"{config.DATA_SAVE_DIR}/{COMMENTS_FILE}.csv"
+    posts = None
+    if os.path.exists(config.DB_PATH):
+        with SQLiteStore(config.DB_PATH) as store:
+            if store.conn.execute("SELECT 1 FROM posts LIMIT 1").fetchone() is not None:
+                posts = store.query_posts(subreddit=subreddits, start=start, end=end)
+                comments = store.query_comments(subreddit=subreddits, start=start, end=end)
+    if posts is None:
+        posts = load_columnar(snapshot) if os.path.exists(snapshot) else pd.read_csv(f"{config.DATA_SAVE_DIR}/{POSTS_FILE}.csv")
+        comments = pd.read_csv(comments_csv) if os.path.exists(comments_csv) else None
+    return posts_batch(posts), (comments_batch(comments) if comments is not None else None)
+
+
+def cluster(posts, comments, embeddings_file: str | None = None, mode: str | None = None, windowed: bool = False):
+    """
+    Clusters posts into narratives. Returns (clustered posts, near-duplicate groups). With
+    `windowed` (posts are a subreddit/time slice), the narrative model and posts snapshot are kept.
+    """
+    from src.clustering import Clustering
+
+    logger.info("Running clustering...")
+    clustering = Clustering(posts=posts, comments=comments, embeddings_file=embeddings_file, windowed=windowed)
+    clustering._run(mode=mode)
+    return clustering.posts, clustering.duplicate_groups
 
-        logger.info("All data saved. WhisperWatch collection complete.")
-    else:
-        logger.info("Skipping Reddit scraper, using existing data...")
 
-        # Load existing data
-        tagged_posts = pd.read_csv(config.DATA_SAVE_DIR + "/reddit_posts.csv")
-        tagged_posts['created_utc'] = pd.to_datetime(tagged_posts['created_utc'])
-        comments = pd.read_csv(config.DATA_SAVE_DIR + "/reddit_comments.csv")
+def load_duplicate_groups():
+    duplicates_path = f"{config.DATA_SAVE_DIR}/duplicate_groups.json"
+    if not os.path.exists(duplicates_path):
+        return None
+    with open(duplicates_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def report(posts, comments, duplicate_groups=None) -> str:
+    from src.generate_report import ReportGenerator
+
+    logger.info("Generating analysis report...")
+    report_generator = ReportGenerator(posts=posts, template_dir=config.TEMPLATE_DIR, output_dir=config.REPORTS_SAVE_DIR,
+                                       duplicate_groups=duplicate_groups, comments=comments)
+    report_generator.run()
+    return f"{report_generator.output_dir}/report.html"
+
+
+def _has_labels(posts) -> bool:
+    return "cluster_labels" in getattr(posts, "columns", []) and not posts["cluster_labels"].isna().any()
+
+
+def main(run_scraper: bool = False, run_clustering: bool = False, run_report: bool = True, embeddings_file: str | None = None,
+         subreddits: list[str] | None = None, start: str | None = None, end: str | None = None, cluster_mode: str | None = None,
+         force: bool = False, profile: list[str] | None = None, ingest_files: list[str] | None = None):
+    """
+    Runs the requested stages. Clustering and reporting are skipped when their inputs and
+    parameters match the last run (see src/pipeline.py) unless `force` is set.
+    Stage timings, memory and throughput go to metrics.json next to the report (or under logs/
+    when no report is rendered); stages in `profile` run under cProfile. `ingest_files` backfills
+    the store from Reddit dump files instead of scraping.
+    """
+    from src.pipeline import StageCache, stage_params, content_hash, directory_hash, fingerprint, \
+        CLUSTER_POST_COLUMNS, CLUSTER_COMMENT_COLUMNS, REPORT_POST_COLUMNS, REPORT_COMMENT_COLUMNS
+
+    logger.info("Starting WhisperWatch collection pipeline...")
+    logger.debug("Running with config: %s", config.SUBREDDITS)
+    run_metrics = metrics.start_run(profile or ())
+    metrics_dir = os.path.join(LOG_DIR, "run_" + run_metrics.started_at.strftime("%Y-%m-%d_%H-%M-%S"))
+    cache = StageCache()
+    if ingest_files or run_scraper:
+        with metrics.stage("ingest" if ingest_files else "scrape") as stage:
+            n_posts, n_comments = ingest(ingest_files, subreddits, start, end) if ingest_files else scrape(subreddits)
+            stage.items(posts=n_posts, comments=n_comments)
+    if not (run_clustering or run_report):
+        run_metrics.write(metrics_dir)
+        return
+
+    with metrics.stage("load") as stage:
+        posts, comments = load_data(subreddits, start, end)
+        stage.items(posts=len(posts), comments=len(comments) if comments is not None else 0)
+    windowed = bool(subreddits or start or end)
 
     if run_clustering:
-        logger.info("Running clustering...")
-        clustering = Clustering(posts=tagged_posts, comments=comments, embeddings_file=embeddings_file)
-        clustering._run()
+        cluster_fp = fingerprint(
+            content_hash(posts, CLUSTER_POST_COLUMNS), content_hash(comments, CLUSTER_COMMENT_COLUMNS),
+            stage_params("cluster"), cluster_mode
+        )
+        # Labels come back with the stored posts, so a fresh cluster stage needs no work
+        if not force and cache.is_fresh("cluster", cluster_fp) and _has_labels(posts):
+            logger.info("Clustering is up to date for these posts and settings, skipping")
+            duplicate_groups = load_duplicate_groups()
+        else:
+            with metrics.stage("cluster") as stage:
+                posts, duplicate_groups = cluster(posts, comments, embeddings_file, cluster_mode, windowed)
+                stage.items(posts=len(posts))
+            artifacts = [config.CLUSTER_MODEL_PATH]
+            if config.DETECT_DUPLICATES:
+                artifacts.append(f"{config.DATA_SAVE_DIR}/duplicate_groups.json")
+            cache.record("cluster", cluster_fp, artifacts)
+    else:
+        duplicate_groups = load_duplicate_groups()
 
     # Run analysis report generation
     if run_report:
-        logger.info("Generating analysis report...")
-        report_generator = ReportGenerator(posts=tagged_posts, template_dir=config.TEMPLATE_DIR, output_dir=config.REPORTS_SAVE_DIR)
-        report_generator.run()
+        report_fp = fingerprint(
+            content_hash(posts, REPORT_POST_COLUMNS), content_hash(comments, REPORT_COMMENT_COLUMNS),
+            content_hash(duplicate_groups or []),
+            directory_hash(config.TEMPLATE_DIR), stage_params("report")
+        )
+        if not force and cache.is_fresh("report", report_fp):
+            logger.info("Report is up to date: %s", cache.artifacts("report")[0])
+        else:
+            with metrics.stage("report") as stage:
+                report_path = report(posts, comments, duplicate_groups)
+                stage.items(posts=len(posts))
+            cache.record("report", report_fp, [report_path])
+            metrics_dir = os.path.dirname(report_path)
+    run_metrics.write(metrics_dir)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="whisperwatch", description="Reddit narrative monitoring pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    window = argparse.ArgumentParser(add_help=False)
+    window.add_argument("--subreddits", nargs="+", help="Only these subreddits (default: config.SUBREDDITS when scraping, all stored otherwise)")
+    window.add_argument("--start", help="Only posts created at or after this ISO date/time")
+    window.add_argument("--end", help="Only posts created before this ISO date/time")
+
+    clustering = argparse.ArgumentParser(add_help=False)
+    clustering.add_argument("--mode", choices=["auto", "assign", "refit"], help="Clustering mode (default: config.CLUSTER_MODE)")
+    clustering.add_argument("--embeddings-file", default=None, help="Legacy .npy embeddings to seed the embedding store with")
+
+    window.add_argument("--force", action="store_true", help="Rerun stages even if their inputs and settings are unchanged")
+    window.add_argument("--profile", nargs="+", metavar="STAGE", help="Run these stages under cProfile, e.g. cluster or cluster/embed")
+
+    subparsers.add_parser("scrape", parents=[window], help="Scrape, tag and store new posts and comments")
+    ingest_parser = subparsers.add_parser("ingest", parents=[window], help="Backfill the store from Reddit dump files (.zst NDJSON)")
+    ingest_parser.add_argument("files", nargs="+", help="Submission (RS_*) and comment (RC_*) dumps")
+    subparsers.add_parser("cluster", parents=[window, clustering], help="Cluster stored posts into narratives")
+    subparsers.add_parser("report", parents=[window], help="Generate the HTML report from stored data")
+    subparsers.add_parser("all", parents=[window, clustering], help="Scrape, cluster and report")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    main(
+        run_scraper=args.command in ("scrape", "all"),
+        run_clustering=args.command in ("cluster", "all"),
+        run_report=args.command in ("report", "all"),
+        embeddings_file=getattr(args, "embeddings_file", None),
+        subreddits=args.subreddits,
+        start=args.start,
+        end=args.end,
+        cluster_mode=getattr(args, "mode", None),
+        force=args.force,
+        profile=args.profile,
+        ingest_files=getattr(args, "files", None),
+    )
+
 
 if __name__ == "__main__":
-    main(run_scraper=False, run_clustering=True, run_report=True, embeddings_file="reddit_embeddings_mpnet_v1.npy")
+    cli()
@@ -0,0 +1,338 @@
+import os
+import re
+import sys
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from src import config
+from src import metrics
+from src.models import Post, Comment
+from src.utils import clean_text
+from src.storage import SQLiteStore
+from src.logger import setup_logger
+
+logger = setup_logger("ArchiveIngest")
+
+# Monthly dump naming: RS_2024-01.zst holds submissions, RC_2024-01.zst comments
+SUBMISSIONS_PREFIX = "RS_"
+COMMENTS_PREFIX = "RC_"
+READ_SIZE = 2**24            # decompressed bytes read at a time
+ZSTD_MAX_WINDOW = 2**31      # the dumps are compressed with --long=31
+
+
+def _open_dump(path):
+    """
+    Binary stream of a dump's NDJSON: zstd-decompressed for .zst files, as is otherwise.
+    """
+    if not path.endswith(".zst"):
+        return open(path, "rb")
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading .zst dumps needs the zstandard package: pip install zstandard")
+    return zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW).stream_reader(
+        open(path, "rb"), read_across_frames=True, closefd=True
+    )
+
+
+def iter_blocks(path, read_size=READ_SIZE):
+    """
+    Yields a dump as blocks of whole lines of about `read_size` bytes, so memory stays bounded
+    however large the file is.
+    """
+    with _open_dump(path) as stream:
+        tail = b""
+        while True:
+            data = stream.read(read_size)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b"\n") + 1
+            tail = data[cut:]
+            if cut:
+                yield data[:cut]
+        if tail.strip():
+            yield tail
+
+
+def dump_kind(path) -> str:
+    """
+    "posts" or "comments", from the RS_/RC_ file name or else from the first record.
+    """
+    name = os.path.basename(path)
+    if name.startswith(SUBMISSIONS_PREFIX):
+        return "posts"
+    if name.startswith(COMMENTS_PREFIX):
+        return "comments"
+    for block in iter_blocks(path, 2**16):
+        return "comments" if "link_id" in json.loads(block.split(b"\n", 1)[0]) else "posts"
+    return "posts"
+
+
+def _epoch(value) -> float | None:
+    """
+    Unix seconds from an epoch number (or numeric string) or an ISO date/time.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class DumpFilter:
+    """
+    Selects and maps dump records: subreddit (case-insensitive), [start, end) window, score and
+    comment thresholds for submissions, and for comments membership of `post_ids` (when given).
+
+    Lines are pre-screened with one bytes regex over each block for the `"subreddit":"<name>"`
+    field, so only lines of the wanted subreddits are JSON-decoded at all.
+    """
+    def __init__(self, subreddits=None, min_score=0, min_comments=0, start=None, end=None, post_ids=None, collection_date=None):
+        # Records keep the configured spelling of the subreddit, as live collection does
+        self.names = {s.lower(): s for s in subreddits} if subreddits else None
+        self.pattern = None
+        if subreddits:
+            names = b"|".join(re.escape(s.encode()) for s in subreddits)
+            self.pattern = re.compile(rb'"subreddit":\s*"(?:' + names + rb')"', re.IGNORECASE)
+        self.min_score = min_score
+        self.min_comments = min_comments
+        self.start = _epoch(start) if start is not None else float("-inf")
+        self.end = _epoch(end) if end is not None else float("inf")
+        self.post_ids = post_ids
+        self.collection_date = collection_date or datetime.utcnow().isoformat()
+
+    def candidates(self, block: bytes):
+        """
+        Lines of `block` that may belong to a wanted subreddit.
+        """
+        if self.pattern is None:
+            yield from (line for line in block.split(b"\n") if line.strip())
+            return
+        last = -1
+        for match in self.pattern.finditer(block):
+            start = block.rfind(b"\n", 0, match.start()) + 1
+            if start == last:  # the field also appears in nested objects (e.g. crossposts)
+                continue
+            last = start
+            end = block.find(b"\n", match.end())
+            yield block[start:end if end >= 0 else len(block)]
+
+    def _common(self, record):
+        """
+        (subreddit, created_utc, collection_date) of a record inside the subreddit and time filters, else None.
+        """
+        subreddit = str(record.get("subreddit") or "")
+        if self.names is not None:
+            subreddit = self.names.get(subreddit.lower())
+            if subreddit is None:
+                return None
+        created = _epoch(record.get("created_utc"))
+        if created is None or not self.start <= created < self.end or not record.get("id"):
+            return None
+        retrieved = record.get("retrieved_on") or record.get("retrieved_utc")
+        collected = datetime.utcfromtimestamp(int(_epoch(retrieved))).isoformat() if retrieved else self.collection_date
+        return subreddit, datetime.utcfromtimestamp(int(created)).isoformat(), collected
+
+    def post(self, record) -> Post | None:
+        common = self._common(record)
+        score, num_comments = _int(record.get("score")), _int(record.get("num_comments"))
+        if common is None or score < self.min_score or num_comments < self.min_comments:
+            return None
+        subreddit, created_utc, collection_date = common
+        return Post(
+            post_id=str(record["id"]),
+            subreddit=subreddit,
+            author=sys.intern(str(record.get("author"))),
+            title=clean_text(record.get("title")),
+            selftext=clean_text(record.get("selftext")),
+            score=score,
+            num_comments=num_comments,
+            created_utc=created_utc,
+            flair=record.get("link_flair_text"),
+            url=record.get("url") or "",
+            collection_date=collection_date
+        )
+
+    def comment(self, record) -> Comment | None:
+        post_id = str(record.get("link_id") or "").removeprefix("t3_")
+        if self.post_ids is not None and post_id not in self.post_ids:
+            return None
+        common = self._common(record)
+        if common is None:
+            return None
+        subreddit, created_utc, collection_date = common
+        return Comment(
+            comment_id=str(record["id"]),
+            post_id=post_id,
+            subreddit=subreddit,
+            author=sys.intern(str(record.get("author"))),
+            body=clean_text(record.get("body")),
+            score=_int(record.get("score")),
+            created_utc=created_utc,
+            parent_id=str(record.get("parent_id") or ""),
+            collection_date=collection_date
+        )
+
+
+def parse_block(block: bytes, kind, dump_filter: DumpFilter):
+    """
+    The records of one block of dump lines kept by `dump_filter`, with the block's counts.
+    """
+    build = dump_filter.post if kind == "posts" else dump_filter.comment
+    records = []
+    counts = {"bytes": len(block), "lines": block.count(b"\n"), "candidates": 0, "bad_lines": 0}
+    for line in dump_filter.candidates(block):
+        counts["candidates"] += 1
+        try:
+            record = build(json.loads(line))
+        except (ValueError, TypeError, OverflowError):  # truncated or malformed lines
+            counts["bad_lines"] += 1
+            continue
+        if record is not None:
+            records.append(record)
+    return records, counts
+
+
+# Set once per pool process by `_init_worker`, so the filter (and its post ids) is not sent with every block
+_worker_filter = None
+
+
+def _init_worker(dump_filter: DumpFilter):
+    global _worker_filter
+    _worker_filter = dump_filter
+
+
+def _parse_in_worker(block: bytes, kind):
+    return parse_block(block, kind, _worker_filter)
+
+
+def _parsed_blocks(path, kind, dump_filter: DumpFilter, pool=None, max_in_flight=1):
+    """
+    Yields (records, counts) for each block of `path`, in file order. Blocks are always read and
+    decompressed here (a zstd stream can only be read sequentially); with a `pool` started by
+    `_init_worker`, they are parsed on it, at most `max_in_flight` at a time.
+    """
+    if pool is None:
+        for block in iter_blocks(path, READ_SIZE):
+            yield parse_block(block, kind, dump_filter)
+        return
+    pending = deque()
+    for block in iter_blocks(path, READ_SIZE):
+        pending.append(pool.submit(_parse_in_worker, block, kind))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def ingest_file(path, kind, dump_filter: DumpFilter, sink, batch_size=10_000, pool=None, max_in_flight=1) -> dict:
+    """
+    Streams one dump through `dump_filter` (parsing its blocks on `pool` when given, see
+    `_parsed_blocks`) and hands kept records to `sink.put((kind, records))` in batches of
+    `batch_size`. Returns the file's counts.
+    """
+    stats = {"path": path, "kind": kind, "bytes": 0, "lines": 0, "candidates": 0, "kept": 0, "bad_lines": 0}
+    batch = []
+    for records, counts in _parsed_blocks(path, kind, dump_filter, pool, max_in_flight):
+        for key, value in counts.items():
+            stats[key] += value
+        batch.extend(records)
+        while len(batch) >= batch_size:
+            sink.put((kind, batch[:batch_size]))
+            stats["kept"] += batch_size
+            batch = batch[batch_size:]
+    if batch:
+        sink.put((kind, batch))
+        stats["kept"] += len(batch)
+    return stats
+
+
+class _StoreWriter:
+    """
+    Writes record batches to the SQLite store, remembering the ids of the posts written and of
+    the posts comments were written for: the posts whose enrichment this ingest changed.
+    """
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+        self.post_ids = set()
+
+    def put(self, item):
+        kind, records = item
+        if kind == "posts":
+            self.store.upsert_posts(records, batch_size=len(records))
+            self.post_ids.update(p.post_id for p in records)
+        else:
+            self.store.upsert_comments(records, batch_size=len(records))
+            self.post_ids.update(c.post_id for c in records)
+
+
+def _ingest_files(paths, kind, dump_filter, writer: _StoreWriter, workers, batch_size) -> list[dict]:
+    """
+    Ingests dumps of one kind, one file after another. Each file is decompressed on this process
+    while its blocks are pre-filtered and JSON-decoded on a pool of `workers` processes; records
+    come back here in file order for the single SQLite writer. At most 2 x `workers` blocks are in
+    flight, so reading pauses while parsing or writing catches up.
+    """
+    if workers <= 1:
+        return [ingest_file(path, kind, dump_filter, writer, batch_size) for path in paths]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dump_filter,)) as pool:
+        return [ingest_file(path, kind, dump_filter, writer, batch_size, pool, 2 * workers) for path in paths]
+
+
+def ingest_dumps(paths, db_path=config.DB_PATH, subreddits=config.SUBREDDITS, min_score=config.MIN_SCORE,
+                 min_comments=config.MIN_COMMENTS, start=None, end=None, workers=config.ARCHIVE_WORKERS,
+                 batch_size=config.ARCHIVE_BATCH_SIZE) -> tuple[dict, set]:
+    """
+    Backfills the SQLite store from Reddit dump files (zstd-compressed or plain NDJSON).
+
+    Submission dumps are ingested first, so comments can be limited to posts that passed the
+    filters or were already stored. Records are mapped to `Post`/`Comment` with `clean_text`
+    and upserted in batches of `batch_size`. Returns the counts per kind and the ids of the
+    posts written or given new comments, which are the only ones to re-enrich.
+    """
+    collection_date = datetime.utcnow().isoformat()
+    kinds = {path: dump_kind(path) for path in paths}
+    totals = {}
+    with SQLiteStore(db_path) as store:
+        stored = {row[0] for row in store.conn.execute("SELECT post_id FROM posts")}
+        writer = _StoreWriter(store)
+        for kind in ("posts", "comments"):
+            files = sorted(p for p in paths if kinds[p] == kind)
+            if not files:
+                continue
+            dump_filter = DumpFilter(subreddits, min_score, min_comments, start, end,
+                                     post_ids=stored | writer.post_ids if kind == "comments" else None,
+                                     collection_date=collection_date)
+            logger.info("Ingesting %d %s dump(s) with %d parser process(es)...", len(files), kind, workers)
+            started = time.perf_counter()
+            try:
+                with metrics.stage(kind) as stage:
+                    stats = _ingest_files(files, kind, dump_filter, writer, workers, batch_size)
+                    stage.items(lines=sum(s["lines"] for s in stats), **{kind: sum(s["kept"] for s in stats)})
+            except Exception as e:
+                logger.error("Error ingesting %s dumps: %s", kind, str(e))
+                raise
+            elapsed = time.perf_counter() - started
+            for s in stats:
+                logger.info("%s: %d lines, %d candidates, %d kept, %d malformed", s["path"], s["lines"],
+                            s["candidates"], s["kept"], s["bad_lines"])
+            total = {k: sum(s[k] for s in stats) for k in ("bytes", "lines", "candidates", "kept", "bad_lines")}
+            logger.info("Ingested %d %s from %d lines in %.1fs (%.1f MB/s decompressed)", total["kept"], kind,
+                        total["lines"], elapsed, total["bytes"] / 2**20 / max(elapsed, 1e-9))
+            totals[kind] = total
+    return totals, writer.post_ids
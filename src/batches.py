@@ -0,0 +1,146 @@
+import ast
+import json
+from dataclasses import fields, is_dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.models import Post, Comment
+
+POST_COLUMNS = [f.name for f in fields(Post)]
+COMMENT_COLUMNS = [f.name for f in fields(Comment)]
+
+# Column types shared by every batch; columns not listed are kept as they are
+CATEGORY_COLUMNS = {"subreddit", "author"}
+TIME_COLUMNS = {"created_utc", "collection_date"}
+LIST_COLUMNS = {"tags", "top_comments"}
+INT_COLUMNS = {"score", "num_comments"}
+LABEL_COLUMNS = {"cluster_labels"}
+
+
+def as_list(value) -> list:
+    """
+    Decodes a list cell: a list/tuple/array, a JSON or Python literal list as stored by older
+    runs (e.g. "['a', 'b']"), a single bare value, or nothing.
+    """
+    if isinstance(value, list):
+        return value
+    if isinstance(value, (tuple, np.ndarray)):
+        return list(value)
+    if isinstance(value, str):
+        if not value.startswith("["):
+            return [value] if value else []
+        try:
+            return json.loads(value)
+        except ValueError:
+            return list(ast.literal_eval(value))
+    return []
+
+
+def _from_records(records) -> pd.DataFrame:
+    """
+    Builds a frame column by column from Post/Comment dataclasses (or dicts), without per-row dicts.
+    """
+    records = list(records)
+    if not records:
+        return pd.DataFrame()
+    if is_dataclass(records[0]):
+        names = [f.name for f in fields(records[0])]
+        return pd.DataFrame({name: [getattr(r, name) for r in records] for name in names})
+    return pd.DataFrame.from_records(records)
+
+
+def _labels(series: pd.Series) -> pd.Series:
+    # Unclustered records carry None (or an empty list in older data); they become NaN
+    if series.dtype == object:
+        series = series.map(lambda v: None if isinstance(v, (list, tuple)) else v)
+    labels = pd.to_numeric(series, errors="coerce")
+    return labels.astype(np.int64) if labels.notna().all() else labels.astype(np.float64)
+
+
+def to_batch(records, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Columnar batch of posts or comments: a DataFrame with `subreddit`/`author` as categoricals
+    (each distinct name stored once), `created_utc`/`collection_date` as datetime64, `tags` and
+    `top_comments` as native Python lists, integer counts and numeric cluster labels (NaN when
+    unclustered). Accepts a list of Post/Comment records or dicts, a DataFrame or an Arrow table;
+    columns already in the right type are not converted again. `columns` selects (and adds missing) columns.
+    """
+    if records is None:
+        frame = pd.DataFrame()
+    elif isinstance(records, pd.DataFrame):
+        frame = records.copy(deep=False)
+    elif hasattr(records, "to_pandas"):
+        frame = from_arrow(records)
+    else:
+        frame = _from_records(records)
+    if columns is not None:
+        frame = frame.reindex(columns=columns)
+    n = len(frame)
+    if n == 0:
+        frame = frame.astype(object)  # empty columns would otherwise come out as float64
+
+    for column in frame.columns:
+        series = frame[column]
+        if column in CATEGORY_COLUMNS and not isinstance(series.dtype, pd.CategoricalDtype):
+            frame[column] = series.astype(object).fillna("").astype(str).astype("category")
+        elif column in TIME_COLUMNS and not pd.api.types.is_datetime64_any_dtype(series):
+            frame[column] = pd.to_datetime(series, format="ISO8601")
+        elif column in LIST_COLUMNS and not (n and all(type(v) is list for v in series)):
+            frame[column] = pd.Series([as_list(v) for v in series], index=frame.index, dtype=object)
+        elif column in INT_COLUMNS and series.dtype != np.int64:
+            frame[column] = pd.to_numeric(series, errors="coerce").fillna(0).astype(np.int64)
+        elif column in LABEL_COLUMNS and not pd.api.types.is_numeric_dtype(series):
+            frame[column] = _labels(series)
+    return frame
+
+
+def posts_batch(records) -> pd.DataFrame:
+    return to_batch(records, POST_COLUMNS)
+
+
+def comments_batch(records) -> pd.DataFrame:
+    return to_batch(records, COMMENT_COLUMNS)
+
+
+def arrow_schema(columns: list[str]):
+    """
+    Arrow types of batch columns: dictionary-encoded names, nanosecond timestamps (the pandas
+    resolution, so conversion does not copy), list<string> lists and int64 counts and labels.
+    """
+    import pyarrow as pa
+
+    def arrow_type(column):
+        if column in CATEGORY_COLUMNS:
+            return pa.dictionary(pa.int32(), pa.string())
+        if column in TIME_COLUMNS:
+            return pa.timestamp("ns")
+        if column in LIST_COLUMNS:
+            return pa.list_(pa.string())
+        if column in INT_COLUMNS or column in LABEL_COLUMNS:
+            return pa.int64()
+        return pa.string()
+
+    return pa.schema([(c, arrow_type(c)) for c in columns])
+
+
+def to_arrow(batch: pd.DataFrame):
+    """
+    Arrow table of a batch; categoricals become dictionary arrays and timestamps are not copied.
+    """
+    import pyarrow as pa
+
+    batch = to_batch(batch)
+    return pa.Table.from_pandas(batch, schema=arrow_schema(list(batch.columns)), preserve_index=False)
+
+
+def from_arrow(table) -> pd.DataFrame:
+    """
+    Batch from an Arrow table. Numeric and timestamp columns without nulls are handed to pandas
+    without copying and the table's buffers are released column by column (`self_destruct`), so
+    peak memory stays near one copy; dictionary columns map to categoricals.
+    """
+    frame = table.to_pandas(split_blocks=True, self_destruct=True)
+    for column in LIST_COLUMNS & set(frame.columns):
+        frame[column] = pd.Series([as_list(v) for v in frame[column]], index=frame.index, dtype=object)
+    return frame
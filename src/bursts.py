@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import poisson
+
+from src import config
+from src.logger import setup_logger
+
+logger = setup_logger("Bursts")
+
+BURST_COLUMNS = ["group", "window", "start", "end", "count", "expected", "score"]
+
+
+def _baseline_rates(groups: np.ndarray, subreddits: np.ndarray, times: np.ndarray, min_span: float) -> np.ndarray:
+    """
+    Expected events per second for each group: its post count in every subreddit spread evenly
+    over that subreddit's observed time span, summed over subreddits.
+    """
+    frame = pd.DataFrame({"group": groups, "subreddit": subreddits, "t": times})
+    span = frame.groupby("subreddit")["t"].agg(lambda t: max(t.max() - t.min(), min_span))
+    per_sub = frame.groupby(["group", "subreddit"]).size().reset_index(name="n")
+    per_sub["rate"] = per_sub["n"] / per_sub["subreddit"].map(span)
+    return per_sub.groupby("group")["rate"].sum()
+
+
+def detect_bursts(df: pd.DataFrame, by: str, windows=config.BURST_WINDOWS, min_events: int = config.BURST_MIN_EVENTS,
+                  max_pvalue: float = config.BURST_MAX_PVALUE, time_col: str = "created_utc") -> pd.DataFrame:
+    """
+    Finds bursts of activity per value of `by` (e.g. cluster or author).
+
+    Events are sorted once by (group, time). For each window size, a single `searchsorted` over
+    group-offset timestamps counts the events of the same group in [t_i, t_i + window) for every
+    event i, in O(N log N) overall. A window is a burst when it holds at least `min_events` and the
+    count is unlikely (Poisson p-value <= `max_pvalue`) under the group's per-subreddit baseline rate.
+    Overlapping burst windows of a group are merged into intervals.
+
+    Returns one row per interval: group, window (seconds), start, end, count (largest window count),
+    expected (baseline count for the window) and score (-log10 p-value).
+    """
+    frame = df[[by, "subreddit", time_col]].dropna(subset=[by, time_col])
+    if by == "cluster_labels":
+        frame = frame[frame[by] != -1]
+    if len(frame) == 0:
+        return pd.DataFrame(columns=BURST_COLUMNS)
+
+    times = pd.to_datetime(frame[time_col]).astype("int64").to_numpy() // 10**9
+    group_codes, group_values = pd.factorize(frame[by])
+    max_window = max(windows)
+    rates = _baseline_rates(group_codes, frame["subreddit"].astype(object).fillna("").to_numpy(), times, max_window)
+
+    # Offsetting each group's timestamps keeps groups apart in one sorted array
+    t0 = times.min()
+    stride = int(times.max() - t0) + 2 * max_window + 1
+    keys = group_codes.astype(np.int64) * stride + (times - t0)
+    order = np.argsort(keys, kind="stable")
+    keys, groups = keys[order], group_codes[order]
+    positions = np.arange(len(keys))
+    group_rate = rates.reindex(np.arange(len(group_values))).to_numpy()[groups]
+
+    intervals = []
+    for window in windows:
+        end = np.searchsorted(keys, keys + window, side="left")
+        counts = end - positions
+        expected = group_rate * window
+        candidates = counts >= min_events
+        if not candidates.any():
+            continue
+        pvalues = np.ones(len(keys))
+        pvalues[candidates] = poisson.sf(counts[candidates] - 1, expected[candidates])
+        burst = candidates & (pvalues <= max_pvalue)
+        if not burst.any():
+            continue
+
+        starts, stops = keys[burst], keys[end[burst] - 1]
+        # Merge overlapping windows: a new interval begins where the start passes every earlier stop
+        prev_stop = np.maximum.accumulate(stops)
+        new_interval = np.r_[True, starts[1:] > prev_stop[:-1]]
+        interval_id = np.cumsum(new_interval) - 1
+        merged = pd.DataFrame({
+            "interval": interval_id,
+            "group_code": groups[burst],
+            "start": starts, "stop": stops,
+            "count": counts[burst], "expected": expected[burst],
+            "score": -np.log10(np.maximum(pvalues[burst], 1e-300)),
+        }).groupby("interval").agg(
+            group_code=("group_code", "first"), start=("start", "min"), stop=("stop", "max"),
+            count=("count", "max"), expected=("expected", "first"), score=("score", "max"),
+        )
+        offset = merged["group_code"].to_numpy().astype(np.int64) * stride - t0
+        intervals.append(pd.DataFrame({
+            "group": group_values[merged["group_code"].to_numpy()],
+            "window": window,
+            "start": pd.to_datetime(merged["start"].to_numpy() - offset, unit="s"),
+            "end": pd.to_datetime(merged["stop"].to_numpy() - offset, unit="s"),
+            "count": merged["count"].to_numpy(),
+            "expected": merged["expected"].to_numpy(),
+            "score": merged["score"].to_numpy(),
+        }))
+
+    if not intervals:
+        return pd.DataFrame(columns=BURST_COLUMNS)
+    bursts = pd.concat(intervals, ignore_index=True).sort_values("score", ascending=False, ignore_index=True)
+    logger.info("Found %d burst intervals across %d %s values", len(bursts), bursts["group"].nunique(), by)
+    return bursts
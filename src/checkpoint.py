@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from src.logger import setup_logger
+from src.storage import SQLiteStore, append_jsonl, append_csv
+
+logger = setup_logger("Checkpoint")
+
+
+class ScrapeCheckpoint:
+    """
+    Persists scraping progress in the SQLite DB so recurring and interrupted runs only fetch the delta.
+
+    - `scrape_state`: per-subreddit high-water mark (newest `created_utc` collected from the "new" listing).
+    - `seen_posts`: every post already evaluated, with the `score`/`num_comments` it had.
+    - `seen_comments`: every comment already stored.
+
+    Posts and comments are written to the `posts`/`comments` tables in the same flush
+    that marks them as seen, so a crash never records a post whose data was lost. New comments
+    are also appended to every file in `comment_paths` (`.jsonl` or `.csv`) at each flush, so
+    collected comments never pile up in memory.
+    """
+    def __init__(self, db_path="data/reddit_data.db", comment_paths=()):
+        self.db_path = db_path
+        self.comment_paths = list(comment_paths)
+        self.store = SQLiteStore(db_path)
+        self.conn = self.store.conn
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS scrape_state (
+                subreddit TEXT PRIMARY KEY,
+                high_water_utc TEXT,
+                last_run TEXT
+            );
+            CREATE TABLE IF NOT EXISTS seen_posts (
+                post_id TEXT PRIMARY KEY,
+                subreddit TEXT,
+                score INTEGER,
+                num_comments INTEGER,
+                last_seen TEXT
+            );
+            CREATE TABLE IF NOT EXISTS seen_comments (
+                comment_id TEXT PRIMARY KEY,
+                post_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_seen_comments_post ON seen_comments(post_id);
+        """)
+        self.seen_posts = {
+            post_id: (score, num_comments)
+            for post_id, score, num_comments in self.conn.execute("SELECT post_id, score, num_comments FROM seen_posts")
+        }
+        self.high_water = dict(self.conn.execute("SELECT subreddit, high_water_utc FROM scrape_state"))
+        logger.info("Loaded checkpoint: %d seen posts across %d subreddits", len(self.seen_posts), len(self.high_water))
+
+        self._pending_seen = []
+        self._pending_posts = []
+        self._pending_comments = []
+        self._pending_new = []
+
+    def is_unchanged(self, post) -> bool:
+        """
+        True if the submission was already collected and its score and comment count have not moved.
+        """
+        return self.seen_posts.get(post.id) == (post.score, post.num_comments)
+
+    def seen_comment_ids(self, post_id: str) -> set[str]:
+        rows = self.conn.execute("SELECT comment_id FROM seen_comments WHERE post_id = ?", (post_id,))
+        return {r[0] for r in rows}
+
+    def mark_seen(self, post, subreddit_name):
+        """
+        Queues a post that was evaluated but needs no data written (e.g. below thresholds).
+        """
+        self._pending_seen.append((post.id, subreddit_name, post.score, post.num_comments))
+
+    def add(self, post_obj, comments, listing=None):
+        """
+        Queues a collected post and its new comments for the next flush. Only posts from the
+        "new" listing advance the high-water mark: top and hot posts can be newer than posts
+        the new listing has not reached yet.
+        """
+        self._pending_seen.append((post_obj.post_id, post_obj.subreddit, post_obj.score, post_obj.num_comments))
+        self._pending_posts.append(post_obj)
+        self._pending_comments.extend(comments)
+        if listing == "new":
+            self._pending_new.append(post_obj)
+
+    def pending(self) -> int:
+        return len(self._pending_posts)
+
+    def flush(self):
+        """
+        Writes queued posts/comments to the DB, then records them as seen and advances the high-water marks.
+        """
+        if not self._pending_seen:
+            return
+        # Appended before the comments are marked as seen: a crash in between re-collects (and
+        # re-appends) them rather than dropping them from the append-only files
+        if self._pending_comments:
+            for path in self.comment_paths:
+                (append_jsonl if path.endswith(".jsonl") else append_csv)(self._pending_comments, path)
+        self.store.upsert_posts(self._pending_posts)
+        self.store.upsert_comments(self._pending_comments)
+
+        now = datetime.utcnow().isoformat()
+        high_water = dict(self.high_water)
+        for p in self._pending_new:
+            if p.created_utc > high_water.get(p.subreddit, ""):
+                high_water[p.subreddit] = p.created_utc
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO seen_posts VALUES (?, ?, ?, ?, ?)",
+                [(*row, now) for row in self._pending_seen]
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_comments VALUES (?, ?)",
+                [(c.comment_id, c.post_id) for c in self._pending_comments]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scrape_state VALUES (?, ?, ?)",
+                [(sub, hw, now) for sub, hw in high_water.items()]
+            )
+
+        for post_id, _, score, num_comments in self._pending_seen:
+            self.seen_posts[post_id] = (score, num_comments)
+        self.high_water = high_water
+        logger.info("Checkpoint: flushed %d posts and %d comments", len(self._pending_posts), len(self._pending_comments))
+        self._pending_seen, self._pending_posts, self._pending_comments, self._pending_new = [], [], [], []
+
+    def close(self):
+        self.flush()
+        self.store.close()
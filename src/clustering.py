@@ -1,191 +1,363 @@
 import os
-import torch
 import numpy as np
 import traceback
 import json
 import pandas as pd
 
 from sklearn.cluster import HDBSCAN
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 
-from sentence_transformers import SentenceTransformer
+from src import config
+from src import metrics
 from src.logger import setup_logger
-from src.models import Post
+from src.batches import posts_batch, comments_batch
+from src.embedding_store import EmbeddingStore
+from src.pooling import select_top_comments, unique_bodies, pool_post_vectors
+from src.duplicates import duplicate_groups
+from src.narrative_model import NarrativeModel
+from src import reducer
+from src.two_stage import two_stage_hdbscan
+from src.grid_search import grid_search_hdbscan  # noqa: F401 (kept importable from here)
 import src.storage as storage
 
 logger = setup_logger("Analysis-Service")
 
 # Create embeddings directory if it doesn't exist
-emb_dir = "embeddings/"
+emb_dir = config.EMBEDDINGS_DIR + "/"
 if not os.path.isdir(emb_dir):
     os.makedirs(emb_dir)
 
-DEFAULT_EMB_MODEL = "all-mpnet-base-v2"
+DEFAULT_EMB_MODEL = config.EMBEDDING_MODEL
+DUPLICATES_FILE = "duplicate_groups.json"
 
 class Clustering:
-    def __init__(self, posts, comments, embeddings_file):
-        self.posts = posts
-        if isinstance(posts, list):
-            self.posts = pd.DataFrame(posts)
-        else:
-            self.posts = posts
-        self.comments = comments
+    def __init__(self, posts, comments, embeddings_file=None, model: str = DEFAULT_EMB_MODEL, windowed: bool = False):
+        self.posts = posts_batch(posts)
+        # A subreddit/time slice of the corpus: its fit and snapshot must not replace the full-corpus ones
+        self.windowed = windowed
+        self.comments = comments_batch(comments) if comments is not None else None
+        self.model = model
+        self.pooling = config.EMBEDDING_POOLING
+        if self.pooling != "legacy" and (comments is None or len(comments) == 0):
+            logger.warning("No comments available, embedding the stored top_comments text instead of pooling")
+            self.pooling = "legacy"
         self.embeddings_file = embeddings_file
-        if not os.path.exists(self.embeddings_file):
-            self.embeddings = None
+        self._stores = {}
+        self.embedding_store = self._store(model, "posts")
+        self.embeddings = None
+        self.duplicate_groups = []
+        self.scaler = None
+        self.pca = None
+        self.reduced_embeddings = None
+        if embeddings_file:
+            self._import_legacy_embeddings(embeddings_file)
+
+    def _store(self, model: str, namespace: str) -> EmbeddingStore:
+        if (model, namespace) not in self._stores:
+            self._stores[(model, namespace)] = EmbeddingStore(model=model, namespace=namespace)
+        return self._stores[(model, namespace)]
+
+    def _import_legacy_embeddings(self, embeddings_file: str):
+        """
+        Seeds the embedding store from a single positional `.npy` file, as written by older runs.
+        Those vectors embed the stringified top_comments, so they only serve "legacy" pooling.
+        The file is only trusted when its row count matches the current posts.
+        """
+        path = next((p for p in [embeddings_file, emb_dir + embeddings_file] if os.path.exists(p)), None)
+        if path is None:
+            logger.warning("Legacy embeddings file %s not found, nothing to import", embeddings_file)
+            return
+        if self.pooling != "legacy":
+            raise ValueError(
+                f"{path} holds legacy vectors (the embedded top_comments text), which only EMBEDDING_POOLING = "
+                f"'legacy' reads, but posts are pooled with '{self.pooling}'. Set EMBEDDING_POOLING = 'legacy' "
+                f"to cluster with it, or leave out the embeddings file."
+            )
+        legacy = np.load(path, mmap_mode="r")
+        if legacy.shape[0] != len(self.posts):
+            logger.warning(
+                "Ignoring %s: it has %d rows but there are %d posts, so rows cannot be matched to posts",
+                path, legacy.shape[0], len(self.posts)
+            )
+            return
+
+        ids = self.posts["post_id"].astype(str).tolist()
+        hashes, found = self.embedding_store.lookup(ids, self.posts["top_comments"].astype(str))
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            self.embedding_store.add([ids[i] for i in missing], [hashes[i] for i in missing], legacy[missing])
+            logger.info("Imported %d embeddings from %s into the embedding store", len(missing), path)
+
+    def _choose_mode(self, mode: str | None, model: NarrativeModel | None) -> str:
+        """
+        'assign' places new posts into the persisted narratives; 'refit' re-runs the full clustering.
+        'auto' refits when there is no model yet or it is older than CLUSTER_REFIT_DAYS.
+        """
+        mode = mode or config.CLUSTER_MODE
+        if model is None:
+            if mode == "assign":
+                logger.warning("No narrative model at %s yet, running a full refit", config.CLUSTER_MODEL_PATH)
+            return "refit"
+        if model.pooling != self.pooling:
+            logger.info("Narrative model was fit on '%s' vectors, now '%s': running a full refit", model.pooling, self.pooling)
+            return "refit"
+        if mode == "auto":
+            if model.age_days() >= config.CLUSTER_REFIT_DAYS:
+                logger.info("Narrative model is %.1f days old, scheduling a full refit", model.age_days())
+                return "refit"
+            return "assign"
+        return mode
+
+    def _existing_labels(self) -> pd.Series:
+        """
+        Cluster labels already assigned to posts; NaN for posts that have never been clustered.
+        """
+        if "cluster_labels" not in self.posts.columns:
+            return pd.Series(np.nan, index=self.posts.index)
+        return self.posts["cluster_labels"].astype(float)
+
+    def assign_new_posts(self, model: NarrativeModel):
+        """
+        Assigns only the posts without a label to the persisted narratives. Returns the full label
+        array, or None when the share of new posts falling into noise calls for a refit.
+        """
+        existing = self._existing_labels()
+        new_mask = existing.isna().to_numpy()
+        new_posts = self.posts[new_mask]
+        logger.info("Assigning %d new posts to %d existing narratives...", len(new_posts), len(model.cluster_ids))
+        if len(new_posts) == 0:
+            return existing.astype(int).to_numpy(), new_mask
+
+        with metrics.stage("embed") as stage:
+            self.embeddings = self.post_embeddings(new_posts)
+            stage.items(posts=len(new_posts))
+        new_labels = model.assign(self.embeddings)
+        noise_ratio = float((new_labels == -1).mean())
+        if noise_ratio > config.CLUSTER_REFIT_NOISE_RATIO:
+            logger.info("%.0f%% of new posts fell into noise (threshold %.0f%%), refitting",
+                        100 * noise_ratio, 100 * config.CLUSTER_REFIT_NOISE_RATIO)
+            return None, new_mask
+
+        labels = existing.fillna(-1).astype(int).to_numpy()
+        labels[new_mask] = new_labels
+        logger.info("Assigned %d new posts (%.0f%% noise)", len(new_posts), 100 * noise_ratio)
+        return labels, new_mask
+
+    def refit(self, previous: NarrativeModel | None = None) -> np.ndarray:
+        """
+        Full clustering over every post. The fitted scaler, PCA and cluster prototypes are persisted,
+        and cluster ids are aligned with the previous model's so narratives keep their ids. A fit on
+        a windowed slice is not persisted.
+        """
+        with metrics.stage("embed") as stage:
+            self.embeddings = self.post_embeddings(self.posts)
+            stage.items(posts=len(self.posts))
+        labels = self.create_hdbscan_clusters(self.embeddings)
+        model = NarrativeModel.from_fit(self.scaler, self.pca, self.reduced_embeddings, labels)
+        model.pooling = self.pooling
+        if previous is not None:
+            labels = previous.align_labels(model, labels)
+        if self.windowed:
+            logger.info("Clustered a windowed slice, keeping the saved narrative model")
         else:
-            self.embeddings = np.load(self.embeddings_file) if os.path.exists(self.embeddings_file) else None
+            model.save(config.CLUSTER_MODEL_PATH)
+        return labels
 
-    def _run(self):
+    def _run(self, mode: str | None = None):
         logger.info("Starting clustering...")
-        if self.embeddings is None:
-            self.embeddings = self.create_embeddings(self.posts["top_comments"], save_path=self.embeddings_file)
-        
-        hdbscan_clusters = self.create_hdbscan_clusters(self.embeddings)
-        self.posts['cluster_labels'] = hdbscan_clusters
-        self.posts = [
-            Post(**{**row, "cluster_labels": row["cluster_labels"]})
-            for row in self.posts.to_dict(orient="records")
-        ]
-        logger.info("Clustering completed. Saving results...")
-        # Save posts with clusters
-        storage.save_csv(self.posts)
-        storage.save_json(self.posts)
-        storage.save_sqlite(self.posts)
+        model = NarrativeModel.load(config.CLUSTER_MODEL_PATH)
+        mode = self._choose_mode(mode, model)
+
+        existing = self._existing_labels().to_numpy(dtype=float)
+        labels = None
+        if mode == "assign":
+            labels, _ = self.assign_new_posts(model)
+        if labels is None:
+            labels = self.refit(previous=model)
+        # Only posts whose label actually moved are written back
+        changed = np.isnan(existing) | (existing != labels)
+
+        self.posts['cluster_labels'] = labels
+        if config.DETECT_DUPLICATES:
+            with metrics.stage("duplicates"):
+                self.duplicate_groups = self.detect_near_duplicates()
+        # Edited posts leave their old vectors behind; drop them once they make up a large share
+        for store in self._stores.values():
+            store.compact_if_needed()
+        if not changed.any():
+            logger.info("Clustering completed. No cluster labels changed, nothing to save.")
+            return
+        logger.info("Clustering completed. Saving results for %d changed posts...", int(changed.sum()))
+        # Save posts with clusters as a columnar snapshot instead of re-serializing CSV and JSON.
+        # The snapshot holds the full corpus, so a windowed slice only updates the DB rows.
+        if not self.windowed:
+            storage.write_columnar(self.posts, f"{config.DATA_SAVE_DIR}/{storage.POSTS_FILE}.parquet")
+        with storage.SQLiteStore(config.DB_PATH) as store:
+            # Posts loaded from a snapshot are not in the DB yet, and the DB is what later runs load
+            store.upsert_posts(self.posts.drop(columns="cluster_labels"))
+            store.save_cluster_assignments(
+                self.posts["post_id"][changed].tolist(), self.posts["cluster_labels"][changed].tolist()
+            )
 
         logger.info("Clustering completed.")
 
-    def create_embeddings(self, text_to_embed: str | list[str], save_path: str = "reddit_posts_mpnet", model: str = DEFAULT_EMB_MODEL, overwrite: bool = False):
+    def post_embeddings(self, posts: pd.DataFrame) -> np.ndarray:
         """
-        This function creates embeddings from 'text_to_embed'.
+        Post vectors for clustering. With EMBEDDING_POOLING = "title_comments", the title/selftext and
+        each distinct top-comment body are embedded once (bodies are cached by text hash, so copypasta
+        and repeated comments are shared across posts) and pooled per post. "legacy" embeds the
+        stringified top_comments list, as older runs did.
+        """
+        if self.pooling == "legacy":
+            return self.create_embeddings(posts["top_comments"].astype(str), post_ids=posts["post_id"], model=self.model)
+
+        titles = (posts["title"].fillna("") + " " + posts["selftext"].fillna("")).str.strip()
+        title_vectors = self.create_embeddings(titles, post_ids=posts["post_id"], model=self.model, namespace="post_text")
+
+        comments = self.comments
+        comments = comments[comments["post_id"].isin(set(posts["post_id"]))]
+        top = select_top_comments(comments, n=config.POOLING_TOP_COMMENTS)
+        hashes, bodies = unique_bodies(top)
+        logger.info("Pooling %d top comments (%d distinct bodies) into %d post vectors", len(top), len(bodies), len(posts))
+        body_vectors = self.create_embeddings(bodies["body"], post_ids=bodies["text_hash"], model=self.model, namespace="comment_bodies")
+        return pool_post_vectors(
+            posts["post_id"], title_vectors, top, hashes, bodies["text_hash"].tolist(), body_vectors,
+            title_weight=config.POOLING_TITLE_WEIGHT
+        )
+
+    def create_embeddings(self, text_to_embed: str | list[str], post_ids: list[str] = None, model: str = DEFAULT_EMB_MODEL, overwrite: bool = False, namespace: str = "posts"):
+        """
+        This function creates embeddings from 'text_to_embed', aligned with 'post_ids'.
+        Embeddings are cached per (post_id, text hash, model) in the 'namespace' store, so only new or changed texts are encoded.
         """
         logger.info("Starting the embedding creation...")
-        output_path = emb_dir+save_path
+        if isinstance(text_to_embed, str):
+            text_to_embed = [text_to_embed]
+        text_to_embed = list(text_to_embed)
+        if post_ids is None:
+            # Without ids the text itself is the key, which still lets unchanged texts be reused
+            post_ids = [f"text:{i}" for i in range(len(text_to_embed))]
 
-        if not os.path.isdir(output_path) or overwrite is True:
-            try:
-                device = "cuda" if torch.cuda.is_available() else "cpu"
-                loaded_model = SentenceTransformer(
-                        model,
-                        device=device
-                    )
-                
-                embeddings = loaded_model.encode(text_to_embed, show_progress_bar=True)
-                np.save(output_path, embeddings)
-                
-                logger.info("Embeddings created and saved in %s", save_path)
-                return embeddings
+        store = self._store(model, namespace)
 
-            except Exception as e:
-                logger.error("Error creating embeddings: %s", str(e))
-                logger.error(traceback.format_exc())
+        def encode(texts):
+            # Imported on first use, so runs served from the store (and the benchmarks) never load torch.
+            # The embedder keeps the model loaded across calls and namespaces.
+            from src.embedder import get_embedder
+            return get_embedder(model).encode(texts)
 
-        logger.info("Embeddings file already exists and overwrite is set to False. Skipping embeddings creation...")
-        return 
+        try:
+            embeddings = store.get_or_create(post_ids, text_to_embed, encode, overwrite=overwrite)
+            logger.info("Embeddings ready for %d items (store: %s)", len(embeddings), store.store_dir)
+            return embeddings
+        except Exception as e:
+            logger.error("Error creating embeddings: %s", str(e))
+            logger.error(traceback.format_exc())
+            return None
 
-    def reduce_embeddings_dimensionality(self, embeddings: np.ndarray, n_components: int = 50):
+    def detect_near_duplicates(self, threshold: float = None, include_comments: bool = None, save_path: str = None):
         """
-        This function reduces the dimensionality of embeddings using PCA.
+        Finds near-identical posts (title + selftext) and comments posted by different authors.
+        Texts are embedded through the cached stores, so only new items are encoded.
         """
-        logger.info("Reducing embeddings dimensionality...")
+        threshold = config.DUPLICATE_THRESHOLD if threshold is None else threshold
+        include_comments = config.DUPLICATE_INCLUDE_COMMENTS if include_comments is None else include_comments
+        save_path = save_path or f"{config.DATA_SAVE_DIR}/{DUPLICATES_FILE}"
+        logger.info("Detecting near-duplicate posts%s...", " and comments" if include_comments else "")
+        groups = []
         try:
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(embeddings)
+            posts = pd.DataFrame({
+                "id": self.posts["post_id"].astype(str),
+                "author": self.posts["author"],
+                "subreddit": self.posts["subreddit"],
+                "text": (self.posts["title"].fillna("") + " " + self.posts["selftext"].fillna("")).str.strip(),
+            })
+            posts = posts[posts["text"].str.len() >= config.DUPLICATE_MIN_CHARS]
+            vectors = self.create_embeddings(posts["text"], post_ids=posts["id"], model=self.model, namespace="post_text")
+            if vectors is None:
+                logger.error("No post embeddings, skipping near-duplicate detection")
+                return groups
+            groups += duplicate_groups(posts, vectors, "post", threshold=threshold)
+
+            if include_comments and self.comments is not None and len(self.comments):
+                comments = pd.DataFrame({
+                    "id": self.comments["comment_id"].astype(str),
+                    "author": self.comments["author"],
+                    "subreddit": self.comments["subreddit"],
+                    "text": self.comments["body"].fillna(""),
+                })
+                comments = comments[
+                    ~comments["text"].isin(["[deleted]", "[removed]", "deleted", "removed"])
+                    & (comments["text"].str.len() >= config.DUPLICATE_MIN_CHARS)
+                ]
+                vectors = self.create_embeddings(comments["text"], post_ids=comments["id"], model=self.model, namespace="comments")
+                if vectors is None:
+                    logger.error("No comment embeddings, keeping only the near-duplicate posts")
+                else:
+                    groups += duplicate_groups(comments, vectors, "comment", threshold=threshold)
 
-            pca = PCA(n_components=n_components)
-            X_reduced = pca.fit_transform(X_scaled)
+            with open(save_path, "w", encoding="utf-8") as f:
+                json.dump(groups, f, indent=2, ensure_ascii=False)
+            logger.info("Saved %d near-duplicate groups to %s", len(groups), save_path)
+        except Exception as e:
+            logger.error("Error detecting near-duplicates: %s", str(e))
+            logger.error(traceback.format_exc())
+        return groups
 
-            logger.info("Embeddings dimensionality reduced to %d components", n_components)
+    def reduce_embeddings_dimensionality(self, embeddings: np.ndarray, n_components: int = config.PCA_COMPONENTS):
+        """
+        Reduces the embeddings with a chunked scaler and incremental PCA, writing the reduced matrix
+        as a memmap. The fitted transform is kept on the instance and persisted with the narrative model.
+        """
+        logger.info("Reducing embeddings dimensionality...")
+        try:
+            scaler, pca = reducer.fit_reducer(embeddings, n_components)
+            X_reduced = reducer.transform(embeddings, scaler, pca, out_path=config.REDUCED_EMBEDDINGS_PATH)
+            # Kept so the fitted reducer is saved with the narrative model and reused for online assignment
+            self.scaler, self.pca, self.reduced_embeddings = scaler, pca, X_reduced
+
+            logger.info("Embeddings dimensionality reduced to %d components", pca.n_components_)
             return X_reduced
 
         except Exception as e:
             logger.error("Error reducing embeddings dimensionality: %s", str(e))
-            logger.error(traceback.format_exec())
+            logger.error(traceback.format_exc())
             return None
 
     def create_hdbscan_clusters(
             self,
             embeddings: np.ndarray,
-            min_cluster_size: int = 10, min_samples: int = 5,
-            metric: str = 'euclidean'
+            min_cluster_size: int = config.HDBSCAN_MIN_CLUSTER_SIZE, min_samples: int = config.HDBSCAN_MIN_SAMPLES,
+            metric: str = 'euclidean', algorithm: str | None = None
         ) -> np.ndarray:
         """
         This function creates HDBSCAN clusters from the embeddings.
-        """        
+        `algorithm` (default config.CLUSTER_ALGORITHM) is "exact" for one HDBSCAN fit over every post,
+        "two_stage" for HDBSCAN over a neighbour graph indexed by mini-batch k-means micro-clusters
+        (see src/two_stage.py), or
+        "auto", which switches to two stages from TWO_STAGE_MIN_POSTS posts.
+        """
         logger.info("Running HDBSCAN clustering...")
         if embeddings is None:
             logger.error("Embeddings not supplied. Cannot run HDBSCAN.")
             return None
         try:
-            reduced_embs = self.reduce_embeddings_dimensionality(embeddings)
-            clusterer = HDBSCAN(
-                min_cluster_size=min_cluster_size,
-                min_samples=min_samples,
-                metric=metric
-            )
-            labels = clusterer.fit_predict(reduced_embs)
+            with metrics.stage("reduce"):
+                reduced_embs = self.reduce_embeddings_dimensionality(embeddings)
+            algorithm = algorithm or config.CLUSTER_ALGORITHM
+            if algorithm == "two_stage" or (algorithm == "auto" and len(reduced_embs) >= config.TWO_STAGE_MIN_POSTS):
+                logger.info("Clustering %d posts in two stages (micro-clusters, then HDBSCAN)", len(reduced_embs))
+                labels = two_stage_hdbscan(reduced_embs, min_cluster_size=min_cluster_size, min_samples=min_samples)
+            else:
+                clusterer = HDBSCAN(
+                    min_cluster_size=min_cluster_size,
+                    min_samples=min_samples,
+                    metric=metric
+                )
+                with metrics.stage("hdbscan") as stage:
+                    labels = clusterer.fit_predict(reduced_embs)
+                    stage.items(posts=len(reduced_embs))
             logger.info("HDBSCAN clustering completed with %d clusters", len(set(labels)) - (1 if -1 in labels else 0))
         except Exception as e:
             logger.error("Error running HDBSCAN: %s", str(e))
 
         return labels
-        
-# Optional: Run grid search for HDBSCAN parameters
-def grid_search_hdbscan(dim_reduced_embeddings: np.ndarray, plot_results: bool = True):
-    """
-    Optionally, you can implement a grid search for HDBSCAN parameters.
-    From experiments, we found that min_cluster_size=10 and min_samples=5 often yield good results.
-    """
-    import seaborn as sns
-    import matplotlib.pyplot as plt
-    import pandas as pd
-
-    logger.info("Starting HDBSCAN grid search...")
-    results = []
-
-    for min_cluster_size in [5, 10, 15, 20]:
-        for min_samples in [None, 5, 10]:
-            clusterer = HDBSCAN(
-                min_cluster_size=min_cluster_size,
-                min_samples=min_samples if min_samples else min_cluster_size,
-                metric='euclidean'
-            )
-            cluster_labels = clusterer.fit_predict(dim_reduced_embeddings)
-
-            # Calculate cluster statistics
-            n_clusters = len(set(cluster_labels)) - (1 if -1 in cluster_labels else 0)
-            n_noise = list(cluster_labels).count(-1)
-            cluster_sizes = pd.Series(cluster_labels).value_counts()
-            largest = cluster_sizes.max()
-            median = cluster_sizes.median()
-            mean = cluster_sizes[cluster_sizes.index != -1].mean()
-
-            results.append({
-                "min_cluster_size": min_cluster_size,
-                "min_samples": min_samples,
-                "n_clusters": n_clusters,
-                "n_noise": n_noise,
-                "largest": largest,
-                "median": median,
-                "mean": mean
-            })
-    with open("hdbscan_results.json", "w") as f:
-        json.dump(results, f, indent=4)
-
-    logger.info("HDBSCAN grid search completed. Results saved to hdbscan_results.json")
-    if plot_results:
-        try:
-            os.makedirs("analysis_results", exist_ok=True)
-
-            df = pd.DataFrame(results)
-            plt.figure(figsize=(12, 6))
-            sns.lineplot(data=df, x="min_cluster_size", y="n_clusters")
-            plt.xlabel('Min Cluster Size')
-            plt.ylabel('Number of Clusters')
-            plt.title("HDBSCAN Clusters Grid Search Results")
-            plt.savefig("analysis_results/hdbscan_clusters_vs_min_cluster_size.png")
-            plt.show()
-        except Exception as e:
-            logger.error("Error occurred while plotting HDBSCAN results: %s", str(e))
-    return results
\ No newline at end of file
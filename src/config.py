@@ -1,12 +1,72 @@
 SUBREDDITS = ["politics", "conspiracy", "worldnews", "Conservative"]
 TOP_POSTS = 50
 HOT_POSTS = 50
+NEW_POSTS = 0
 MIN_SCORE = 10
 MIN_COMMENTS = 10
 MAX_COMMENTS_PER_POST = 50
+CHECKPOINT_EVERY = 25
+SCRAPER_WORKERS = 8
+REQUESTS_PER_MINUTE = 100
+
+ARCHIVE_WORKERS = 4
+ARCHIVE_BATCH_SIZE = 50_000
+ENRICH_CHUNK_SIZE = 10_000
 
 DATA_SAVE_DIR = "data"
 REPORTS_SAVE_DIR = "reports"
 TEMPLATE_DIR = "templates"
+LEXICON_PATH = "lexicons/tags.json"
 
 DB_PATH = "data/reddit_data.db"
+PIPELINE_STATE_PATH = "data/pipeline_state.json"
+PROFILE_STAGES = []  # stage names to run under cProfile, e.g. ["cluster/embed"]
+
+EMBEDDINGS_DIR = "embeddings"
+EMBEDDING_MODEL = "all-mpnet-base-v2"
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_WORKERS = 1
+EMBEDDING_QUANTIZE = False
+EMBEDDING_QUANTIZE_MIN_COSINE = 0.99
+EMBEDDING_POOLING = "title_comments"
+EMBEDDING_COMPACT_DEAD_RATIO = 0.2
+EMBEDDING_MAX_SHARDS = 32
+POOLING_TOP_COMMENTS = 10
+POOLING_TITLE_WEIGHT = 0.5
+
+DETECT_DUPLICATES = True
+DUPLICATE_THRESHOLD = 0.95
+DUPLICATE_MIN_CHARS = 30
+DUPLICATE_INCLUDE_COMMENTS = True
+
+PCA_COMPONENTS = 50
+REDUCE_CHUNK_SIZE = 10_000
+REDUCED_EMBEDDINGS_PATH = "embeddings/reduced_embeddings.npy"
+HDBSCAN_MIN_CLUSTER_SIZE = 10
+HDBSCAN_MIN_SAMPLES = 5
+CLUSTER_ALGORITHM = "auto"
+TWO_STAGE_MIN_POSTS = 200_000
+MICRO_CLUSTERS = 20_000
+MICRO_CLUSTER_POSTS = 10
+MICRO_BATCH_SIZE = 4096
+MICRO_EPOCHS = 3
+TWO_STAGE_NEIGHBORS = 10
+TWO_STAGE_PROBE = 8
+
+CLUSTER_MODE = "auto"
+CLUSTER_MODEL_PATH = "embeddings/narrative_model.joblib"
+CLUSTER_REFIT_DAYS = 7
+CLUSTER_REFIT_NOISE_RATIO = 0.5
+
+KEYWORD_NGRAM_RANGE = (1, 2)
+KEYWORD_MIN_DF = 2
+KEYWORD_VOCAB_PATH = "embeddings/keyword_vocabulary.joblib"
+
+BURST_WINDOWS = (3600, 6 * 3600, 24 * 3600)
+BURST_MIN_EVENTS = 5
+BURST_MAX_PVALUE = 1e-4
+
+COORDINATION_TIME_BUCKET = 600
+COORDINATION_TOP_K = 10
+COORDINATION_MIN_SIMILARITY = 0.5
+COORDINATION_MIN_ACTIVITY = 3
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from src import config
+from src.logger import setup_logger
+
+logger = setup_logger("Coordination")
+
+IGNORED_AUTHORS = {"[deleted]", "None", "AutoModerator", ""}
+
+
+def _events(posts: pd.DataFrame, comments: pd.DataFrame | None, time_bucket: int) -> pd.DataFrame:
+    """
+    One row per (author, feature) activity. Features are the narrative cluster a post belongs to,
+    the thread (post id) written in, and the (subreddit, time bucket) it was written in.
+    """
+    posts = posts[["post_id", "author", "subreddit", "created_utc", "cluster_labels"]] if "cluster_labels" in posts \
+        else posts[["post_id", "author", "subreddit", "created_utc"]].assign(cluster_labels=-1)
+    frames = [posts]
+    if comments is not None and len(comments):
+        cluster_of_post = posts.set_index("post_id")["cluster_labels"]
+        frames.append(comments[["post_id", "author", "subreddit", "created_utc"]].assign(
+            cluster_labels=comments["post_id"].map(cluster_of_post)
+        ))
+    activity = pd.concat(frames, ignore_index=True)
+    activity["author"] = activity["author"].astype(str)
+    activity = activity[~activity["author"].isin(IGNORED_AUTHORS)]
+
+    bucket = pd.to_datetime(activity["created_utc"]).astype("int64") // (10**9 * time_bucket)
+    clusters = activity["cluster_labels"]
+    has_cluster = clusters.notna() & (clusters != -1)
+    features = pd.concat([
+        "cluster:" + clusters[has_cluster].astype(int).astype(str),
+        "thread:" + activity["post_id"].astype(str),
+        "time:" + activity["subreddit"].astype(str) + "@" + bucket.astype(str),
+    ])
+    return pd.DataFrame({"author": activity["author"].reindex(features.index).to_numpy(), "feature": features.to_numpy()})
+
+
+def _top_k(similarity: sparse.csr_matrix, k: int) -> sparse.csr_matrix:
+    """
+    Keeps the k largest entries of every row of a CSR matrix.
+    """
+    rows = np.repeat(np.arange(similarity.shape[0]), np.diff(similarity.indptr))
+    order = np.lexsort((-similarity.data, rows))
+    rank = np.arange(len(order)) - similarity.indptr[rows[order]]
+    keep = order[rank < k]
+    return sparse.csr_matrix((similarity.data[keep], (rows[keep], similarity.indices[keep])), shape=similarity.shape)
+
+
+def coordinated_communities(posts: pd.DataFrame, comments: pd.DataFrame | None = None,
+                            time_bucket: int = config.COORDINATION_TIME_BUCKET, top_k: int = config.COORDINATION_TOP_K,
+                            min_similarity: float = config.COORDINATION_MIN_SIMILARITY,
+                            min_activity: int = config.COORDINATION_MIN_ACTIVITY, min_size: int = 3,
+                            max_feature_authors: int = 1000, chunk_size: int = 5000) -> list[dict]:
+    """
+    Finds groups of authors whose activity overlaps far more than chance would suggest.
+
+    Builds a sparse author x (cluster, thread, time-bucket) incidence matrix, weighted by inverse
+    author frequency so that huge threads and busy hours count little, and L2-normalized per author.
+    Cosine similarities come from sparse products over blocks of `chunk_size` authors, keeping only
+    each author's `top_k` neighbours at or above `min_similarity`. Mutual neighbours are linked and
+    connected components of at least `min_size` authors are reported with their evidence (the
+    features most members share), densest first. Features with more than `max_feature_authors`
+    authors (mega-threads) are dropped: their weight is near zero and they would densify the products.
+    """
+    events = _events(posts, comments, time_bucket).drop_duplicates()
+    activity = events.groupby("author")["feature"].transform("size")
+    events = events[activity >= min_activity]
+    if events["author"].nunique() < min_size:
+        return []
+
+    author_codes, authors = pd.factorize(events["author"])
+    feature_codes, features = pd.factorize(events["feature"])
+    incidence = sparse.csr_matrix(
+        (np.ones(len(events), dtype=np.float32), (author_codes, feature_codes)), shape=(len(authors), len(features))
+    )
+    # Features shared by a single author carry no co-activity signal
+    feature_authors = np.asarray(incidence.sum(axis=0)).ravel()
+    shared = np.flatnonzero((feature_authors >= 2) & (feature_authors <= max_feature_authors))
+    incidence, features, feature_authors = incidence[:, shared], features[shared], feature_authors[shared]
+
+    idf = np.log(len(authors) / feature_authors).astype(np.float32)
+    weighted = incidence @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    weighted = (sparse.diags(1 / np.maximum(norms, 1e-12)) @ weighted).tocsr()
+
+    blocks = []
+    for start in range(0, weighted.shape[0], chunk_size):
+        sims = (weighted[start:start + chunk_size] @ weighted.T).tocsr()
+        sims.setdiag(0, k=start)
+        sims.data[sims.data < min_similarity] = 0
+        sims.eliminate_zeros()
+        blocks.append(_top_k(sims, top_k))
+    knn = sparse.vstack(blocks).tocsr()
+
+    # Mutual top-k links only
+    mutual = knn.minimum(knn.T)
+    n_components, labels = connected_components(mutual, directed=False)
+    sizes = np.bincount(labels, minlength=n_components)
+
+    order = np.argsort(labels, kind="stable")
+    members_of = np.split(order, np.cumsum(sizes)[:-1])
+    communities = []
+    for component in np.flatnonzero(sizes >= min_size):
+        members = members_of[component]
+        sub = mutual[members][:, members]
+        n_edges = sub.nnz / 2
+        member_features = incidence[members]
+        counts = np.asarray(member_features.sum(axis=0)).ravel()
+        evidence = np.argsort(-counts, kind="stable")[:10]
+        communities.append({
+            "authors": authors[members].tolist(),
+            "size": len(members),
+            "density": float(n_edges / (len(members) * (len(members) - 1) / 2)),
+            "mean_similarity": float(sub.data.mean()) if sub.nnz else 0.0,
+            "evidence": [
+                {"feature": features[f], "n_authors": int(counts[f])} for f in evidence if counts[f] >= 2
+            ],
+        })
+    communities.sort(key=lambda c: (c["density"] * c["mean_similarity"], c["size"]), reverse=True)
+    logger.info("Found %d coordinated author communities among %d active authors", len(communities), len(authors))
+    return communities
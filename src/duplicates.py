@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from src.logger import setup_logger
+
+logger = setup_logger("Duplicates")
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    X = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+def _spanning_edges(rows: np.ndarray, cols: np.ndarray):
+    """
+    Replaces the edges of one tile by a star per connected component, so a copypasta
+    group of k items contributes k - 1 edges instead of k^2 / 2.
+    """
+    nodes, inverse = np.unique(np.concatenate([rows, cols]), return_inverse=True)
+    m = len(rows)
+    graph = coo_matrix((np.ones(m, dtype=np.int8), (inverse[:m], inverse[m:])), shape=(len(nodes), len(nodes)))
+    _, labels = connected_components(graph, directed=False)
+    # Link every node to the first node of its component
+    first = np.full(labels.max() + 1, len(nodes))
+    np.minimum.at(first, labels, np.arange(len(nodes)))
+    roots = first[labels]
+    keep = roots != np.arange(len(nodes))
+    return nodes[keep], nodes[roots[keep]]
+
+
+def find_near_duplicates(embeddings: np.ndarray, threshold: float = 0.95, chunk_size: int = 2048) -> np.ndarray:
+    """
+    Groups rows of `embeddings` whose cosine similarity is >= `threshold`.
+
+    Similarities are computed tile by tile (chunk_size x chunk_size, upper triangle only),
+    so memory stays O(chunk_size^2) and the full N x N matrix is never built. Returns a
+    group id per row; rows without any near-duplicate get -1.
+    """
+    X = _normalize(embeddings)
+    n = X.shape[0]
+    src, dst = [], []
+    for i in range(0, n, chunk_size):
+        block = X[i:i + chunk_size]
+        for j in range(i, n, chunk_size):
+            sims = block @ X[j:j + chunk_size].T
+            rows, cols = np.nonzero(sims >= threshold)
+            rows += i
+            cols += j
+            upper = cols > rows
+            if upper.any():
+                r, c = _spanning_edges(rows[upper], cols[upper])
+                src.append(r)
+                dst.append(c)
+
+    labels = np.full(n, -1)
+    if not src:
+        return labels
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+
+    in_pair = np.zeros(n, dtype=bool)
+    in_pair[src] = True
+    in_pair[dst] = True
+    _, labels[in_pair] = np.unique(components[in_pair], return_inverse=True)
+    return labels
+
+
+def duplicate_groups(items: pd.DataFrame, embeddings: np.ndarray, kind: str, threshold: float = 0.95,
+                     min_authors: int = 2, chunk_size: int = 2048) -> list[dict]:
+    """
+    Finds near-identical items and summarizes each group with the authors and subreddits involved.
+
+    `items` needs `id`, `author`, `subreddit` and `text` columns aligned with `embeddings`. Rows
+    whose embedding contains NaN (not embedded yet) are ignored. Only groups spanning at least
+    `min_authors` distinct authors are returned, largest first.
+    """
+    if len(items) == 0:
+        return []
+    embeddings = np.asarray(embeddings)
+    valid = ~np.isnan(embeddings).any(axis=1)
+    items = items[valid].reset_index(drop=True)
+    labels = find_near_duplicates(embeddings[valid], threshold=threshold, chunk_size=chunk_size)
+
+    grouped = items[labels >= 0].assign(group=labels[labels >= 0]).groupby("group")
+    groups = []
+    for _, g in grouped:
+        authors = g["author"].value_counts()
+        authors = authors[authors > 0]  # categorical authors also count the unobserved ones
+        if len(authors) < min_authors:
+            continue
+        groups.append({
+            "kind": kind,
+            "size": len(g),
+            "n_authors": len(authors),
+            "authors": authors.index.tolist(),
+            "subreddits": sorted(g["subreddit"].dropna().unique().tolist()),
+            "ids": g["id"].tolist(),
+            "sample_text": str(g["text"].iloc[0])[:300],
+        })
+    groups.sort(key=lambda d: (d["n_authors"], d["size"]), reverse=True)
+    logger.info("Found %d near-duplicate %s groups across >= %d authors", len(groups), kind, min_authors)
+    return groups
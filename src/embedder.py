@@ -0,0 +1,138 @@
+import time
+import torch
+import numpy as np
+
+from sentence_transformers import SentenceTransformer
+from src import config
+from src import metrics
+from src.logger import setup_logger
+
+logger = setup_logger("Embedder")
+
+# Below this many texts, starting worker processes costs more than it saves
+PARALLEL_MIN_TEXTS = 2_000
+
+_models = {}
+
+
+def _quantize(model):
+    """
+    Dynamic int8 quantization of every Linear layer (CPU only): weights are stored as int8 and
+    activations quantized on the fly, which speeds up transformer inference on commodity CPUs.
+    """
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_model(model: str = config.EMBEDDING_MODEL, quantize: bool = False):
+    """
+    Loads a SentenceTransformer once per process and (model, device, quantize) combination.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    quantize = quantize and device == "cpu"
+    key = (model, device, quantize)
+    if key not in _models:
+        loaded = _models.get((model, device, False)) or SentenceTransformer(model, device=device)
+        _models[(model, device, False)] = loaded
+        _models[key] = _quantize(loaded) if quantize else loaded
+    return _models[key]
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+
+class Embedder:
+    """
+    Throughput-oriented wrapper around SentenceTransformer.encode.
+
+    - The model is loaded once per process and reused across calls.
+    - Texts are length-bucketed (sorted by length, encoded, then restored to input order), so each
+      batch pads to similar lengths; with `workers > 1` large inputs are split across a
+      multi-process encode pool in the same sorted order.
+    - `quantize=True` uses int8 dynamic quantization of the Linear layers on CPU. It is only kept if
+      `check_quantization` finds the vectors close enough (mean cosine >= `min_cosine`) to float32.
+      Dynamically quantized modules are not safe to pickle into worker processes, so an int8 model
+      always encodes in this process and `workers` only applies to the float32 model.
+    - Every call logs sentences/second; the last value is kept in `last_throughput`.
+    """
+    def __init__(self, model: str = config.EMBEDDING_MODEL, batch_size: int = config.EMBEDDING_BATCH_SIZE,
+                 workers: int = config.EMBEDDING_WORKERS, quantize: bool = config.EMBEDDING_QUANTIZE,
+                 min_cosine: float = config.EMBEDDING_QUANTIZE_MIN_COSINE):
+        self.model_name = model
+        self.batch_size = batch_size
+        self.workers = workers
+        self.quantize = quantize
+        self.min_cosine = min_cosine
+        self.quantization_checked = False
+        self.last_throughput = None
+        if quantize and workers > 1:
+            logger.warning("int8 quantization encodes in one process; the %d-worker pool is only used if "
+                           "quantization is rejected", workers)
+
+    def check_quantization(self, texts: list[str], sample_size: int = 256) -> dict:
+        """
+        Encodes a sample with the float32 and int8 models and compares them row by row.
+        Disables quantization if the mean cosine similarity is below `min_cosine`.
+        """
+        sample = list(texts)[:sample_size]
+        baseline = load_model(self.model_name).encode(sample, batch_size=self.batch_size, convert_to_numpy=True)
+        quantized = load_model(self.model_name, quantize=True).encode(sample, batch_size=self.batch_size, convert_to_numpy=True)
+        cosine = _cosine(np.asarray(baseline, dtype=np.float32), np.asarray(quantized, dtype=np.float32))
+        result = {"n": len(sample), "mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min())}
+        self.quantization_checked = True
+        if result["mean_cosine"] < self.min_cosine:
+            logger.warning("int8 embeddings too far from float32 (mean cosine %.4f < %.4f), using float32",
+                           result["mean_cosine"], self.min_cosine)
+            self.quantize = False
+        else:
+            logger.info("int8 embeddings accepted: mean cosine %.4f, min %.4f vs float32 over %d texts",
+                        result["mean_cosine"], result["min_cosine"], result["n"])
+        return result
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        texts = [str(t) for t in texts]
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.quantize and not self.quantization_checked:
+            self.check_quantization(texts)
+        model = load_model(self.model_name, quantize=self.quantize)
+
+        # Length bucketing: encode in length order, then restore the input order
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        ordered = [texts[i] for i in order]
+
+        start = time.perf_counter()
+        if self.workers > 1 and not self.quantize and len(texts) >= PARALLEL_MIN_TEXTS:
+            pool = model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+            try:
+                vectors = model.encode_multi_process(
+                    ordered, pool, batch_size=self.batch_size,
+                    chunk_size=max(self.batch_size, len(texts) // (self.workers * 4))
+                )
+            finally:
+                model.stop_multi_process_pool(pool)
+        else:
+            vectors = model.encode(ordered, batch_size=self.batch_size, show_progress_bar=True, convert_to_numpy=True)
+        elapsed = time.perf_counter() - start
+
+        self.last_throughput = len(texts) / max(elapsed, 1e-9)
+        metrics.count("sentences_embedded", len(texts), elapsed)
+        logger.info("Encoded %d texts in %.1fs (%.1f sentences/s, batch size %d, %d worker(s)%s)",
+                    len(texts), elapsed, self.last_throughput, self.batch_size, 1 if self.quantize else self.workers,
+                    ", int8" if self.quantize else "")
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        result = np.empty_like(vectors)
+        result[order] = vectors
+        return result
+
+
+_embedders = {}
+
+
+def get_embedder(model: str = config.EMBEDDING_MODEL) -> Embedder:
+    if model not in _embedders:
+        _embedders[model] = Embedder(model)
+    return _embedders[model]
@@ -0,0 +1,201 @@
+import os
+import csv
+import hashlib
+import numpy as np
+
+from src import config
+from src.logger import setup_logger
+
+logger = setup_logger("Embedding-Store")
+
+INDEX_FIELDS = ["item_id", "text_hash", "shard", "row"]
+COMPACT_CHUNK_ROWS = 10_000  # rows copied at a time when shards are merged
+
+
+def text_hash(text) -> str:
+    """
+    Returns a stable content hash for the text that was (or will be) embedded.
+    """
+    return hashlib.sha1(str(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Append-only, memory-mapped embedding store keyed by (item_id, text hash, model).
+
+    Vectors live in `.npy` shards under `<root>/<namespace>/<model>/`, one shard per
+    write, and are opened with `mmap_mode="r"` so only the rows that are requested
+    are paged in. `index.csv` maps every (item_id, text_hash) pair to its shard/row.
+    Once a write leaves more than `max_shards` shards, they are merged into one.
+    """
+    def __init__(self, model: str, namespace: str = "posts", root: str = config.EMBEDDINGS_DIR,
+                 max_shards: int = config.EMBEDDING_MAX_SHARDS):
+        self.model = model
+        self.namespace = namespace
+        self.max_shards = max_shards
+        self.store_dir = os.path.join(root, namespace, model.replace("/", "__"))
+        self.index_path = os.path.join(self.store_dir, "index.csv")
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self._index: dict[tuple[str, str], tuple[str, int]] = {}
+        self._shards: dict[str, np.ndarray] = {}
+        self._shard_names: set[str] = set()
+        self._load_index()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                self._index[(row["item_id"], row["text_hash"])] = (row["shard"], int(row["row"]))
+                self._shard_names.add(row["shard"])
+        logger.debug("Loaded %d cached embeddings from %s", len(self._index), self.index_path)
+
+    def _shard(self, name: str) -> np.ndarray:
+        if name not in self._shards:
+            self._shards[name] = np.load(os.path.join(self.store_dir, name), mmap_mode="r")
+        return self._shards[name]
+
+    def _next_shard_name(self) -> str:
+        existing = [int(f[6:-4]) for f in os.listdir(self.store_dir) if f.startswith("shard_") and f.endswith(".npy")]
+        return f"shard_{max(existing, default=-1) + 1:05d}.npy"
+
+    def lookup(self, ids, texts):
+        """
+        Returns the text hashes for `texts` and a boolean mask of which (id, hash) pairs are cached.
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = np.array([(str(i), h) in self._index for i, h in zip(ids, hashes)], dtype=bool)
+        return hashes, found
+
+    def add(self, ids, hashes, vectors: np.ndarray):
+        """
+        Writes `vectors` as a new shard and appends their keys to the index.
+        """
+        if len(ids) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        shard = self._next_shard_name()
+        np.save(os.path.join(self.store_dir, shard), vectors)
+
+        new_index = not os.path.exists(self.index_path)
+        with open(self.index_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_index:
+                writer.writerow(INDEX_FIELDS)
+            for row, (item_id, h) in enumerate(zip(ids, hashes)):
+                writer.writerow([str(item_id), h, shard, row])
+                self._index[(str(item_id), h)] = (shard, row)
+        self._shard_names.add(shard)
+        logger.info("Stored %d new embeddings in %s/%s", len(ids), self.store_dir, shard)
+
+    def fetch(self, ids, hashes) -> np.ndarray:
+        """
+        Gathers cached vectors for (id, hash) pairs, in order. All pairs must be present.
+        """
+        locations = [self._index[(str(i), h)] for i, h in zip(ids, hashes)]
+        if not locations:
+            return np.empty((0, 0), dtype=np.float32)
+        dim = self._shard(locations[0][0]).shape[1]
+        out = np.empty((len(locations), dim), dtype=np.float32)
+
+        # Gather shard by shard so each memmap is read with one fancy-index call
+        by_shard: dict[str, tuple[list[int], list[int]]] = {}
+        for pos, (shard, row) in enumerate(locations):
+            positions, rows = by_shard.setdefault(shard, ([], []))
+            positions.append(pos)
+            rows.append(row)
+        for shard, (positions, rows) in by_shard.items():
+            out[positions] = self._shard(shard)[rows]
+        return out
+
+    def get_or_create(self, ids, texts, encode_fn, overwrite: bool = False) -> np.ndarray:
+        """
+        Returns embeddings aligned with `ids`, encoding only the (id, text) pairs not cached yet.
+        `encode_fn` receives the list of texts to encode and must return an (n, dim) array.
+        """
+        ids = [str(i) for i in ids]
+        texts = list(texts)
+        hashes, found = self.lookup(ids, texts)
+        if overwrite:
+            found[:] = False
+
+        missing = np.flatnonzero(~found)
+        logger.info("Embedding cache: %d hits, %d to encode", int(found.sum()), len(missing))
+        if len(missing):
+            # Identical (id, text) pairs may appear more than once; encode each once
+            pending = {}
+            for i in missing:
+                pending.setdefault((ids[i], hashes[i]), texts[i])
+            vectors = encode_fn(list(pending.values()))
+            keys = list(pending.keys())
+            self.add([k[0] for k in keys], [k[1] for k in keys], vectors)
+
+        embeddings = self.fetch(ids, hashes)
+        if len(self._shard_names) > self.max_shards:
+            logger.info("%s has %d shards (max %d), merging them", self.store_dir, len(self._shard_names), self.max_shards)
+            self.compact()
+        return embeddings
+
+    def dead_rows(self) -> int:
+        """
+        Index entries superseded by a newer text for the same item_id.
+        """
+        return len(self._index) - len({item_id for item_id, _ in self._index})
+
+    def compact_if_needed(self, max_dead_ratio: float = config.EMBEDDING_COMPACT_DEAD_RATIO) -> bool:
+        """
+        Compacts the store once more than `max_dead_ratio` of its rows are superseded or it has
+        more than `max_shards` shards. Returns True if it did.
+        """
+        dead = self.dead_rows()
+        if not self._index or (dead / len(self._index) <= max_dead_ratio and len(self._shard_names) <= self.max_shards):
+            return False
+        logger.info("%d of %d rows in %s are superseded (%d shards), compacting",
+                    dead, len(self._index), self.store_dir, len(self._shard_names))
+        self.compact()
+        return True
+
+    def compact(self, chunk_rows: int = COMPACT_CHUNK_ROWS):
+        """
+        Merges the store into a single shard, keeping only the latest entry per item_id. Rows are
+        copied `chunk_rows` at a time from the old shards' memmaps into a preallocated memmap, so
+        memory stays bounded by one chunk however large the store is.
+        """
+        latest: dict[str, tuple[str, str, int]] = {}
+        for (item_id, h), (shard, row) in self._index.items():
+            latest[item_id] = (h, shard, row)
+        if not latest:
+            return
+
+        # Ordered by shard and row, so each chunk reads few shards, mostly sequentially
+        entries = sorted(latest.items(), key=lambda entry: (entry[1][1], entry[1][2]))
+        ids = [item_id for item_id, _ in entries]
+        hashes = [h for _, (h, _, _) in entries]
+        dim = self._shard(entries[0][1][1]).shape[1]
+        shard = self._next_shard_name()
+        path = os.path.join(self.store_dir, shard)
+        merged = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=np.float32, shape=(len(ids), dim))
+        for start in range(0, len(ids), chunk_rows):
+            stop = start + chunk_rows
+            merged[start:stop] = self.fetch(ids[start:stop], hashes[start:stop])
+        merged.flush()
+        del merged
+        os.replace(path + ".tmp", path)
+
+        with open(self.index_path + ".tmp", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(INDEX_FIELDS)
+            writer.writerows([item_id, h, shard, row] for row, (item_id, h) in enumerate(zip(ids, hashes)))
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+        old_shards = self._shard_names
+        self._shards.clear()
+        self._index = {(item_id, h): (shard, row) for row, (item_id, h) in enumerate(zip(ids, hashes))}
+        self._shard_names = {shard}
+        for name in old_shards:
+            os.remove(os.path.join(self.store_dir, name))
+        logger.info("Compacted embedding store to %d entries in %s", len(ids), shard)
@@ -1,65 +1,111 @@
-import matplotlib.pyplot as plt
 import pandas as pd
 import os
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
 
-from sklearn.feature_extraction.text import CountVectorizer
 from jinja2 import Environment, FileSystemLoader
 from datetime import datetime
 from src.logger import setup_logger
+from src.keywords import KeywordExtractor
+from src.bursts import detect_bursts
+from src.coordination import coordinated_communities
+from src.batches import posts_batch, comments_batch
+from src import metrics
 
 logger = setup_logger("Report-")
 
+# Below this many timelines, rendering in-process beats spawning a pool
+PARALLEL_MIN_PLOTS = 16
+
+
+def _render_timeline(path: str, cluster_id, dates: list, counts: list):
+    """
+    Draws one cluster's posts-per-day bar chart. Uses the object-oriented Figure API
+    (no pyplot global state), so it is safe to run in worker processes.
+    """
+    fig = Figure(figsize=(6, 2))
+    ax = fig.add_subplot()
+    ax.bar(range(len(counts)), counts)
+    ax.set_xticks(range(len(dates)), [str(d) for d in dates], rotation=90)
+    ax.set_title(f"Cluster {cluster_id} Timeline")
+    fig.tight_layout()
+    fig.savefig(path)
+    return path
+
 class ReportGenerator:
-    def __init__(self, posts, template_dir="templates", output_dir="reports"):
+    def __init__(self, posts, template_dir="templates", output_dir="reports", duplicate_groups=None, plot_workers=None, comments=None):
         self.posts = posts
+        self.plot_workers = plot_workers or os.cpu_count() or 1
         self.template_dir = template_dir
         self.output_dir = output_dir+"/"+datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         os.makedirs(self.output_dir, exist_ok=True)
         self.clusters = []
         self.flagged_users = []
+        self.cluster_stats = pd.DataFrame()
+        self.author_bursts = []
+        self.communities = []
+        self.duplicate_groups = duplicate_groups or []
 
-        if isinstance(posts, list):
-            self.posts = pd.DataFrame([p.__dict__ for p in posts])
+        self.posts = posts_batch(posts)
+        self.comments = comments_batch(comments) if comments is not None else None
+
+    def _render_timelines(self, jobs: list[tuple]):
+        if self.plot_workers > 1 and len(jobs) >= PARALLEL_MIN_PLOTS:
+            with ProcessPoolExecutor(max_workers=self.plot_workers) as pool:
+                list(pool.map(_render_timeline, *zip(*jobs)))
         else:
-            self.posts = posts
+            for job in jobs:
+                _render_timeline(*job)
 
     def summarize_clusters(self):
-        clusters = []
+        """
+        Summarizes every cluster from one groupby over the non-noise posts, then renders the
+        timeline plots (in a process pool when there are many clusters).
+        """
         try:
-            for c in sorted(self.posts['cluster_labels'].dropna().unique()):
-                if c == -1:
-                    continue
-                cluster_posts = self.posts[self.posts['cluster_labels'] == c]
-                texts = (cluster_posts['title'].fillna('') + " " + cluster_posts['selftext'].fillna('')).tolist()
-                vec = CountVectorizer(stop_words="english", max_features=10)
-                vec.fit(texts)
-                keywords = vec.get_feature_names_out()
+            posts = self.posts[self.posts['cluster_labels'].notna() & (self.posts['cluster_labels'] != -1)].reset_index(drop=True)
+            grouped = posts.groupby('cluster_labels', sort=True)
+
+            # Per-cluster stats; also used by flag_suspicious
+            author_counts = posts.groupby(['cluster_labels', 'author'], observed=True).size()
+            stats = grouped['created_utc'].agg(['size', 'min', 'max'])
+            stats['max_author_posts'] = author_counts.groupby(level=0).max()
+            self.cluster_stats = stats
+
+            top_authors = (
+                author_counts.sort_values(ascending=False, kind="stable")
+                .groupby(level=0).head(3)
+                .reset_index(level=1)['author']
+                .groupby(level=0).agg(list)
+            )
+            first_titles = grouped['title'].head(5).groupby(posts['cluster_labels']).agg(list)
+            sample_posts = posts['title'].sample(frac=1).groupby(posts['cluster_labels']).head(5)
+            sample_posts = sample_posts.groupby(posts['cluster_labels']).agg(list)
+            daily = posts.groupby(['cluster_labels', posts['created_utc'].dt.date]).size()
+            texts = (posts['title'].fillna('') + " " + posts['selftext'].fillna('')).tolist()
+            cluster_keywords = KeywordExtractor().cluster_keywords(texts, posts['cluster_labels'].to_numpy(), top_n=10)
 
+            clusters, jobs = [], []
+            for c in stats.index:
                 # LLM/Narrative summary (placeholder) TBD
                 # if llm:
-                sample_text = "\n".join(cluster_posts['title'].head(5).tolist())
-
-                top_authors = cluster_posts['author'].value_counts().head(3).index.tolist()
-                sample_posts = cluster_posts['title'].sample(min(5, len(cluster_posts))).tolist()
+                sample_text = "\n".join(first_titles[c])
 
                 timeline_name = f"timeline_cluster_{c}.png"
-                timeline_path = f"{self.output_dir}/{timeline_name}"
-                cluster_posts['created_utc'].dt.date.value_counts().sort_index().plot(kind="bar", figsize=(6,2))
-                plt.title(f"Cluster {c} Timeline")
-                plt.tight_layout()
-                plt.savefig(timeline_path)
-                plt.close()
+                counts = daily.loc[c]
+                jobs.append((f"{self.output_dir}/{timeline_name}", c, counts.index.tolist(), counts.tolist()))
 
                 clusters.append({
                     "id": c,
-                    "keywords": keywords,
+                    "keywords": cluster_keywords.get(c, []),
                     "sample_text": sample_text,
-                    "size": len(cluster_posts),
-                    "top_authors": top_authors,
-                    "sample_posts": sample_posts,
+                    "size": int(stats.at[c, 'size']),
+                    "top_authors": top_authors[c],
+                    "sample_posts": sample_posts[c],
                     "timeline_plot": timeline_name,
                     "flagged": False,
                 })
+            self._render_timelines(jobs)
             self.clusters = clusters
         except TypeError as e:
             logger.error(f"Error summarizing clusters: {str(e)}")
@@ -71,22 +117,28 @@ class ReportGenerator:
 
     # TODO: Expand this with more sophisticated heuristics
     def flag_suspicious(self):
-        # Cluster-level flags
+        # Cluster-level flags: sliding-window bursts, plus the author overlap from summarize_clusters
+        try:
+            cluster_bursts = detect_bursts(self.posts, "cluster_labels")
+            authors = self.posts[~self.posts["author"].isin(["[deleted]", "None"])]
+            self.author_bursts = detect_bursts(authors, "author").head(20).to_dict(orient="records")
+        except Exception as e:
+            logger.error(f"Error detecting bursts: {str(e)}")
+            cluster_bursts = pd.DataFrame(columns=["group"])
+
+        high_overlap = self.cluster_stats['max_author_posts'] > 4 if len(self.cluster_stats) else pd.Series(dtype=bool)  # Flag if one author posted more than 4 times in the cluster
+        bursts_by_cluster = {c: g.head(3).to_dict(orient="records") for c, g in cluster_bursts.groupby("group", sort=False)}
         for cluster in self.clusters:
-            cluster_posts = self.posts[self.posts['cluster_labels'] == cluster["id"]]
-            author_counts = cluster_posts["author"].value_counts()
-            burst = (cluster_posts['created_utc'].max() - cluster_posts['created_utc'].min()).total_seconds() < 3600 # 1 hour burst
-            high_overlap = (author_counts > 4).sum() > 0 # Flag if more than 4 authors in a short time span
-            if burst or high_overlap:
-                cluster["flagged"] = True
+            cluster["bursts"] = bursts_by_cluster.get(cluster["id"], [])
+            cluster["flagged"] = bool(cluster["bursts"]) or bool(high_overlap.get(cluster["id"], False))
 
         try:
-            # User-level flags
-            user_clusters = self.posts.groupby("author")["cluster_labels"].nunique()
-            self.flagged_users = user_clusters[user_clusters > 1].index.tolist()
-        except AttributeError as e:
+            # User-level flags: communities of authors with strongly overlapping activity
+            self.communities = coordinated_communities(self.posts, self.comments)[:20]
+            self.flagged_users = sorted({a for c in self.communities for a in c["authors"]})
+        except KeyError as e:
             logger.error(f"Error flagging suspicious users: {str(e)}")
-            logger.error("Ensure 'cluster_labels' column exists and is not empty")
+            logger.error("Ensure posts and comments have post_id, author, subreddit and created_utc columns")
             self.flagged_users = []
         except Exception as e:
             logger.error(f"Unexpected error flagging users: {str(e)}")
@@ -98,14 +150,20 @@ class ReportGenerator:
         html = template.render(
             clusters=self.clusters,
             flagged_users=self.flagged_users,
-            total_posts=len(self.posts)
+            communities=self.communities,
+            author_bursts=self.author_bursts,
+            duplicate_groups=self.duplicate_groups,
+            total_posts=len(self.posts),
+            run_metrics=metrics.get_metrics().summary()
         )
         with open(f"{self.output_dir}/report.html", "w", encoding="utf-8") as f:
             f.write(html)
         print(f"✅ Report generated at {self.output_dir}/report.html")
 
     def run(self):
-        self.summarize_clusters()
-        self.flag_suspicious()
+        with metrics.stage("summarize"):
+            self.summarize_clusters()
+        with metrics.stage("flags"):
+            self.flag_suspicious()
         self.render_html()
 
@@ -0,0 +1,151 @@
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from sklearn.cluster import HDBSCAN
+from sklearn.metrics import silhouette_score, davies_bouldin_score, calinski_harabasz_score
+
+from src.logger import setup_logger
+
+logger = setup_logger("Grid-Search")
+
+DEFAULT_PARAM_GRID = {
+    "min_cluster_size": [5, 10, 15, 20],
+    "min_samples": [None, 5, 10],
+}
+
+try:
+    # Private in scikit-learn, but it lets one fitted tree be cut at several min_cluster_size values
+    from sklearn.cluster._hdbscan._tree import tree_to_labels
+except ImportError:  # pragma: no cover - depends on the installed scikit-learn
+    tree_to_labels = None
+
+
+def _cluster_quality(X: np.ndarray, labels: np.ndarray, sample_size: int, seed: int = 0) -> dict:
+    """
+    Internal validity scores over the non-noise points (on a sample for large corpora).
+    DBCV is added when the optional `hdbscan` package is installed.
+    """
+    mask = labels != -1
+    scores = {"silhouette": None, "davies_bouldin": None, "calinski_harabasz": None, "dbcv": None}
+    if len(set(labels[mask])) < 2:
+        return scores
+
+    idx = np.flatnonzero(mask)
+    if len(idx) > sample_size:
+        idx = np.random.default_rng(seed).choice(idx, sample_size, replace=False)
+    Xs, ls = np.asarray(X[idx], dtype=np.float64), labels[idx]
+    if len(set(ls)) < 2:
+        return scores
+
+    scores["silhouette"] = float(silhouette_score(Xs, ls))
+    scores["davies_bouldin"] = float(davies_bouldin_score(Xs, ls))
+    scores["calinski_harabasz"] = float(calinski_harabasz_score(Xs, ls))
+    try:
+        from hdbscan.validity import validity_index
+        scores["dbcv"] = float(validity_index(Xs, ls))
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.debug("DBCV failed: %s", str(e))
+    return scores
+
+
+def _summarize(labels: np.ndarray) -> dict:
+    n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+    cluster_sizes = pd.Series(labels).value_counts()
+    return {
+        "n_clusters": n_clusters,
+        "n_noise": int((labels == -1).sum()),
+        "largest": int(cluster_sizes.max()),
+        "median": float(cluster_sizes.median()),
+        "mean": float(cluster_sizes[cluster_sizes.index != -1].mean()) if n_clusters else None,
+    }
+
+
+def _fit_min_samples(embeddings_path: str, min_samples: int | None, min_cluster_sizes: list[int],
+                     metric: str, score_sample_size: int) -> list[dict]:
+    """
+    Worker: fits HDBSCAN once for a given min_samples and cuts the same single-linkage tree at
+    every min_cluster_size. `min_samples=None` ties min_samples to min_cluster_size, so each
+    size then needs its own tree.
+    """
+    X = np.load(embeddings_path, mmap_mode="r")
+    results = []
+    tree = None
+    for min_cluster_size in sorted(min_cluster_sizes):
+        if tree is None or min_samples is None or tree_to_labels is None:
+            clusterer = HDBSCAN(
+                min_cluster_size=min_cluster_size,
+                min_samples=min_samples if min_samples else min_cluster_size,
+                metric=metric
+            )
+            labels = clusterer.fit_predict(X)
+            tree = clusterer._single_linkage_tree_ if min_samples is not None else None
+        else:
+            labels, _ = tree_to_labels(tree, min_cluster_size)
+        labels = np.asarray(labels)
+
+        results.append({
+            "min_cluster_size": min_cluster_size,
+            "min_samples": min_samples,
+            **_summarize(labels),
+            **_cluster_quality(X, labels, score_sample_size),
+        })
+    return results
+
+
+def grid_search_hdbscan(dim_reduced_embeddings: np.ndarray, plot_results: bool = True, param_grid: dict | None = None,
+                        n_jobs: int | None = None, metric: str = "euclidean", score_sample_size: int = 10_000,
+                        results_path: str = "hdbscan_results.json"):
+    """
+    Grid search over HDBSCAN parameters, run over a process pool.
+    From experiments, we found that min_cluster_size=10 and min_samples=5 often yield good results.
+
+    The reduced embeddings are written once to a memory-mapped `.npy` that every worker opens
+    read-only. Each worker handles one `min_samples` value and reuses its spanning tree for all
+    `min_cluster_size` values. Results include silhouette, Davies-Bouldin and Calinski-Harabasz
+    scores (and DBCV when `hdbscan` is installed).
+    """
+    param_grid = param_grid or DEFAULT_PARAM_GRID
+    min_cluster_sizes = list(param_grid["min_cluster_size"])
+    min_samples_values = list(param_grid.get("min_samples", [None]))
+    logger.info("Starting HDBSCAN grid search over %d combinations...", len(min_cluster_sizes) * len(min_samples_values))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embeddings_path = os.path.join(tmp_dir, "reduced_embeddings.npy")
+        np.save(embeddings_path, np.asarray(dim_reduced_embeddings))
+        with ProcessPoolExecutor(max_workers=n_jobs or min(len(min_samples_values), os.cpu_count() or 1)) as pool:
+            futures = [
+                pool.submit(_fit_min_samples, embeddings_path, ms, min_cluster_sizes, metric, score_sample_size)
+                for ms in min_samples_values
+            ]
+            for future in futures:
+                results.extend(future.result())
+
+    with open(results_path, "w") as f:
+        json.dump(results, f, indent=4)
+
+    logger.info("HDBSCAN grid search completed. Results saved to %s", results_path)
+    if plot_results:
+        try:
+            import seaborn as sns
+            import matplotlib.pyplot as plt
+
+            os.makedirs("analysis_results", exist_ok=True)
+
+            df = pd.DataFrame(results)
+            plt.figure(figsize=(12, 6))
+            sns.lineplot(data=df, x="min_cluster_size", y="n_clusters")
+            plt.xlabel('Min Cluster Size')
+            plt.ylabel('Number of Clusters')
+            plt.title("HDBSCAN Clusters Grid Search Results")
+            plt.savefig("analysis_results/hdbscan_clusters_vs_min_cluster_size.png")
+            plt.show()
+        except Exception as e:
+            logger.error("Error occurred while plotting HDBSCAN results: %s", str(e))
+    return results
@@ -0,0 +1,115 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from src import config
+from src.pipeline import content_hash
+from src.logger import setup_logger
+
+logger = setup_logger("Keywords")
+
+
+class KeywordExtractor:
+    """
+    Class-based TF-IDF (c-TF-IDF) keywords for all clusters at once.
+
+    The corpus is tokenized once into a sparse document-term matrix; a sparse cluster-membership
+    matrix then sums it into one term-count row per cluster. Each term is weighted by its frequency
+    in the cluster times log(1 + average words per cluster / its frequency across all clusters),
+    so words common to every cluster score low and the keywords show what sets a cluster apart.
+
+    The fitted vocabulary is cached at `vocab_path`, keyed on a fingerprint of the corpus and the
+    n-gram/min_df settings, and reused while both are unchanged (e.g. a report re-rendered after a
+    template edit). Any change to the texts rebuilds it, so new terms are never missed; pass
+    `refresh=True` to force a rebuild.
+    """
+    def __init__(self, ngram_range=config.KEYWORD_NGRAM_RANGE, min_df=config.KEYWORD_MIN_DF,
+                 max_features=None, vocab_path: str | None = config.KEYWORD_VOCAB_PATH):
+        self.ngram_range = tuple(ngram_range)
+        self.min_df = min_df
+        self.max_features = max_features
+        self.vocab_path = vocab_path
+        self.vectorizer = None
+
+    def _settings(self) -> dict:
+        return {"ngram_range": self.ngram_range, "min_df": self.min_df, "max_features": self.max_features}
+
+    def _load_vocabulary(self, corpus: str):
+        if not self.vocab_path or not os.path.exists(self.vocab_path):
+            return None
+        try:
+            cached = joblib.load(self.vocab_path)
+        except Exception as e:
+            logger.error("Could not load keyword vocabulary from %s: %s", self.vocab_path, str(e))
+            return None
+        if cached.get("settings") != self._settings():
+            logger.info("Keyword settings changed, rebuilding the vocabulary")
+            return None
+        if cached.get("corpus") != corpus:
+            logger.info("Corpus changed since the keyword vocabulary was built, rebuilding it")
+            return None
+        return cached["vocabulary"]
+
+    def _save_vocabulary(self, corpus: str):
+        if not self.vocab_path:
+            return
+        os.makedirs(os.path.dirname(self.vocab_path) or ".", exist_ok=True)
+        joblib.dump({"settings": self._settings(), "corpus": corpus, "vocabulary": self.vectorizer.vocabulary_},
+                    self.vocab_path)
+
+    def document_term_matrix(self, texts: list[str], refresh: bool = False) -> sparse.csr_matrix:
+        """
+        Tokenizes `texts` once, reusing the cached vocabulary if it was built from the same texts
+        (unless `refresh` is set).
+        """
+        corpus = content_hash(pd.DataFrame({"text": texts}))
+        vocabulary = None if refresh else self._load_vocabulary(corpus)
+        if vocabulary is not None:
+            self.vectorizer = CountVectorizer(stop_words="english", ngram_range=self.ngram_range, vocabulary=vocabulary)
+            return self.vectorizer.transform(texts)
+
+        # min_df only makes sense once there are enough documents for it
+        min_df = self.min_df if len(texts) >= 10 * self.min_df else 1
+        self.vectorizer = CountVectorizer(stop_words="english", ngram_range=self.ngram_range, min_df=min_df,
+                                          max_features=self.max_features)
+        X = self.vectorizer.fit_transform(texts)
+        self._save_vocabulary(corpus)
+        logger.info("Built keyword vocabulary of %d terms", len(self.vectorizer.vocabulary_))
+        return X
+
+    def cluster_keywords(self, texts: list[str], labels, top_n: int = 10, refresh: bool = False) -> dict:
+        """
+        Returns {cluster label: [top_n keywords]} for every label except noise (-1).
+        """
+        labels = np.asarray(labels)
+        mask = pd.notna(labels) & (labels != -1)
+        if not mask.any():
+            return {}
+        X = self.document_term_matrix(list(np.asarray(texts, dtype=object)[mask]), refresh=refresh)
+        classes, inverse = np.unique(labels[mask], return_inverse=True)
+
+        # (clusters x docs) membership matrix; one product sums the term counts per cluster
+        membership = sparse.csr_matrix(
+            (np.ones(len(inverse)), (inverse, np.arange(len(inverse)))), shape=(len(classes), X.shape[0])
+        )
+        counts = (membership @ X).tocsr().astype(np.float64)
+
+        words_per_cluster = np.asarray(counts.sum(axis=1)).ravel()
+        term_totals = np.asarray(counts.sum(axis=0)).ravel()
+        avg_words = words_per_cluster.mean()
+        idf = np.log1p(avg_words / np.maximum(term_totals, 1))
+
+        tf = sparse.diags(1 / np.maximum(words_per_cluster, 1)) @ counts
+        scores = (tf @ sparse.diags(idf)).tocsr()
+        scores.sort_indices()  # ties break by term index
+
+        terms = self.vectorizer.get_feature_names_out()
+        keywords = {}
+        for i, c in enumerate(classes):
+            row = scores.getrow(i)
+            top = row.indices[np.argsort(-row.data, kind="stable")[:top_n]]
+            keywords[c] = terms[top].tolist()
+        return keywords
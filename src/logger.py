@@ -9,7 +9,15 @@ init(autoreset=True)
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
-def setup_logger(name="whisperwatch"):
+# One console and one file handler per process, shared by every named logger
+_handlers = None
+
+
+def _process_handlers():
+    global _handlers
+    if _handlers is not None:
+        return _handlers
+
     # Format with color codes
     class ColorFormatter(logging.Formatter):
         LEVEL_COLORS = {
@@ -26,11 +34,7 @@ def setup_logger(name="whisperwatch"):
             return f"{color}{message}{Style.RESET_ALL}"
 
     timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S")
-    log_path = os.path.join(LOG_DIR, f"logs_{timestamp}.txt")
-
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    logger.handlers.clear()  # prevent duplicates if run multiple times
+    log_path = os.path.join(LOG_DIR, f"logs_{timestamp}_{os.getpid()}.txt")
 
     # Console handler with color
     console_handler = logging.StreamHandler(sys.stdout)
@@ -39,13 +43,20 @@ def setup_logger(name="whisperwatch"):
     console_format = ColorFormatter("[%(levelname)s] %(message)s")
     console_handler.setFormatter(console_format)
 
-    # File handler
-    file_handler = logging.FileHandler(log_path, encoding='utf-8')
+    # File handler; the file is only created once something is logged
+    file_handler = logging.FileHandler(log_path, encoding='utf-8', delay=True)
     file_handler.setLevel(logging.DEBUG)
     file_format = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s")
     file_handler.setFormatter(file_format)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    _handlers = [console_handler, file_handler]
+    return _handlers
+
 
+def setup_logger(name="whisperwatch"):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.handlers.clear()  # prevent duplicates if run multiple times
+    for handler in _process_handlers():
+        logger.addHandler(handler)
     return logger
@@ -0,0 +1,199 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+
+from src import config
+from src.logger import setup_logger
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # optional, used where /proc and resource are missing (e.g. Windows)
+except ImportError:
+    psutil = None
+
+logger = setup_logger("Metrics")
+
+
+def rss_mb() -> float | None:
+    """
+    Current resident set size in MB (Linux /proc, else psutil; None if neither is available).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    return None
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Peak resident set size of the whole process so far in MB, or None if it cannot be read.
+    """
+    peak = None
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and KB elsewhere
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+    elif psutil is not None:
+        peak_wset = getattr(psutil.Process().memory_info(), "peak_wset", None)  # Windows only
+        peak = peak_wset / 2**20 if peak_wset is not None else None
+    # Linux updates its high-water mark lazily, so it can trail the current RSS
+    current = rss_mb()
+    if peak is not None and current is not None:
+        return max(peak, current)
+    return peak
+
+
+class RunMetrics:
+    """
+    Timings, memory and item counts for one pipeline run.
+
+    - `stage(name)` times a block; nested stages are recorded as "outer/inner" and repeated
+      stages accumulate. The block can report what it processed with `items(posts=...)`,
+      which becomes posts/second etc. in the summary.
+    - `count(name, n, seconds)` adds to a run-wide counter (e.g. sentences embedded and the
+      time spent encoding them).
+    - Memory is the RSS at stage exit and how much the process peak RSS rose while the stage ran
+      (0 when an earlier stage had already reached a higher peak).
+    - Stages listed in `profile` (config.PROFILE_STAGES or `--profile`) run under cProfile; the
+      top functions go into the summary and the raw stats next to metrics.json.
+    """
+    def __init__(self, profile=()):
+        self.started_at = datetime.utcnow()
+        self.profile = set(profile)
+        self.stages = {}
+        self.counters = {}
+        self.profiles = {}
+        self._stack = []
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name: str):
+        path = "/".join(self._stack + [name])
+        entry = self.stages.setdefault(path, {"seconds": 0.0, "calls": 0, "items": {}})
+        # Only one profiler can be active, so stages nested in a profiled stage are covered by it
+        profiler = None
+        if (name in self.profile or path in self.profile) and not self._profiling:
+            profiler = cProfile.Profile()
+            self._profiling = True
+        handle = _StageHandle(entry)
+        self._stack.append(name)
+        peak_before = peak_rss_mb()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield handle
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                self.profiles[path] = profiler
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            entry["seconds"] += elapsed
+            entry["calls"] += 1
+            entry["rss_mb"] = rss_mb()
+            peak_after = peak_rss_mb()
+            if peak_before is not None and peak_after is not None:
+                entry["peak_rss_growth_mb"] = max(entry.get("peak_rss_growth_mb", 0.0), peak_after - peak_before)
+            logger.info("Stage %s took %.2fs%s", path, elapsed,
+                        "".join(f", {n} {k}" for k, n in entry["items"].items()))
+
+    def count(self, name: str, n: int, seconds: float | None = None):
+        counter = self.counters.setdefault(name, {"count": 0, "seconds": 0.0})
+        counter["count"] += n
+        if seconds is not None:
+            counter["seconds"] += seconds
+
+    def _profile_summary(self, profiler, top: int = 15) -> str:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
+
+    def summary(self) -> dict:
+        stages = {}
+        for path, entry in self.stages.items():
+            stage = {k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items() if k != "items"}
+            stage["items"] = dict(entry["items"])
+            stage["rates"] = {f"{k}_per_second": round(n / entry["seconds"], 1)
+                              for k, n in entry["items"].items() if entry["seconds"] > 0}
+            stages[path] = stage
+        counters = {}
+        for name, counter in self.counters.items():
+            counters[name] = dict(counter, seconds=round(counter["seconds"], 3))
+            if counter["seconds"] > 0:
+                counters[name]["per_second"] = round(counter["count"] / counter["seconds"], 1)
+        return {
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round((datetime.utcnow() - self.started_at).total_seconds(), 3),
+            "process_peak_rss_mb": round(peak, 1) if (peak := peak_rss_mb()) is not None else None,
+            "stages": stages,
+            "counters": counters,
+            "profiles": {path: self._profile_summary(p) for path, p in self.profiles.items()},
+        }
+
+    def write(self, directory: str) -> str:
+        """
+        Writes metrics.json (and one .prof file per profiled stage, for snakeviz/pstats) to `directory`.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for path, profiler in self.profiles.items():
+            profiler.dump_stats(os.path.join(directory, f"profile_{path.replace('/', '.')}.prof"))
+        out = os.path.join(directory, "metrics.json")
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        logger.info("Run metrics written to %s", out)
+        return out
+
+
+class _StageHandle:
+    def __init__(self, entry):
+        self.entry = entry
+
+    def items(self, **counts):
+        for k, n in counts.items():
+            self.entry["items"][k] = self.entry["items"].get(k, 0) + int(n)
+
+
+_metrics = None
+
+
+def get_metrics() -> RunMetrics:
+    """
+    The metrics of the current run (one per process).
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = RunMetrics(profile=config.PROFILE_STAGES)
+    return _metrics
+
+
+def start_run(profile=()) -> RunMetrics:
+    """
+    Starts a fresh run, profiling `profile` stages in addition to config.PROFILE_STAGES.
+    """
+    global _metrics
+    _metrics = RunMetrics(profile=[*config.PROFILE_STAGES, *profile])
+    return _metrics
+
+
+def stage(name: str):
+    return get_metrics().stage(name)
+
+
+def count(name: str, n: int, seconds: float | None = None):
+    get_metrics().count(name, n, seconds)
@@ -1,7 +1,7 @@
 from dataclasses import field, dataclass
 from typing import List, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Post:
     post_id: str
     subreddit: str
@@ -15,10 +15,10 @@ class Post:
     url: str
     collection_date: str
     tags: List[str] = field(default_factory=list)
-    top_comments: str = ""
-    cluster_labels: Optional[List[int]] = field(default_factory=list)
+    top_comments: List[str] = field(default_factory=list)
+    cluster_labels: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class Comment:
     comment_id: str
     post_id: str
@@ -0,0 +1,121 @@
+import os
+import joblib
+import numpy as np
+from datetime import datetime
+from scipy.optimize import linear_sum_assignment
+
+from src.logger import setup_logger
+from src import reducer
+
+logger = setup_logger("Narrative-Model")
+
+
+class NarrativeModel:
+    """
+    Persisted state of the last full clustering: the fitted StandardScaler and PCA plus one
+    prototype per narrative (centroid in PCA space and an assignment radius).
+
+    `assign` places new posts into existing narratives, or noise (-1), in time proportional
+    to the number of new posts. `align_labels` maps the labels of a fresh HDBSCAN fit onto the
+    previous model's ids so cluster ids keep their meaning across runs.
+    """
+    def __init__(self, scaler, pca, cluster_ids: np.ndarray, centroids: np.ndarray, radii: np.ndarray,
+                 fitted_at: str | None = None, n_fit: int = 0, next_id: int | None = None, pooling: str = "legacy"):
+        self.scaler = scaler
+        self.pca = pca
+        self.cluster_ids = np.asarray(cluster_ids, dtype=int)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.radii = np.asarray(radii, dtype=np.float32)
+        self.fitted_at = fitted_at or datetime.utcnow().isoformat()
+        self.n_fit = n_fit
+        self.next_id = next_id if next_id is not None else int(self.cluster_ids.max(initial=-1)) + 1
+        self.pooling = pooling  # how post vectors were built (see Clustering.post_embeddings)
+
+    @classmethod
+    def from_fit(cls, scaler, pca, reduced: np.ndarray, labels: np.ndarray, radius_quantile: float = 0.95):
+        """
+        Builds prototypes from a fitted reducer and the labels HDBSCAN gave the reduced embeddings.
+        """
+        labels = np.asarray(labels)
+        cluster_ids = np.array(sorted(set(labels) - {-1}), dtype=int)
+        centroids = np.empty((len(cluster_ids), reduced.shape[1]), dtype=np.float32)
+        radii = np.empty(len(cluster_ids), dtype=np.float32)
+        for i, c in enumerate(cluster_ids):
+            members = reduced[labels == c]
+            centroids[i] = members.mean(axis=0)
+            radii[i] = np.quantile(np.linalg.norm(members - centroids[i], axis=1), radius_quantile)
+        return cls(scaler, pca, cluster_ids, centroids, radii, n_fit=len(labels))
+
+    @classmethod
+    def load(cls, path: str):
+        if not os.path.exists(path):
+            return None
+        return cls(**joblib.load(path))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump({
+            "scaler": self.scaler,
+            "pca": self.pca,
+            "cluster_ids": self.cluster_ids,
+            "centroids": self.centroids,
+            "radii": self.radii,
+            "fitted_at": self.fitted_at,
+            "n_fit": self.n_fit,
+            "next_id": self.next_id,
+            "pooling": self.pooling,
+        }, path)
+        logger.info("Saved narrative model with %d clusters to %s", len(self.cluster_ids), path)
+
+    def age_days(self) -> float:
+        return (datetime.utcnow() - datetime.fromisoformat(self.fitted_at)).total_seconds() / 86400
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        return reducer.transform(embeddings, self.scaler, self.pca)
+
+    def assign(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Labels each embedding with the nearest prototype, or -1 if it lies outside that prototype's radius.
+        """
+        if len(embeddings) == 0 or len(self.cluster_ids) == 0:
+            return np.full(len(embeddings), -1, dtype=int)
+        reduced = self.transform(embeddings)
+        # Squared distances via the dot-product expansion, one (n, k) matrix
+        d2 = (
+            (reduced ** 2).sum(axis=1)[:, None]
+            - 2 * reduced @ self.centroids.T
+            + (self.centroids ** 2).sum(axis=1)[None, :]
+        )
+        nearest = d2.argmin(axis=1)
+        dist = np.sqrt(np.maximum(d2[np.arange(len(reduced)), nearest], 0))
+        return np.where(dist <= self.radii[nearest], self.cluster_ids[nearest], -1)
+
+    def align_labels(self, new_model: "NarrativeModel", labels: np.ndarray) -> np.ndarray:
+        """
+        Renames the clusters of `new_model` (and `labels`) to this model's ids by matching centroids
+        one-to-one. Centroids are compared in this model's PCA space; a match is only accepted when
+        the new centroid lies within the old cluster's radius. Unmatched clusters get fresh ids.
+        """
+        labels = np.asarray(labels)
+        mapping = {}
+        if len(self.cluster_ids) and len(new_model.cluster_ids):
+            # Bring the new centroids back to embedding space, then into this model's space
+            new_centroids = new_model.scaler.inverse_transform(new_model.pca.inverse_transform(new_model.centroids))
+            new_centroids = self.transform(new_centroids)
+            cost = np.linalg.norm(new_centroids[:, None, :] - self.centroids[None, :, :], axis=2)
+            rows, cols = linear_sum_assignment(cost)
+            for r, c in zip(rows, cols):
+                if cost[r, c] <= self.radii[c]:
+                    mapping[int(new_model.cluster_ids[r])] = int(self.cluster_ids[c])
+
+        matched = len(mapping)
+        next_id = self.next_id
+        for c in new_model.cluster_ids:
+            if int(c) not in mapping:
+                mapping[int(c)] = next_id
+                next_id += 1
+        logger.info("Aligned %d/%d new clusters to existing narrative ids", matched, len(new_model.cluster_ids))
+
+        new_model.cluster_ids = np.array([mapping[int(c)] for c in new_model.cluster_ids], dtype=int)
+        new_model.next_id = next_id
+        return np.array([mapping.get(int(l), -1) for l in labels], dtype=int)
@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from src import config
+from src.logger import setup_logger
+
+logger = setup_logger("Pipeline")
+
+# Two stages are cached: "cluster" (embed, reduce and cluster run together inside Clustering) and
+# "report". Fingerprints hash the content a stage reads (not upstream run times), so a rerun upstream
+# stage whose output did not change leaves everything downstream up to date.
+
+# Inputs each cached stage reads; anything else in the data does not invalidate it
+CLUSTER_POST_COLUMNS = ["post_id", "title", "selftext", "top_comments"]
+CLUSTER_COMMENT_COLUMNS = ["comment_id", "post_id", "body", "score"]
+REPORT_POST_COLUMNS = ["post_id", "author", "subreddit", "title", "selftext", "created_utc", "cluster_labels"]
+REPORT_COMMENT_COLUMNS = ["comment_id", "post_id", "author", "subreddit", "created_utc"]
+
+
+def stage_params(stage: str) -> dict:
+    """
+    Settings that change a stage's output, including those of the upstream stages it runs with.
+    """
+    if stage == "cluster":
+        return {
+            "embed": {"model": config.EMBEDDING_MODEL, "pooling": config.EMBEDDING_POOLING,
+                      "top_comments": config.POOLING_TOP_COMMENTS, "title_weight": config.POOLING_TITLE_WEIGHT},
+            "reduce": {"pca_components": config.PCA_COMPONENTS, "chunk_size": config.REDUCE_CHUNK_SIZE},
+            "cluster": {"min_cluster_size": config.HDBSCAN_MIN_CLUSTER_SIZE, "min_samples": config.HDBSCAN_MIN_SAMPLES,
+                        "mode": config.CLUSTER_MODE,
+                        "algorithm": [config.CLUSTER_ALGORITHM, config.TWO_STAGE_MIN_POSTS, config.MICRO_CLUSTERS,
+                                      config.MICRO_CLUSTER_POSTS, config.MICRO_BATCH_SIZE, config.MICRO_EPOCHS],
+                        "duplicates": [config.DETECT_DUPLICATES, config.DUPLICATE_THRESHOLD,
+                                       config.DUPLICATE_MIN_CHARS, config.DUPLICATE_INCLUDE_COMMENTS]},
+        }
+    if stage == "report":
+        return {
+            "keywords": [config.KEYWORD_NGRAM_RANGE, config.KEYWORD_MIN_DF],
+            "bursts": [config.BURST_WINDOWS, config.BURST_MIN_EVENTS, config.BURST_MAX_PVALUE],
+            "coordination": [config.COORDINATION_TIME_BUCKET, config.COORDINATION_TOP_K,
+                             config.COORDINATION_MIN_SIMILARITY, config.COORDINATION_MIN_ACTIVITY],
+        }
+    return {}
+
+
+def _frame(data, columns=None):
+    import pandas as pd
+    from src.batches import to_batch
+
+    if data is None:
+        return pd.DataFrame(columns=columns or [])
+    if not isinstance(data, pd.DataFrame):
+        data = to_batch(data)
+    if columns is not None:
+        data = data.reindex(columns=columns)
+    # Loaded and in-memory records differ in types (ISO strings vs datetimes, int vs float labels)
+    if "created_utc" in data:
+        data = data.assign(created_utc=pd.to_datetime(data["created_utc"]))
+    if "cluster_labels" in data:
+        data = data.assign(cluster_labels=pd.to_numeric(data["cluster_labels"], errors="coerce"))
+    return data
+
+
+def content_hash(data, columns=None) -> str:
+    """
+    Order-sensitive hash of a DataFrame or list of records (restricted to `columns`), a string,
+    or any JSON-serializable value.
+    """
+    import pandas as pd
+
+    h = hashlib.sha1()
+    if isinstance(data, pd.DataFrame) or columns is not None:
+        frame = _frame(data, columns)
+        h.update(",".join(map(str, frame.columns)).encode())
+        h.update(pd.util.hash_pandas_object(frame.astype(str), index=False).to_numpy().tobytes())
+    elif isinstance(data, (str, bytes)):
+        h.update(data.encode() if isinstance(data, str) else data)
+    else:
+        h.update(json.dumps(data, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def directory_hash(path: str) -> str:
+    """
+    Hash of every file under `path` (names and contents), e.g. the report templates.
+    """
+    h = hashlib.sha1()
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            h.update(os.path.relpath(file_path, path).encode())
+            with open(file_path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class StageCache:
+    """
+    Remembers, per stage, the fingerprint of the inputs and parameters of its last run and the
+    artifacts it produced (in `PIPELINE_STATE_PATH`). A stage is up to date when its fingerprint
+    is unchanged and all its artifacts still exist; `main` then skips it.
+    """
+    def __init__(self, path: str = config.PIPELINE_STATE_PATH):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error("Ignoring unreadable pipeline state %s: %s", path, str(e))
+
+    def is_fresh(self, stage: str, fp: str) -> bool:
+        entry = self.state.get(stage)
+        if not entry or entry["fingerprint"] != fp:
+            return False
+        return all(os.path.exists(a) for a in entry.get("artifacts", []))
+
+    def artifacts(self, stage: str) -> list[str]:
+        return self.state.get(stage, {}).get("artifacts", [])
+
+    def record(self, stage: str, fp: str, artifacts=()):
+        self.state[stage] = {"fingerprint": fp, "artifacts": list(artifacts), "updated_at": datetime.utcnow().isoformat()}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
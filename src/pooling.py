@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from src.batches import posts_batch, comments_batch
+from src.embedding_store import text_hash
+
+JUNK_BODIES = ["[deleted]", "[removed]"]
+
+
+def score_len(score, body: str) -> float:
+    """
+    Ranking score of a single comment: score * log1p(len(body)), computed as the batch path does.
+    """
+    return float(np.float64(score) * np.log1p(np.float64(len(body))))
+
+
+def select_top_comments(comments: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+    """
+    The `n` most informative comments per post, ranked by score_len = score * log1p(len(body)).
+    Returns post_id, body and score_len, grouped by post and best first within each post (ties keep
+    input order). One lexsort by (post, -score_len) and a rank within each post replace a groupby.
+    """
+    comments = comments[~comments["body"].isin(JUNK_BODIES)]
+    scores = comments["score"].to_numpy(dtype=np.float64) * np.log1p(comments["body"].str.len().to_numpy(dtype=np.float64))
+    post_codes, _ = pd.factorize(comments["post_id"])
+    order = np.lexsort((-scores, post_codes))
+    codes = post_codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    keep = order[rank < n]
+    return pd.DataFrame({
+        "post_id": comments["post_id"].to_numpy()[keep],
+        "body": comments["body"].to_numpy()[keep],
+        "score_len": scores[keep],
+    }, index=comments.index[keep])
+
+
+def add_top_comments(posts, comments, n: int = 10):
+    """
+    Sets each post's `top_comments` to the bodies of its `n` best comments (see
+    `select_top_comments`). Returns (posts, comments) as batches. This is the batch path used to
+    recompute from storage; during collection the scraper's streamed heaps are used instead.
+    """
+    posts, comments = posts_batch(posts), comments_batch(comments)
+    # select_top_comments returns each post's comments contiguously, so one split groups them
+    top = select_top_comments(comments, n)
+    post_ids, bodies = top["post_id"].to_numpy(), top["body"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, post_ids[1:] != post_ids[:-1]]) if len(top) else np.array([], dtype=int)
+    by_post = dict(zip(post_ids[starts], (b.tolist() for b in np.split(bodies, starts[1:]))))
+    posts["top_comments"] = pd.Series([by_post.get(post_id, []) for post_id in posts["post_id"]], index=posts.index, dtype=object)
+    return posts, comments
+
+
+def unique_bodies(top: pd.DataFrame) -> tuple[pd.Series, pd.DataFrame]:
+    """
+    Dedup table for comment bodies: returns the text hash of every selected comment and one row
+    per distinct body (hash, body), so identical comments across posts are embedded once.
+    """
+    hashes = top["body"].map(text_hash)
+    table = pd.DataFrame({"text_hash": hashes, "body": top["body"]}).drop_duplicates("text_hash")
+    return hashes, table.reset_index(drop=True)
+
+
+def _normalize(X: np.ndarray) -> np.ndarray:
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+
+def pool_post_vectors(post_ids, title_vectors: np.ndarray, top: pd.DataFrame, comment_hashes: pd.Series,
+                      body_hashes: list, body_vectors: np.ndarray, title_weight: float = 0.5) -> np.ndarray:
+    """
+    Post vector = title_weight * title vector + (1 - title_weight) * weighted mean of its top comment
+    vectors, weighted by score_len (clipped at 0; equal weights if all are 0). Vectors are unit-normalized
+    before mixing. Posts without comments keep their title vector.
+    """
+    titles = _normalize(np.asarray(title_vectors, dtype=np.float32))
+    if len(top) == 0:
+        return titles
+    post_index = pd.Index(pd.Series(post_ids).astype(str))
+    rows = post_index.get_indexer(top["post_id"].astype(str))
+    valid = rows >= 0
+    body_rows = pd.Index(body_hashes).get_indexer(comment_hashes)
+    valid &= body_rows >= 0
+    rows, body_rows = rows[valid], body_rows[valid]
+
+    weights = np.maximum(top["score_len"].to_numpy(dtype=np.float64)[valid], 0)
+    totals = np.bincount(rows, weights=weights, minlength=len(post_index))
+    counts = np.bincount(rows, minlength=len(post_index))
+    # Fall back to a plain mean for posts whose comments all have non-positive scores
+    weights = np.where(totals[rows] > 0, weights, 1.0)
+    totals = np.where(totals > 0, totals, counts)
+
+    comment_vectors = _normalize(np.asarray(body_vectors, dtype=np.float32))
+    pooled = np.zeros((len(post_index), comment_vectors.shape[1]), dtype=np.float64)
+    np.add.at(pooled, rows, comment_vectors[body_rows] * weights[:, None])
+    has_comments = counts > 0
+    pooled[has_comments] /= totals[has_comments, None]
+
+    mixed = np.where(has_comments[:, None], title_weight * titles + (1 - title_weight) * _normalize(pooled), titles)
+    return mixed.astype(np.float32)
@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+import praw
+from dotenv import load_dotenv
+
+from src import config
+from src.logger import setup_logger
+
+logger = setup_logger("RedditClient")
+
+load_dotenv()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all scraper workers.
+
+    The refill rate starts at `requests_per_minute` and is re-tuned from Reddit's
+    `X-Ratelimit-Remaining` / `X-Ratelimit-Reset` headers via `update_from_headers`,
+    so workers slow down as the window runs dry instead of getting 429s.
+    """
+    def __init__(self, requests_per_minute: float = config.REQUESTS_PER_MINUTE, burst: int = 10):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate if self.rate > 0 else 1.0)
+            time.sleep(max(wait, 0.01))
+
+    def update_from_headers(self, remaining: float | None, reset_seconds: float | None):
+        """
+        Spreads the remaining requests of the current window evenly over the time left in it.
+        """
+        if remaining is None or reset_seconds is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            reset_seconds = max(float(reset_seconds), 0.0)
+            if remaining < 1:
+                self.tokens = 0.0
+                self.blocked_until = now + reset_seconds
+                logger.warning("Reddit rate limit exhausted, pausing for %.1fs", reset_seconds)
+            elif reset_seconds > 0:
+                self.rate = remaining / reset_seconds
+                self.tokens = min(self.tokens, remaining)
+
+
+class RedditClient(ABC):
+    """
+    Interface the scraper uses to talk to Reddit.
+
+    Submissions must expose `id`, `author`, `title`, `selftext`, `score`, `num_comments`,
+    `created_utc`, `link_flair_text` and `url`; comments must expose `id`, `author`, `body`,
+    `score`, `created_utc` and `parent_id`. Implementations must be safe to call
+    `fetch_comments` from several threads at once. Tests use the in-memory fake in tests/fakes.py.
+    """
+    @abstractmethod
+    def listing(self, subreddit: str, kind: str, limit: int, **kwargs):
+        """
+        Yields submissions from a subreddit listing (`top`, `hot`, `new`, ...).
+        """
+
+    @abstractmethod
+    def fetch_comments(self, submission, limit: int):
+        """
+        Returns up to `limit` comments from the flattened comment tree of `submission`.
+        """
+
+
+class PrawClient(RedditClient):
+    """
+    praw-backed client. praw is not thread-safe, so every worker thread gets its own
+    `praw.Reddit` instance; all of them draw from one shared `TokenBucket`.
+    """
+    def __init__(self, limiter: TokenBucket | None = None, user_agent: str = "whisperwatch-script"):
+        self.limiter = limiter or TokenBucket()
+        self.user_agent = user_agent
+        self._local = threading.local()
+
+    @property
+    def reddit(self) -> praw.Reddit:
+        if not hasattr(self._local, "reddit"):
+            self._local.reddit = praw.Reddit(
+                client_id=os.getenv("REDDIT_CLIENT_ID"),
+                client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+                user_agent=self.user_agent
+            )
+        return self._local.reddit
+
+    def _after_request(self):
+        limits = self.reddit.auth.limits
+        reset = limits.get("reset_timestamp")
+        self.limiter.update_from_headers(
+            limits.get("remaining"),
+            reset - time.time() if reset is not None else None
+        )
+
+    def listing(self, subreddit: str, kind: str, limit: int, **kwargs):
+        listing = iter(getattr(self.reddit.subreddit(subreddit), kind)(limit=limit, **kwargs))
+        # praw pages through listings 100 items at a time, one request per page
+        i = 0
+        while True:
+            new_page = i % 100 == 0
+            if new_page:
+                self.limiter.acquire()
+            try:
+                submission = next(listing)
+            except StopIteration:
+                return
+            if new_page:
+                self._after_request()
+            i += 1
+            yield submission
+
+    def fetch_comments(self, submission, limit: int):
+        self.limiter.acquire()
+        # Re-bind the submission to this thread's praw instance before its comment tree is fetched
+        thread_submission = self.reddit.submission(id=submission.id)
+        thread_submission.comments.replace_more(limit=0)
+        self._after_request()
+        return thread_submission.comments.list()[:limit]
@@ -1,20 +1,20 @@
-import numpy as np
-import praw
-import os
+import sys
+import heapq
 import traceback
-import pandas as pd
-from datetime import datetime
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
 from tqdm import tqdm
 
 from src.models import Post, Comment
-from src.utils import clean_text
+from src.batches import posts_batch, comments_batch
+from src.utils import clean_text, clean_texts
+from src.pooling import score_len, JUNK_BODIES
 from src.logger import setup_logger
+from src.reddit_client import RedditClient, PrawClient
+from src.checkpoint import ScrapeCheckpoint
 
 logger = setup_logger("RedditScraper")
 
-load_dotenv()
-
 class RedditScraper:
     """
     A class to scrape Reddit posts and comments from specified subreddits.
@@ -25,117 +25,244 @@ class RedditScraper:
                  hot_limit=50,
                  min_comments=10,
                  min_score=10,
-                 max_comments_per_post=50):
-        self.reddit = praw.Reddit(
-            client_id=os.getenv("REDDIT_CLIENT_ID"),
-            client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-            user_agent="whisperwatch-script"
-        )
+                 max_comments_per_post=50,
+                 max_workers=1,
+                 client: RedditClient | None = None,
+                 new_limit=0,
+                 checkpoint: ScrapeCheckpoint | None = None,
+                 checkpoint_every=25,
+                 top_n_comments=10):
+        self.client = client or PrawClient()
+        self.max_workers = max_workers
         self.subreddits = subreddits
         self.top_limit = top_limit
         self.hot_limit = hot_limit
+        self.new_limit = new_limit
         self.min_comments = min_comments
         self.min_score = min_score
         self.max_comments_per_post = max_comments_per_post
+        self.checkpoint = checkpoint
+        # High-water marks as of the last run; flushes during this run must not cut its "new" listing short
+        self._high_water = dict(checkpoint.high_water) if checkpoint is not None else {}
+        self.checkpoint_every = checkpoint_every
+        self.top_n_comments = top_n_comments
 
         self.collected_post_ids = set()
+        self.skipped_unchanged = 0
         self.collection_date = datetime.utcnow().isoformat()
         self.posts: list[Post] = []
+        # Only kept without a checkpoint; otherwise comments go to storage at each checkpoint flush
         self.comments: list[Comment] = []
+        self.n_comments = 0
+        # Per post, a min-heap of its best `top_n_comments` comments as (score_len, -arrival, body)
+        self._top_heaps: dict[str, list] = {}
+        self._arrivals = 0
+        # Posts with comments stored by earlier runs; their heaps only hold this run's comments
+        self._partial_heaps: set[str] = set()
 
-    def _collect_post_and_comments(self, post, subreddit_name):
-        logger.debug(f"Collecting post {post.id} from r/{subreddit_name}")
-        try:
-            if post.id in self.collected_post_ids:
-                return
-            self.collected_post_ids.add(post.id)
+    def _build_post(self, post, subreddit_name):
+        """
+        Returns a Post for a submission that passes the thresholds and has not been seen yet, else None.
+        """
+        if post.id in self.collected_post_ids:
+            return None
+        self.collected_post_ids.add(post.id)
 
-            if post.num_comments < self.min_comments or post.score < self.min_score:
-                return
-            
-            post_obj = Post(
+        if self.checkpoint is not None and self.checkpoint.is_unchanged(post):
+            self.skipped_unchanged += 1
+            return None
+
+        if post.num_comments < self.min_comments or post.score < self.min_score:
+            if self.checkpoint is not None:
+                self.checkpoint.mark_seen(post, subreddit_name)
+            return None
+
+        return Post(
+            post_id=post.id,
+            subreddit=subreddit_name,
+            author=sys.intern(str(post.author)),
+            title=clean_text(post.title),
+            selftext=clean_text(post.selftext),
+            score=post.score,
+            num_comments=post.num_comments,
+            created_utc=datetime.utcfromtimestamp(post.created_utc).isoformat(),
+            flair=post.link_flair_text,
+            url=post.url,
+            collection_date=self.collection_date
+        )
+
+    def _fetch_comments(self, post, subreddit_name, seen_comment_ids=frozenset()):
+        """
+        Fetches and cleans the comments of a submission, skipping already stored ones.
+        Safe to run in worker threads.
+        """
+        raw = [c for c in self.client.fetch_comments(post, self.max_comments_per_post) if c.id not in seen_comment_ids]
+        bodies = clean_texts([c.body for c in raw], workers=1)  # already on a worker thread
+        return [
+            Comment(
+                comment_id=comment.id,
                 post_id=post.id,
                 subreddit=subreddit_name,
-                author=str(post.author),
-                title=clean_text(post.title),
-                selftext=clean_text(post.selftext),
-                score=post.score,
-                num_comments=post.num_comments,
-                created_utc=datetime.utcfromtimestamp(post.created_utc).isoformat(),
-                flair=post.link_flair_text,
-                url=post.url,
+                author=sys.intern(str(comment.author)),
+                body=body,
+                score=comment.score,
+                created_utc=datetime.utcfromtimestamp(comment.created_utc).isoformat(),
+                parent_id=comment.parent_id,
                 collection_date=self.collection_date
             )
-            self.posts.append(post_obj)
-
-            post.comments.replace_more(limit=0)
-            for comment in post.comments.list()[:self.max_comments_per_post]:
-                comment_obj = Comment(
-                    comment_id=comment.id,
-                    post_id=post.id,
-                    subreddit=subreddit_name,
-                    author=str(comment.author),
-                    body=clean_text(comment.body),
-                    score=comment.score,
-                    created_utc=datetime.utcfromtimestamp(comment.created_utc).isoformat(),
-                    parent_id=comment.parent_id,
-                    collection_date=self.collection_date
-                )
-                self.comments.append(comment_obj)
+            for comment, body in zip(raw, bodies)
+        ]
+
+    def _collect_post_and_comments(self, post, subreddit_name, listing=None):
+        logger.debug(f"Collecting post {post.id} from r/{subreddit_name}")
+        try:
+            post_obj = self._build_post(post, subreddit_name)
+            if post_obj is None:
+                return
+            comments = self._fetch_comments(post, subreddit_name, self._seen_comment_ids(post.id))
+            self._store(post_obj, comments, listing)
         except Exception as e:
             logger.error(f"Error collecting post {post.id} from r/{subreddit_name}: {str(e)}")
             logger.error(traceback.format_exc())
 
-    def add_top_comments(self, posts, comments, n=10):
-        # Convert to DataFrame if needed
-        if not isinstance(posts, pd.DataFrame):
-            posts_df = pd.DataFrame([p.__dict__ for p in posts])
-        else:
-            posts_df = posts
-        if not isinstance(comments, pd.DataFrame):
-            comments_df = pd.DataFrame([c.__dict__ for c in comments])
-        else:
-            comments_df = comments
-            
-        # Clean junk and compute score_len
-        comments_df = comments_df[~comments_df["body"].isin(["[deleted]", "[removed]"])]
-        comments_df["score_len"] = comments_df["score"] * comments_df["body"].str.len().apply(lambda x: np.log1p(x))
-
-        # Get top comments by post_id
-        top_comments_by_post = (
-            comments_df
-            .sort_values("score_len", ascending=False)
-            .groupby("post_id")["body"]
-            .apply(lambda s: s.head(n).tolist())
-        )
+    def _seen_comment_ids(self, post_id):
+        if self.checkpoint is None:
+            return frozenset()
+        seen = self.checkpoint.seen_comment_ids(post_id)
+        if seen:
+            self._partial_heaps.add(post_id)
+        return seen
 
-        # Map to posts
-        posts_df["top_comments"] = posts_df["post_id"].map(top_comments_by_post).apply(lambda lst: lst if isinstance(lst, list) else [])
-        posts_df["top_comments"] = posts_df["top_comments"].fillna("").astype(str).tolist()
-        
-        posts = [
-            Post(**{**row, "top_comments": row["top_comments"]})
-            for row in posts_df.to_dict(orient="records")
-        ]
-        
-        return posts, comments # Return original comments DataFrame
+    def _store(self, post_obj, comments, listing=None):
+        """
+        Records a collected post and its comments, flushing a checkpoint every `checkpoint_every` posts.
+        `listing` is the listing the post came from ("top", "hot" or "new").
+        """
+        self.posts.append(post_obj)
+        self.n_comments += len(comments)
+        if self.checkpoint is None:
+            self.comments.extend(comments)
+        self._track_top_comments(post_obj.post_id, comments)
+        if self.checkpoint is not None:
+            self.checkpoint.add(post_obj, comments, listing)
+            if self.checkpoint.pending() >= self.checkpoint_every:
+                self.checkpoint.flush()
+
+    def _track_top_comments(self, post_id, comments):
+        """
+        Keeps the best `top_n_comments` comments of a post as they arrive, in a heap bounded to that
+        size, so enrichment needs O(posts x n) memory however many comments stream in.
+        """
+        heap = self._top_heaps.setdefault(post_id, [])
+        for c in comments:
+            if c.body in JUNK_BODIES:
+                continue
+            self._arrivals += 1
+            # On equal scores the earlier comment wins, as in select_top_comments
+            item = (score_len(c.score, c.body), -self._arrivals, c.body)
+            if len(heap) < self.top_n_comments:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def streamed_top_comments(self, post_id) -> list[str]:
+        """
+        Bodies of the best comments collected for a post during this run, best first.
+        """
+        return [body for _, _, body in sorted(self._top_heaps.get(post_id, []), reverse=True)]
+
+    def complete_top_comments(self) -> dict[str, list[str]]:
+        """
+        {post_id: best comments} for the posts collected by `_run` whose every stored comment was
+        fetched this run, so their streamed heaps need no recomputation from storage.
+        """
+        posts = posts_batch(self.posts)
+        complete = ~posts["post_id"].isin(self._partial_heaps)
+        return dict(zip(posts["post_id"][complete], posts["top_comments"][complete]))
+
+    def _is_below_high_water(self, post, sub):
+        if sub not in self._high_water:
+            return False
+        high_water = datetime.fromisoformat(self._high_water[sub]).replace(tzinfo=timezone.utc)
+        return post.created_utc <= high_water.timestamp()
+
+    def _listings(self, sub):
+        """
+        Yields (listing, submission) pairs from the top, hot and (if enabled) new listings.
+        """
+        for post in tqdm(self.client.listing(sub, "top", self.top_limit, time_filter="month"), desc=f"Top posts in r/{sub}"):
+            yield "top", post
+        for post in tqdm(self.client.listing(sub, "hot", self.hot_limit), desc=f"Hot posts in r/{sub}"):
+            yield "hot", post
+        if self.new_limit:
+            # The "new" listing is newest-first, so stop at the subreddit's high-water mark
+            for post in tqdm(self.client.listing(sub, "new", self.new_limit), desc=f"New posts in r/{sub}"):
+                if self._is_below_high_water(post, sub):
+                    break
+                yield "new", post
+
+    def _drain(self, futures, block=False):
+        """
+        Stores the results of finished comment fetches. With `block`, waits for at least one.
+        """
+        if not futures:
+            return
+        done, _ = wait(futures, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            post_obj, listing = futures.pop(future)
+            try:
+                comments = future.result()
+            except Exception as e:
+                logger.error(f"Error collecting comments for post {post_obj.post_id} from r/{post_obj.subreddit}: {str(e)}")
+                logger.error(traceback.format_exc())
+                continue
+            self._store(post_obj, comments, listing)
+
+    def _run_concurrent(self):
+        """
+        Walks the listings on the calling thread and fetches comment trees on a bounded
+        worker pool. Results are stored (and checkpointed) on the calling thread as they finish.
+        """
+        max_in_flight = self.max_workers * 4
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+            for sub in tqdm(self.subreddits, desc="Subreddits"):
+                for listing, post in self._listings(sub):
+                    try:
+                        post_obj = self._build_post(post, sub)
+                    except Exception as e:
+                        logger.error(f"Error collecting post {post.id} from r/{sub}: {str(e)}")
+                        continue
+                    if post_obj is None:
+                        continue
+                    future = pool.submit(self._fetch_comments, post, sub, self._seen_comment_ids(post.id))
+                    futures[future] = (post_obj, listing)
+                    self._drain(futures, block=len(futures) >= max_in_flight)
+
+            while futures:
+                self._drain(futures, block=True)
 
     def _run(self):
         """
         Runs the Reddit scraper to collect posts and comments.
         """
-        logger.info("Starting Reddit scraping...")
-        for sub in tqdm(self.subreddits, desc="Subreddits"):
-            subreddit = self.reddit.subreddit(sub)
-            for post in tqdm(subreddit.top(time_filter="month", limit=self.top_limit), desc=f"Top posts in r/{sub}"):
-                self._collect_post_and_comments(post, sub)
-            for post in tqdm(subreddit.hot(limit=self.hot_limit), desc=f"Hot posts in r/{sub}"):
-                self._collect_post_and_comments(post, sub)
-        logger.info("Collected %d posts and %d comments", len(self.posts), len(self.comments))
-        self.posts, self.comments = self.add_top_comments(self.posts, self.comments, n=10)
+        logger.info("Starting Reddit scraping with %d worker(s)...", self.max_workers)
+        if self.max_workers > 1:
+            self._run_concurrent()
+        else:
+            for sub in tqdm(self.subreddits, desc="Subreddits"):
+                for listing, post in self._listings(sub):
+                    self._collect_post_and_comments(post, sub, listing)
+        if self.checkpoint is not None:
+            self.checkpoint.flush()
+        logger.info("Collected %d posts and %d comments (%d unchanged posts skipped)", len(self.posts), self.n_comments, self.skipped_unchanged)
+        for post in self.posts:
+            post.top_comments = self.streamed_top_comments(post.post_id)
+        self.posts, self.comments = posts_batch(self.posts), comments_batch(self.comments)
 
     def get_results(self):
         """
-        Returns the collected posts and comments as DataFrames.
+        Returns the collected posts and comments as batches. With a checkpoint, comments were
+        handed to storage as they were flushed and the comments batch is empty.
         """
         return self.posts, self.comments
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+from src import config
+from src.logger import setup_logger
+
+logger = setup_logger("Reducer")
+
+
+def chunk_bounds(n: int, chunk_size: int, min_rows: int = 1):
+    """
+    (start, stop) row ranges of at most `chunk_size` rows; a last chunk smaller than `min_rows`
+    is merged into the one before it.
+    """
+    bounds = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+    if len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < min_rows:
+        bounds[-2:] = [(bounds[-2][0], n)]
+    return bounds
+
+
+def fit_reducer(embeddings, n_components: int = config.PCA_COMPONENTS, chunk_size: int = config.REDUCE_CHUNK_SIZE):
+    """
+    Fits a StandardScaler and an IncrementalPCA chunk by chunk, so only one float32 chunk of
+    `embeddings` is scaled at a time instead of a scaled copy of the whole matrix. Rows are read
+    by slicing, so a memory-mapped `.npy` works too. Returns (scaler, pca).
+    """
+    n = len(embeddings)
+    n_components = min(n_components, n, embeddings.shape[1])
+    bounds = chunk_bounds(n, max(chunk_size, n_components), min_rows=n_components)
+    scaler = StandardScaler()
+    for start, stop in bounds:
+        scaler.partial_fit(np.asarray(embeddings[start:stop], dtype=np.float32))
+    pca = IncrementalPCA(n_components=n_components)
+    for start, stop in bounds:
+        pca.partial_fit(scaler.transform(np.asarray(embeddings[start:stop], dtype=np.float32)))
+    logger.info("Fitted scaler and incremental PCA (%d components, %.1f%% variance) over %d rows in %d chunk(s)",
+                n_components, 100 * pca.explained_variance_ratio_.sum(), n, len(bounds))
+    return scaler, pca
+
+
+def transform(embeddings, scaler, pca, out_path: str | None = None, chunk_size: int = config.REDUCE_CHUNK_SIZE) -> np.ndarray:
+    """
+    Reduces `embeddings` chunk by chunk into a float32 matrix, written to an `.npy` memmap at
+    `out_path` when given (otherwise kept in memory).
+    """
+    shape = (len(embeddings), pca.n_components_)
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        # Written beside the old file and swapped in, so a matrix still mapped from the last run stays valid
+        reduced = np.lib.format.open_memmap(out_path + ".tmp", mode="w+", dtype=np.float32, shape=shape)
+    else:
+        reduced = np.empty(shape, dtype=np.float32)
+    for start, stop in chunk_bounds(len(embeddings), chunk_size):
+        reduced[start:stop] = pca.transform(scaler.transform(np.asarray(embeddings[start:stop], dtype=np.float32)))
+    if out_path:
+        reduced.flush()
+        os.replace(out_path + ".tmp", out_path)
+    return reduced
+
@@ -1,98 +1,479 @@
 import os
+import csv
 import json
 import sqlite3
 import traceback
-from dataclasses import asdict
+from dataclasses import fields, is_dataclass
+from datetime import datetime
 from src.logger import setup_logger
+from src.batches import to_batch, from_arrow, arrow_schema, as_list, LIST_COLUMNS, INT_COLUMNS, LABEL_COLUMNS
 import pandas as pd
 
 logger = setup_logger()
 
+POSTS_FILE = "reddit_posts"
+COMMENTS_FILE = "reddit_comments"
+CHUNK_SIZE = 10_000
+
+
+def _record(obj) -> dict:
+    """
+    Shallow dict view of a Post/Comment (or an already-dict row), without asdict's deep copies.
+    """
+    if is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in fields(obj)}
+    return dict(obj)
+
+
+def _json_default(value):
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _chunks(records, size=CHUNK_SIZE):
+    if isinstance(records, pd.DataFrame):
+        for start in range(0, len(records), size):
+            yield records.iloc[start:start + size].to_dict(orient="records")
+        return
+    chunk = []
+    for r in records:
+        chunk.append(_record(r))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def append_jsonl(records, path, chunk_size=CHUNK_SIZE):
+    """
+    Appends a batch or Post/Comment records to a JSON Lines file, one write per chunk. Returns the number written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    n = 0
+    with open(path, "a", encoding="utf-8") as f:
+        for chunk in _chunks(records, chunk_size):
+            f.write("".join(json.dumps(r, ensure_ascii=False, default=_json_default) + "\n" for r in chunk))
+            n += len(chunk)
+    return n
+
+
+def append_csv(records, path, chunk_size=CHUNK_SIZE):
+    """
+    Appends a batch or Post/Comment records to a CSV file in chunks, writing the header only if the file is new.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    n = 0
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = None
+        for chunk in _chunks(records, chunk_size):
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(chunk[0].keys()))
+                if write_header:
+                    writer.writeheader()
+            writer.writerows(chunk)
+            n += len(chunk)
+    return n
+
+
+def _columnar_value(column, value):
+    if column in LIST_COLUMNS:
+        return as_list(value)
+    if column in INT_COLUMNS or column in LABEL_COLUMNS:
+        # cluster_labels defaults to an empty list on unclustered posts
+        if isinstance(value, (list, tuple)) or value is None or pd.isna(value):
+            return None
+        return int(value)
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return value.isoformat() if isinstance(value, pd.Timestamp) else str(value)
+
+
+class SnapshotWriter:
+    """
+    Streams batches into a snapshot file that replaces `path` only once every batch is written,
+    so readers never see a half-written file and a failed run leaves the old snapshot in place.
+    The format follows the extension: `.parquet`/`.feather` (typed columnar, see `write_columnar`)
+    or `.csv`. Later batches are conformed to the columns of the first one. Nothing is replaced
+    if no rows were written.
+
+        with SnapshotWriter("data/reddit_posts.parquet") as snapshot:
+            for batch in batches:
+                snapshot.write(batch)
+    """
+    def __init__(self, path, chunk_size=CHUNK_SIZE * 5):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.columns = None
+        self._writer = None
+        self._schema = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # A .tmp left by an interrupted run would otherwise be appended to
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def write(self, records):
+        batch = to_batch(records, self.columns)
+        if len(batch) == 0:
+            return
+        self.columns = list(batch.columns)
+        if self.path.endswith(".csv"):
+            append_csv(batch, self.tmp_path, self.chunk_size)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._writer is None:
+                self._schema = arrow_schema(list(batch.columns))
+                self._writer = (pa.ipc.new_file(self.tmp_path, self._schema) if self.path.endswith(".feather")
+                                else pq.ParquetWriter(self.tmp_path, self._schema))
+            for start in range(0, len(batch), self.chunk_size):
+                self._writer.write_table(pa.Table.from_pandas(batch.iloc[start:start + self.chunk_size],
+                                                              schema=self._schema, preserve_index=False))
+        self.rows += len(batch)
+
+    def close(self, commit=True):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if commit and self.rows:
+            os.replace(self.tmp_path, self.path)
+            logger.info("Wrote %d records to %s", self.rows, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(commit=exc_type is None)
+
+
+def write_columnar(records, path, chunk_size=CHUNK_SIZE * 5):
+    """
+    Writes a batch (or Post/Comment records) as a typed columnar snapshot, chunk by chunk: names
+    are dictionary-encoded, timestamps and lists keep their types. The format follows the
+    extension: `.parquet` (default) or `.feather` (Arrow IPC). The snapshot is written to a temp
+    file and swapped in, so readers never see a half-written file.
+    """
+    with SnapshotWriter(path, chunk_size) as snapshot:
+        snapshot.write(records)
+    return snapshot.rows
+
+
+def load_columnar(path, columns=None):
+    """
+    Loads a columnar snapshot as a batch (see src/batches.py), reading only `columns` when given.
+    """
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    if path.endswith(".feather"):
+        table = feather.read_table(path, columns=columns)
+    else:
+        table = pq.read_table(path, columns=columns)
+    # Snapshots written before batches stored every column as a string
+    return to_batch(from_arrow(table))
+
+
+def iter_snapshot(path, chunk_size=CHUNK_SIZE * 5):
+    """
+    Yields a snapshot (`.parquet`, `.feather` or `.csv`) as batches of at most `chunk_size` rows,
+    so it can be streamed through without loading it whole.
+    """
+    if path.endswith(".csv"):
+        for chunk in pd.read_csv(path, chunksize=chunk_size):
+            yield to_batch(chunk)
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if path.endswith(".feather"):
+        reader = pa.ipc.open_file(path)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_size)
+    for batch in batches:
+        yield to_batch(from_arrow(pa.Table.from_batches([batch])))
+
+
 def save_json(posts = None, comments = None, save_dir="data"):
+    """
+    Writes posts/comments as JSON arrays, streamed record by record instead of built up in memory.
+    """
     os.makedirs(save_dir, exist_ok=True)
-    if posts is not None:
-        def convert_timestamps(obj):
-            d = asdict(obj)
-            for k, v in d.items():
-                if isinstance(v, pd.Timestamp):
-                    d[k] = v.isoformat()
-            return d
-        with open(f"{save_dir}/reddit_posts.json", "w", encoding="utf-8") as f:
-            json.dump([convert_timestamps(p) for p in posts], f, indent=2, ensure_ascii=False)
-    if comments is not None:
-        with open(f"{save_dir}/reddit_comments.json", "w", encoding="utf-8") as f:
-            json.dump([asdict(c) for c in comments], f, indent=2, ensure_ascii=False)
+    for records, name in [(posts, POSTS_FILE), (comments, COMMENTS_FILE)]:
+        if records is None:
+            continue
+        with open(f"{save_dir}/{name}.json", "w", encoding="utf-8") as f:
+            f.write("[")
+            first = True
+            for chunk in _chunks(records):
+                body = ",\n".join(json.dumps(r, ensure_ascii=False, default=_json_default) for r in chunk)
+                f.write(("\n" if first else ",\n") + body)
+                first = False
+            f.write("\n]")
 
 def save_csv(posts = None, comments = None, save_dir="data"):
+    """
+    Rewrites the posts/comments CSV files, streamed in chunks. Use `append_csv` to add rows instead.
+    """
     os.makedirs(save_dir, exist_ok=True)
-    if posts is not None:
-        pd.DataFrame([asdict(p) for p in posts]).to_csv(f"{save_dir}/reddit_posts.csv", index=False)
-    if comments is not None:
-        pd.DataFrame([asdict(c) for c in comments]).to_csv(f"{save_dir}/reddit_comments.csv", index=False)
+    for records, name in [(posts, POSTS_FILE), (comments, COMMENTS_FILE)]:
+        if records is None:
+            continue
+        path = f"{save_dir}/{name}.csv"
+        # A .tmp left by an interrupted run would otherwise be appended to
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        append_csv(records, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+POST_COLUMNS = [
+    "post_id", "subreddit", "author", "title", "selftext", "score", "num_comments",
+    "created_utc", "flair", "url", "collection_date", "tags", "top_comments"
+]
+COMMENT_COLUMNS = [
+    "comment_id", "post_id", "subreddit", "author", "body", "score",
+    "created_utc", "parent_id", "collection_date"
+]
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS posts (
+        post_id TEXT PRIMARY KEY,
+        subreddit TEXT,
+        author TEXT,
+        title TEXT,
+        selftext TEXT,
+        score INTEGER,
+        num_comments INTEGER,
+        created_utc TEXT,
+        flair TEXT,
+        url TEXT,
+        collection_date TEXT,
+        tags TEXT
+    );
+    CREATE TABLE IF NOT EXISTS comments (
+        comment_id TEXT PRIMARY KEY,
+        post_id TEXT,
+        subreddit TEXT,
+        author TEXT,
+        body TEXT,
+        score INTEGER,
+        created_utc TEXT,
+        parent_id TEXT,
+        collection_date TEXT,
+        FOREIGN KEY(post_id) REFERENCES posts(post_id)
+    );
+    CREATE TABLE IF NOT EXISTS cluster_assignments (
+        post_id TEXT PRIMARY KEY,
+        cluster_label INTEGER,
+        assigned_at TEXT,
+        FOREIGN KEY(post_id) REFERENCES posts(post_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_posts_subreddit_created ON posts(subreddit, created_utc);
+    CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created_utc);
+    CREATE INDEX IF NOT EXISTS idx_posts_author ON posts(author);
+    CREATE INDEX IF NOT EXISTS idx_comments_post ON comments(post_id);
+    CREATE INDEX IF NOT EXISTS idx_comments_subreddit_created ON comments(subreddit, created_utc);
+    CREATE INDEX IF NOT EXISTS idx_comments_author ON comments(author);
+    CREATE INDEX IF NOT EXISTS idx_clusters_label ON cluster_assignments(cluster_label);
+"""
+
+
+def _sql_time(value):
+    """
+    Normalizes timestamps to ISO-8601 text so range queries compare correctly as strings.
+    """
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return pd.Timestamp(value).isoformat()
+
+
+def _upsert_sql(table, columns, key):
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != key)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT({key}) DO UPDATE SET {updates}"
+    )
+
+
+class SQLiteStore:
+    """
+    SQLite storage engine for posts, comments and cluster assignments.
+
+    Runs in WAL mode so readers are not blocked by the writer, upserts in batches with
+    `ON CONFLICT DO UPDATE` (scores, tags and cluster labels are written back), and
+    exposes windowed queries that return DataFrames.
+    """
+    def __init__(self, db_path="data/reddit_data.db"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Older databases predate the top_comments column
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(posts)")}
+        if "top_comments" not in existing:
+            self.conn.execute("ALTER TABLE posts ADD COLUMN top_comments TEXT")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def upsert_posts(self, posts, batch_size=CHUNK_SIZE):
+        sql = _upsert_sql("posts", POST_COLUMNS, "post_id")
+        assignments = []
+        n = 0
+        with self.conn:
+            for chunk in _chunks(posts, batch_size):
+                rows = []
+                for p in chunk:
+                    rows.append((
+                        p["post_id"], p["subreddit"], p["author"], p["title"], p["selftext"],
+                        p["score"], p["num_comments"], _sql_time(p["created_utc"]), p["flair"], p["url"],
+                        _sql_time(p["collection_date"]),
+                        json.dumps(_columnar_value("tags", p.get("tags"))),
+                        json.dumps(_columnar_value("top_comments", p.get("top_comments"))),
+                    ))
+                    label = _columnar_value("cluster_labels", p.get("cluster_labels"))
+                    if label is not None:
+                        assignments.append((p["post_id"], label))
+                self.conn.executemany(sql, rows)
+                n += len(rows)
+        if assignments:
+            self.save_cluster_assignments([a[0] for a in assignments], [a[1] for a in assignments])
+        return n
+
+    def upsert_comments(self, comments, batch_size=CHUNK_SIZE):
+        sql = _upsert_sql("comments", COMMENT_COLUMNS, "comment_id")
+        n = 0
+        with self.conn:
+            for chunk in _chunks(comments, batch_size):
+                rows = [
+                    tuple(_sql_time(c[k]) if k in ("created_utc", "collection_date") else c[k] for k in COMMENT_COLUMNS)
+                    for c in chunk
+                ]
+                self.conn.executemany(sql, rows)
+                n += len(rows)
+        return n
+
+    def save_cluster_assignments(self, post_ids, labels):
+        now = datetime.utcnow().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                _upsert_sql("cluster_assignments", ["post_id", "cluster_label", "assigned_at"], "post_id"),
+                [(str(pid), int(label), now) for pid, label in zip(post_ids, labels)]
+            )
+
+    def _where(self, alias, subreddit=None, author=None, start=None, end=None, post_ids=None):
+        clauses, params = [], []
+        if subreddit is not None:
+            subs = [subreddit] if isinstance(subreddit, str) else list(subreddit)
+            clauses.append(f"{alias}.subreddit IN ({', '.join('?' for _ in subs)})")
+            params.extend(subs)
+        if author is not None:
+            clauses.append(f"{alias}.author = ?")
+            params.append(author)
+        if start is not None:
+            clauses.append(f"{alias}.created_utc >= ?")
+            params.append(_sql_time(start))
+        if end is not None:
+            clauses.append(f"{alias}.created_utc < ?")
+            params.append(_sql_time(end))
+        if post_ids is not None:
+            post_ids = [str(p) for p in post_ids]
+            clauses.append(f"{alias}.post_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(post_ids))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def post_id_chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yields the stored post ids in lists of at most `chunk_size`, paging by key so no query
+        holds more than one chunk.
+        """
+        last = ""
+        while True:
+            ids = [row[0] for row in self.conn.execute(
+                "SELECT post_id FROM posts WHERE post_id > ? ORDER BY post_id LIMIT ?", (last, chunk_size))]
+            if not ids:
+                return
+            yield ids
+            last = ids[-1]
+
+    def query_posts(self, subreddit=None, start=None, end=None, author=None, post_ids=None, columns=None):
+        """
+        Posts in `subreddit` (name or list) created in [start, end), optionally restricted to an
+        author or to `post_ids`, joined with their cluster label, as a batch (see src/batches.py).
+        `columns` restricts the projection.
+        """
+        columns = columns or POST_COLUMNS + ["cluster_labels"]
+        select = ", ".join(
+            "c.cluster_label AS cluster_labels" if col == "cluster_labels" else f"p.{col}"
+            for col in columns
+        )
+        where, params = self._where("p", subreddit=subreddit, author=author, start=start, end=end, post_ids=post_ids)
+        sql = f"SELECT {select} FROM posts p LEFT JOIN cluster_assignments c ON c.post_id = p.post_id{where}"
+        return to_batch(pd.read_sql_query(sql, self.conn, params=params))
+
+    def query_comments(self, subreddit=None, start=None, end=None, author=None, post_ids=None, columns=None):
+        """
+        Comments in `subreddit` created in [start, end), optionally restricted to an author or to `post_ids`, as a batch.
+        """
+        select = ", ".join(f"m.{col}" for col in (columns or COMMENT_COLUMNS))
+        where, params = self._where("m", subreddit=subreddit, author=author, start=start, end=end, post_ids=post_ids)
+        return to_batch(pd.read_sql_query(f"SELECT {select} FROM comments m{where}", self.conn, params=params))
+
 
 def save_sqlite(posts = None, comments = None, db_path="data/reddit_data.db"):
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path, timeout=30)
     try:
-        cur = conn.cursor()
-        if posts is not None:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS posts (
-                    post_id TEXT PRIMARY KEY,
-                    subreddit TEXT,
-                    author TEXT,
-                    title TEXT,
-                    selftext TEXT,
-                    score INTEGER,
-                    num_comments INTEGER,
-                    created_utc TEXT,
-                    flair TEXT,
-                    url TEXT,
-                    collection_date TEXT,
-                    tags TEXT
-                )
-            """)
-            post_tuples = [
-                (
-                    p.post_id,
-                    p.subreddit,
-                    p.author,
-                    p.title,
-                    p.selftext,
-                    p.score,
-                    p.num_comments,
-                    str(p.created_utc) if isinstance(p.created_utc, pd.Timestamp) else p.created_utc,
-                    p.flair,
-                    p.url,
-                    str(p.collection_date) if isinstance(p.collection_date, pd.Timestamp) else p.collection_date,
-                    json.dumps(p.tags)
-                )
-                for p in posts
-            ]    
-            cur.executemany("INSERT OR IGNORE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", post_tuples)
-
-        if comments is not None:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS comments (
-                    comment_id TEXT PRIMARY KEY,
-                    post_id TEXT,
-                    subreddit TEXT,
-                    author TEXT,
-                    body TEXT,
-                    score INTEGER,
-                    created_utc TEXT,
-                    parent_id TEXT,
-                    collection_date TEXT,
-                    FOREIGN KEY(post_id) REFERENCES posts(post_id)
-                )
-            """)
-
-            comment_tuples = [tuple(asdict(c).values()) for c in comments]
-            cur.executemany("INSERT OR IGNORE INTO comments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", comment_tuples)
-
-        conn.commit()
+        with SQLiteStore(db_path) as store:
+            if posts is not None:
+                store.upsert_posts(posts)
+            if comments is not None:
+                store.upsert_comments(comments)
     except Exception as e:
-        logger.error("Error saving data to SQLite...\n %s", traceback.print_exc)
+        logger.error("Error saving data to SQLite...\n %s", traceback.format_exc())
         raise e
-    finally:
-        conn.close()
\ No newline at end of file
+
+
+def save_cluster_assignments(post_ids, labels, db_path="data/reddit_data.db"):
+    with SQLiteStore(db_path) as store:
+        store.save_cluster_assignments(post_ids, labels)
+
+
+def query_posts(db_path="data/reddit_data.db", **filters):
+    """
+    See `SQLiteStore.query_posts`, e.g. `query_posts(db, subreddit="politics", start=t0, end=t1)`.
+    """
+    with SQLiteStore(db_path) as store:
+        return store.query_posts(**filters)
+
+
+def query_comments(db_path="data/reddit_data.db", **filters):
+    """
+    See `SQLiteStore.query_comments`.
+    """
+    with SQLiteStore(db_path) as store:
+        return store.query_comments(**filters)
+
+
+def load_sqlite(db_path="data/reddit_data.db"):
+    """
+    Loads the full posts and comments tables as batches.
+    """
+    with SQLiteStore(db_path) as store:
+        return store.query_posts(), store.query_comments()
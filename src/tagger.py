@@ -1,44 +1,163 @@
+import re
+import json
+import numpy as np
+import pandas as pd
 from typing import List
 
-def tag_post(post) -> List[str]:
-    tags = []
+from src import config
+
+# Tags come out in this order; lexicon tags not listed here follow in lexicon-file order
+TAG_ORDER = [
+    "potential_misinfo", "conspiracy", "high_engagement", "low_engagement", "deleted_author",
+    "likely_satire", "political", "theory_drop", "url_only",
+]
+
+
+def _overlapping(keywords) -> bool:
+    """
+    True if one keyword can start inside another match (a substring, or a suffix that is also a prefix).
+    """
+    for a in keywords:
+        for b in keywords:
+            if a != b and (b in a or any(a.endswith(b[:i]) for i in range(1, len(b)))):
+                return True
+    return False
+
+
+def _combined_pattern(keywords) -> re.Pattern | None:
+    """
+    Compiles a keyword list into one regex. If keywords can overlap, a lookahead makes every
+    start position a candidate so all of them are still found in a single scan; otherwise a
+    plain (faster) alternation is used.
+    """
+    keywords = sorted({k.lower() for k in keywords}, key=len, reverse=True)
+    if not keywords:
+        return None
+    alternation = "|".join(re.escape(k) for k in keywords)
+    if _overlapping(keywords):
+        return re.compile("(?=(" + alternation + "))")
+    return re.compile(alternation)
+
+
+class Tagger:
+    """
+    Batch tagging engine. The lexicon file maps each tag to `keywords` (matched in title/body or
+    comment body), `flair` keywords and/or `subreddits`. All keywords are compiled once into a
+    single multi-pattern regex, and every rule is evaluated column-wise over a DataFrame.
+    """
+    def __init__(self, lexicon_path: str = config.LEXICON_PATH):
+        with open(lexicon_path, encoding="utf-8") as f:
+            self.lexicon = json.load(f)
+        self.tags = list(TAG_ORDER) + [t for t in self.lexicon if t not in TAG_ORDER]
 
-    title = (post.title or "").lower()
-    body = (post.selftext or "").lower()
-    flair = (post.flair or "").lower()
+        self.keyword_tags = self._invert("keywords")
+        self.flair_tags = self._invert("flair")
+        self.keyword_pattern = _combined_pattern(self.keyword_tags)
+        self.flair_pattern = _combined_pattern(self.flair_tags)
+        self.subreddit_tags = {
+            tag: {s.lower() for s in rules.get("subreddits", [])} for tag, rules in self.lexicon.items()
+        }
 
-    conspiracy_keywords = ["deep state", "hoax", "false flag", "great reset", "illuminati"]
-    misinfo_keywords = ["5g", "plandemic", "bioweapon", "graphene", "cancer cure", "chemtrails"]
+    def _invert(self, kind: str) -> dict[str, list[str]]:
+        inverted = {}
+        for tag, rules in self.lexicon.items():
+            for kw in rules.get(kind, []):
+                inverted.setdefault(kw.lower(), []).append(tag)
+        return inverted
 
-    if any(kw in title or kw in body for kw in misinfo_keywords):
-        tags.append("potential_misinfo")
-    
-    if any(kw in title or kw in body for kw in conspiracy_keywords):
-        tags.append("conspiracy")
+    def _match(self, text: pd.Series, pattern: re.Pattern | None, kw_tags: dict) -> dict[str, pd.Series]:
+        """
+        Runs one combined pattern over a lowercase text column and returns a boolean mask per tag.
+        """
+        masks = {}
+        if pattern is None or len(text) == 0:
+            return masks
+        hits = text.reset_index(drop=True).str.findall(pattern).explode().dropna()
+        hits = hits.map(kw_tags).explode()
+        for tag, rows in hits.groupby(hits).groups.items():
+            mask = np.zeros(len(text), dtype=bool)
+            mask[np.asarray(rows)] = True
+            masks[tag] = mask
+        return masks
 
-    if post.subreddit.lower() == "conspiracy":
-        tags.append("conspiracy")
+    def _assemble(self, index, masks: dict[str, pd.Series]) -> pd.Series:
+        columns = [t for t in self.tags if t in masks]
+        if not columns:
+            return pd.Series([[] for _ in range(len(index))], index=index, dtype=object)
+        matrix = np.column_stack([np.asarray(masks[t], dtype=bool) for t in columns])
+        names = np.array(columns, dtype=object)
+        # Rows with the same tag combination share one list-building step
+        combos, inverse = np.unique(matrix, axis=0, return_inverse=True)
+        tag_lists = [names[c].tolist() for c in combos]
+        return pd.Series([list(tag_lists[i]) for i in inverse.ravel()], index=index, dtype=object)
 
-    if post.num_comments > 300 or post.score > 1000:
-        tags.append("high_engagement")
+    def _lexicon_masks(self, text: pd.Series, flair: pd.Series | None, subreddit: pd.Series) -> dict:
+        masks = self._match(text, self.keyword_pattern, self.keyword_tags)
+        if flair is not None:
+            for tag, mask in self._match(flair, self.flair_pattern, self.flair_tags).items():
+                masks[tag] = masks[tag] | mask if tag in masks else mask
+        subreddit = subreddit.astype(object).fillna("").str.lower()
+        for tag, subs in self.subreddit_tags.items():
+            if subs:
+                mask = subreddit.isin(subs).to_numpy()
+                masks[tag] = masks[tag] | mask if tag in masks else mask
+        return masks
 
-    if post.num_comments < 5 and post.score < 5:
-        tags.append("low_engagement")
+    def tag_posts(self, posts: pd.DataFrame) -> pd.Series:
+        """
+        Returns a `tags` column (list of tags per row) for a posts DataFrame.
+        """
+        title = posts["title"].fillna("").astype(str).str.lower()
+        selftext = posts["selftext"].fillna("").astype(str)
+        body = selftext.str.lower()
+        flair = posts["flair"].fillna("").astype(str).str.lower()
+        # "\n" never occurs inside a keyword, so no match can span title and body
+        masks = self._lexicon_masks(title + "\n" + body, flair, posts["subreddit"])
 
-    if "[deleted]" in post.author.lower():
-        tags.append("deleted_author")
+        num_comments, score = posts["num_comments"], posts["score"]
+        stripped_len = selftext.str.strip().str.len()
+        masks["high_engagement"] = ((num_comments > 300) | (score > 1000)).to_numpy()
+        masks["low_engagement"] = ((num_comments < 5) & (score < 5)).to_numpy()
+        masks["deleted_author"] = posts["author"].astype(object).fillna("").astype(str).str.lower().str.contains("[deleted]", regex=False).to_numpy()
+        masks["theory_drop"] = (stripped_len > 1000).to_numpy()
+        masks["url_only"] = (stripped_len == 0).to_numpy()
+        return self._assemble(posts.index, masks)
 
-    if "satire" in flair or "joke" in flair:
-        tags.append("likely_satire")
+    def tag_comments(self, comments: pd.DataFrame) -> pd.Series:
+        """
+        Returns a `tags` column for a comments DataFrame (lexicon keywords, subreddits and deleted authors).
+        """
+        body = comments["body"].fillna("").astype(str).str.lower()
+        masks = self._lexicon_masks(body, None, comments["subreddit"])
+        masks["deleted_author"] = comments["author"].astype(object).fillna("").astype(str).str.lower().str.contains("[deleted]", regex=False).to_numpy()
+        return self._assemble(comments.index, masks)
 
-    if post.subreddit.lower() == "politics" or any(x in flair for x in ["dem", "gop", "liberal", "conservative"]):
-        tags.append("political")
 
-    if len(post.selftext.strip()) > 1000:
-        tags.append("theory_drop")
+_default_tagger = None
 
-    if post.selftext.strip() == "":
-        tags.append("url_only")
-        
-    post.tags = tags
+
+def get_tagger() -> Tagger:
+    global _default_tagger
+    if _default_tagger is None:
+        _default_tagger = Tagger()
+    return _default_tagger
+
+
+def tag_posts(posts: pd.DataFrame) -> pd.Series:
+    return get_tagger().tag_posts(posts)
+
+
+def tag_comments(comments: pd.DataFrame) -> pd.Series:
+    return get_tagger().tag_comments(comments)
+
+
+def tag_post(post) -> List[str]:
+    """
+    Tags a single Post in place (and returns it). Prefer `tag_posts` for whole DataFrames.
+    """
+    frame = pd.DataFrame([{
+        "title": post.title, "selftext": post.selftext, "flair": post.flair, "subreddit": post.subreddit,
+        "author": post.author, "num_comments": post.num_comments, "score": post.score,
+    }])
+    post.tags = tag_posts(frame).iloc[0]
     return post
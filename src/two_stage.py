@@ -0,0 +1,164 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from sklearn.cluster import HDBSCAN, MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+
+from src import config
+from src import metrics
+from src.logger import setup_logger
+from src.reducer import chunk_bounds
+
+logger = setup_logger("Two-Stage-Clustering")
+
+
+def micro_clusters(X, n_clusters: int, batch_size: int = config.MICRO_BATCH_SIZE, epochs: int = config.MICRO_EPOCHS,
+                   chunk_size: int = config.REDUCE_CHUNK_SIZE, seed: int = 0):
+    """
+    Compresses the rows of `X` (an array or a memmap, read chunk by chunk) into `n_clusters`
+    mini-batch k-means micro-clusters. Returns (assignments, centroids, counts), where the
+    centroids are the exact means of the rows assigned to each micro-cluster.
+    """
+    n, dim = X.shape
+    n_clusters = min(n_clusters, n)
+    # The first partial_fit draws the initial centres from its chunk; a chunk of several rows per
+    # centre spreads them by density instead of making nearly every row a centre
+    bounds = chunk_bounds(n, max(chunk_size, 3 * n_clusters), min_rows=n_clusters)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, init="random", n_init=1, random_state=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        for start, stop in bounds:
+            chunk = np.asarray(X[start:stop], dtype=np.float32)
+            if not hasattr(kmeans, "cluster_centers_"):
+                kmeans.partial_fit(chunk)  # initializes the centres from the whole first chunk
+                continue
+            for batch in np.array_split(rng.permutation(len(chunk)), max(1, len(chunk) // batch_size)):
+                kmeans.partial_fit(chunk[batch])
+
+    assignments = np.empty(n, dtype=np.int32)
+    sums = np.zeros((n_clusters, dim), dtype=np.float64)
+    for start, stop in bounds:
+        chunk = np.asarray(X[start:stop], dtype=np.float32)
+        assignments[start:stop] = kmeans.predict(chunk)
+        for d in range(dim):
+            sums[:, d] += np.bincount(assignments[start:stop], weights=chunk[:, d], minlength=n_clusters)
+    counts = np.bincount(assignments, minlength=n_clusters)
+    centroids = (sums / np.maximum(counts, 1)[:, None]).astype(np.float32)
+    return assignments, centroids, counts
+
+
+def _distances(A: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    Euclidean distances between the rows of `A` and `B`.
+    """
+    squared = (A ** 2).sum(axis=1)[:, None] + (B ** 2).sum(axis=1)[None, :] - 2 * A @ B.T
+    return np.sqrt(np.maximum(squared, 0))
+
+
+def knn_graph(X, assignments: np.ndarray, centroids: np.ndarray, counts: np.ndarray,
+              n_neighbors: int = config.TWO_STAGE_NEIGHBORS, n_probe: int = config.TWO_STAGE_PROBE,
+              chunk_size: int = 1024) -> sparse.csr_matrix:
+    """
+    Symmetric sparse graph of each post's `n_neighbors` nearest posts (itself excluded), with the
+    micro-clusters as the index: a post's neighbours are searched among the members of the
+    `n_probe` micro-clusters whose centroids are nearest its own. Rows of `X` are read by index,
+    one micro-cluster at a time, so a memmap works too. Zero distances (duplicate posts) are
+    stored as a tiny positive value, since a sparse graph drops zeros.
+    """
+    n = len(X)
+    used = np.flatnonzero(counts > 0)
+    order = np.argsort(assignments, kind="stable")
+    starts = np.searchsorted(assignments[order], np.arange(len(counts) + 1))
+    index = NearestNeighbors(n_neighbors=min(n_probe, len(used))).fit(centroids[used])
+    _, nearest = index.kneighbors(centroids[used])
+
+    rows, cols, dists = [], [], []
+    for i, micro in enumerate(used):
+        probed = used[nearest[i]]
+        if counts[probed].sum() <= n_neighbors:
+            # Too few posts nearby: widen the search until there are enough candidates
+            _, wider = index.kneighbors(centroids[micro][None], n_neighbors=len(used))
+            probed = used[wider[0]]
+            probed = probed[:np.searchsorted(np.cumsum(counts[probed]), n_neighbors + 1) + 1]
+        candidates = np.sort(np.concatenate([order[starts[m]:starts[m + 1]] for m in probed]))
+        candidate_rows = np.asarray(X[candidates], dtype=np.float32)
+        members = order[starts[micro]:starts[micro + 1]]
+        k = min(n_neighbors, len(candidates) - 1)
+        for begin in range(0, len(members), chunk_size):
+            queries = np.sort(members[begin:begin + chunk_size])
+            d = _distances(np.asarray(X[queries], dtype=np.float32), candidate_rows)
+            d[queries[:, None] == candidates[None, :]] = np.inf
+            closest = np.argpartition(d, k - 1, axis=1)[:, :k]
+            rows.append(np.repeat(queries, k))
+            cols.append(candidates[closest].ravel())
+            dists.append(np.take_along_axis(d, closest, axis=1).ravel())
+
+    data = np.maximum(np.concatenate(dists), 1e-10)
+    graph = sparse.csr_matrix((data, (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+    return graph.maximum(graph.T).tocsr()
+
+
+def connect_components(X, graph: sparse.csr_matrix) -> sparse.csr_matrix:
+    """
+    HDBSCAN needs a connected graph. Links disconnected components Boruvka-style: each round joins
+    every component to the nearest other one, by the distance between one representative post of
+    each (an upper bound on the real gap), which at least halves their number.
+    """
+    n_components, components = csgraph.connected_components(graph, directed=False)
+    links = 0
+    while n_components > 1:
+        _, representatives = np.unique(components, return_index=True)
+        points = np.asarray(X[representatives], dtype=np.float32)
+        dist, idx = NearestNeighbors(n_neighbors=2).fit(points).kneighbors(points)
+        # With duplicate representatives the nearest hit may not be the point itself
+        other = np.where(idx[:, 0] == np.arange(n_components), 1, 0)
+        nearest = idx[np.arange(n_components), other]
+        data = np.maximum(dist[np.arange(n_components), other], 1e-10)
+        edges = sparse.csr_matrix((data, (representatives, representatives[nearest])), shape=graph.shape)
+        graph = graph.maximum(edges).maximum(edges.T).tocsr()
+        links += n_components
+        n_components, components = csgraph.connected_components(graph, directed=False)
+    if links:
+        logger.info("Linked disconnected parts of the neighbour graph with %d edges", links)
+    return graph
+
+
+def two_stage_hdbscan(X, min_cluster_size: int = config.HDBSCAN_MIN_CLUSTER_SIZE, min_samples: int = config.HDBSCAN_MIN_SAMPLES,
+                      n_micro: int | None = None, n_neighbors: int = config.TWO_STAGE_NEIGHBORS,
+                      n_probe: int = config.TWO_STAGE_PROBE, seed: int = 0) -> np.ndarray:
+    """
+    Approximate HDBSCAN for corpora too large for one fit:
+
+    1. Mini-batch k-means compresses the posts into micro-clusters of about MICRO_CLUSTER_POSTS posts
+       (at most MICRO_CLUSTERS), streamed over chunks of `X`.
+    2. The micro-clusters serve as an approximate nearest-neighbour index: each post's
+       `n_neighbors` nearest posts are searched in the `n_probe` micro-clusters nearest its own.
+    3. HDBSCAN runs on that sparse neighbour graph with the exact path's `min_cluster_size` and
+       `min_samples`, so density is still measured post by post rather than per centroid.
+
+    Memory grows with `n_neighbors` edges per post instead of a dense distance computation.
+    """
+    n = len(X)
+    min_samples = min_samples or min_cluster_size
+    if n <= max(n_neighbors, min_samples, 2):
+        logger.warning("Too few posts (%d) for two-stage clustering; all marked as noise", n)
+        return np.full(n, -1, dtype=int)
+    n_micro = n_micro or min(config.MICRO_CLUSTERS, max(2, n // config.MICRO_CLUSTER_POSTS))
+    with metrics.stage("microclusters") as stage:
+        assignments, centroids, counts = micro_clusters(X, n_micro, seed=seed)
+        stage.items(posts=n)
+
+    with metrics.stage("knn_graph") as stage:
+        graph = connect_components(X, knn_graph(X, assignments, centroids, counts, n_neighbors, n_probe))
+        stage.items(posts=n)
+
+    # The graph leaves each post out of its own neighbours, so HDBSCAN's core distance (which
+    # counts the point itself) is the (min_samples - 1)-th stored neighbour
+    clusterer = HDBSCAN(min_cluster_size=min_cluster_size, min_samples=max(1, min(min_samples, n_neighbors) - 1),
+                        metric="precomputed")
+    with metrics.stage("hdbscan") as stage:
+        labels = clusterer.fit_predict(graph)
+        stage.items(posts=n)
+    logger.info("Two-stage clustering: %d posts -> %d micro-clusters (%d non-empty) -> %d clusters",
+                n, len(counts), np.count_nonzero(counts), len(set(labels.tolist()) - {-1}))
+    return labels
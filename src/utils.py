@@ -1,31 +1,80 @@
 import re
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Precompiled cleaning passes, applied in this order
+_URL = re.compile(r"http\S+|www\S+")
+_MD_LINK = re.compile(r"\[.*?\]\(.*?\)")
+_LOOSE_MD = re.compile(r"[`\*\[\]\(\)]")
+_NEWLINES = re.compile(r"\n{2,}")
+_SUBREDDIT = re.compile(r"r/\w+")
+_USER = re.compile(r"u/\w+")
+_WHITESPACE = re.compile(r"\s{2,}")
+
+# Batches at least this large are split across a process pool
+PARALLEL_MIN_BATCH = 50_000
+
 
 def clean_text(text: str) -> str:
+    """
+    Lowercases and strips URLs, markdown, r/ and u/ mentions and extra whitespace.
+    Passes whose trigger substring is absent are skipped.
+    """
     if not isinstance(text, str):
         return ""
 
     text = text.lower()
 
     # Remove URLs
-    text = re.sub(r"http\S+|www\S+", "", text)
+    if "http" in text or "www" in text:
+        text = _URL.sub("", text)
 
     # Remove markdown artifacts and brackets
-    text = re.sub(r"\[.*?\]\(.*?\)", "", text)  # markdown links
-    text = re.sub(r"[`\*\[\]\(\)]", "", text)   # loose markdown
-    text = re.sub(r"\n+", "\n", text)
+    if "](" in text:
+        text = _MD_LINK.sub("", text)  # markdown links
+    text = _LOOSE_MD.sub("", text)    # loose markdown
+    if "\n\n" in text:
+        text = _NEWLINES.sub("\n", text)
 
-    # Remove Reddit-specific patterns
-    text = re.sub(r"r\/\w+", "", text)
-    text = re.sub(r"u\/\w+", "", text)
-    text = re.sub(r"&amp;#x200B;", "", text)
+    # Remove Reddit-specific patterns. ("&amp;#x200B;" can never match lowercased text, so it is not removed)
+    if "r/" in text:
+        text = _SUBREDDIT.sub("", text)
+    if "u/" in text:
+        text = _USER.sub("", text)
 
     # Remove extra whitespace and short leftovers
-    text = re.sub(r"\s{2,}", " ", text)
+    text = _WHITESPACE.sub(" ", text)
     text = text.strip()
 
     return text
 
+
+def _clean_chunk(texts: list) -> list[str]:
+    return [clean_text(t) for t in texts]
+
+
+def clean_texts(texts, workers: int | None = None, chunk_size: int = 10_000):
+    """
+    Batch version of `clean_text` for a list or pandas Series (a Series comes back with the same index).
+    Batches of at least PARALLEL_MIN_BATCH texts are cleaned in chunks over `workers` processes
+    (all cores by default); pass `workers=1` to stay in-process.
+    """
+    import pandas as pd  # imported here so the CLI can start without pandas
+
+    values = texts.tolist() if isinstance(texts, pd.Series) else list(texts)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(values) >= PARALLEL_MIN_BATCH:
+        chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            cleaned = [t for chunk in pool.map(_clean_chunk, chunks) for t in chunk]
+    else:
+        cleaned = _clean_chunk(values)
+
+    if isinstance(texts, pd.Series):
+        return pd.Series(cleaned, index=texts.index, dtype=object)
+    return cleaned
+
+
 def ensure_all_dirs():
     for var, val in globals().items():
         # Regex: variable name ends with "DIR" (case insensitive)
@@ -0,0 +1,49 @@
+import threading
+from dataclasses import dataclass, field
+
+from src.reddit_client import RedditClient
+
+
+@dataclass
+class FakeComment:
+    id: str
+    body: str
+    score: int = 1
+    author: str = "commenter"
+    created_utc: float = 1_750_000_000.0
+    parent_id: str = ""
+
+
+@dataclass
+class FakeSubmission:
+    id: str
+    title: str
+    created_utc: float
+    score: int = 100
+    num_comments: int = 50
+    selftext: str = ""
+    author: str = "poster"
+    link_flair_text: str | None = None
+    url: str = ""
+    comments: list[FakeComment] = field(default_factory=list)
+
+
+class FakeRedditClient(RedditClient):
+    """
+    In-memory Reddit: `listings` maps (subreddit, kind) to submissions in listing order.
+    Records every call, so tests can check what the scraper fetched.
+    """
+    def __init__(self, listings: dict[tuple[str, str], list[FakeSubmission]]):
+        self.listings = listings
+        self.listing_calls = []
+        self.comment_calls = []
+        self._lock = threading.Lock()
+
+    def listing(self, subreddit: str, kind: str, limit: int, **kwargs):
+        self.listing_calls.append((subreddit, kind, limit))
+        yield from self.listings.get((subreddit, kind), [])[:limit]
+
+    def fetch_comments(self, submission, limit: int):
+        with self._lock:
+            self.comment_calls.append(submission.id)
+        return list(submission.comments[:limit])
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import src.archive_ingest
+from src.archive_ingest import ingest_dumps
+from src.storage import SQLiteStore
+
+T0 = 1_735_689_600  # 2025-01-01
+
+
+def _write_dump(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+def _submission(i, subreddit="politics", score=50):
+    return {"id": f"s{i}", "subreddit": subreddit, "author": f"user{i % 7}", "title": f"Title {i}",
+            "selftext": "", "score": score, "num_comments": 20, "created_utc": T0 + i, "url": ""}
+
+
+def _comment(i, post_id, subreddit="politics"):
+    return {"id": f"c{i}", "link_id": f"t3_{post_id}", "subreddit": subreddit, "author": f"commenter{i % 5}",
+            "body": f"Comment {i}", "score": i % 9, "created_utc": T0 + 100 + i, "parent_id": f"t3_{post_id}"}
+
+
+def test_ingest_returns_the_posts_it_touched(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    posts = [_submission(i) for i in range(20)] + [_submission(20, subreddit="news"), _submission(21, score=1)]
+    comments = [_comment(i, f"s{i % 22}") for i in range(66)]
+    paths = [_write_dump(tmp_path / "RS_2025-01", posts), _write_dump(tmp_path / "RC_2025-01", comments)]
+
+    totals, post_ids = ingest_dumps(paths, db_path=db_path, subreddits=["politics"], min_score=10, min_comments=10, workers=1)
+    assert totals["posts"]["kept"] == 20
+    assert totals["comments"]["kept"] == 60  # comments of the filtered-out posts are dropped
+    assert post_ids == {f"s{i}" for i in range(20)}
+
+    # A later comments-only backfill touches just the stored posts it adds comments to
+    more = [_comment(100 + i, post_id) for i, post_id in enumerate(["s3", "s3", "s7", "s21", "missing"])]
+    totals, post_ids = ingest_dumps([_write_dump(tmp_path / "RC_2025-02", more)], db_path=db_path,
+                                    subreddits=["politics"], workers=1)
+    assert totals["comments"]["kept"] == 3
+    assert post_ids == {"s3", "s7"}
+    with SQLiteStore(db_path) as store:
+        assert len(store.query_comments(post_ids=["s3"])) == 5
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_blocks_parsed_in_parallel_match_one_process(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(src.archive_ingest, "READ_SIZE", 1024)  # many blocks per file
+    posts = [_submission(i, subreddit="politics" if i % 3 else "news") for i in range(300)]
+    lines = [json.dumps(p) for p in posts]
+    lines[10] = lines[10][:40]  # truncated line
+    path = tmp_path / "RS_2025-01"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    db_path = str(tmp_path / f"{workers}.db")
+
+    totals, post_ids = ingest_dumps([str(path)], db_path=db_path, subreddits=["politics"], min_score=10,
+                                    min_comments=10, workers=workers, batch_size=37)
+    assert totals["posts"]["lines"] == 300
+    assert totals["posts"]["bad_lines"] == 1
+    assert totals["posts"]["kept"] == 199
+    assert post_ids == {f"s{i}" for i in range(300) if i % 3 and i != 10}
+    with SQLiteStore(db_path) as store:
+        assert sorted(store.query_posts()["post_id"]) == sorted(post_ids)
@@ -0,0 +1,41 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from src import utils
+from src.utils import clean_text, clean_texts
+
+# Raw texts and the output of the original chained-regex clean_text, which the cleaner must keep
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "clean_text_corpus.json")
+
+with open(CORPUS_PATH, encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=range(len(CORPUS)))
+def test_clean_text_matches_baseline(case):
+    assert clean_text(case["raw"]) == case["expected"]
+
+
+@pytest.mark.parametrize("value", [None, float("nan"), 42])
+def test_clean_text_non_strings(value):
+    assert clean_text(value) == ""
+
+
+def test_clean_texts_list():
+    assert clean_texts([c["raw"] for c in CORPUS], workers=1) == [c["expected"] for c in CORPUS]
+
+
+def test_clean_texts_series_keeps_index():
+    raw = pd.Series([c["raw"] for c in CORPUS], index=range(100, 100 + len(CORPUS)))
+    cleaned = clean_texts(raw, workers=1)
+    assert cleaned.index.equals(raw.index)
+    assert cleaned.tolist() == [c["expected"] for c in CORPUS]
+
+
+def test_clean_texts_process_pool(monkeypatch):
+    monkeypatch.setattr(utils, "PARALLEL_MIN_BATCH", 1)
+    raw = [c["raw"] for c in CORPUS]
+    assert clean_texts(raw, workers=2, chunk_size=16) == [c["expected"] for c in CORPUS]
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from src import config
+from src.clustering import Clustering
+from src.models import Comment, Post
+
+
+def _posts(n):
+    return [
+        Post(post_id=f"p{i:03d}", subreddit="politics", author=f"user{i}", title=f"title {i}", selftext="",
+             score=100, num_comments=20, created_utc="2025-01-01T00:00:00", flair=None, url="",
+             collection_date="2025-01-02T00:00:00", top_comments=[f"comment on {i}"])
+        for i in range(n)
+    ]
+
+
+def _comments(n):
+    return [
+        Comment(comment_id=f"c{i:03d}", post_id=f"p{i:03d}", subreddit="politics", author="commenter",
+                body=f"comment on {i}", score=5, created_utc="2025-01-01T01:00:00", parent_id="",
+                collection_date="2025-01-02T00:00:00")
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def legacy_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the embedding store lives under ./embeddings
+    path = tmp_path / "legacy.npy"
+    np.save(path, np.random.default_rng(0).normal(size=(12, 16)).astype(np.float32))
+    return str(path)
+
+
+def test_legacy_embeddings_seed_legacy_pooling(legacy_file, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_POOLING", "legacy")
+    clustering = Clustering(_posts(12), _comments(12), embeddings_file=legacy_file)
+    # Served from the store: without torch installed, encoding would fail and return None
+    np.testing.assert_array_equal(clustering.post_embeddings(clustering.posts), np.load(legacy_file))
+
+
+def test_legacy_embeddings_rejected_for_pooled_vectors(legacy_file, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_POOLING", "title_comments")
+    with pytest.raises(ValueError, match="legacy"):
+        Clustering(_posts(12), _comments(12), embeddings_file=legacy_file)
+    # Without stored comments clustering falls back to legacy pooling, which the file does serve
+    clustering = Clustering(_posts(12), None, embeddings_file=legacy_file)
+    assert clustering.pooling == "legacy"
+
+
+def _duplicate_posts():
+    text = "the exact same copypasta text posted by several different accounts"
+    posts = _posts(4)
+    for i, post in enumerate(posts):
+        post.title = text if i < 3 else f"an unrelated title about something else entirely {i}"
+    return posts
+
+
+def test_duplicate_threshold_zero_is_kept(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    clustering = Clustering(_duplicate_posts(), None)
+    vectors = np.array([[1, 0], [1, 0], [1, 0], [0, 1]], dtype=np.float32)
+    monkeypatch.setattr(clustering, "create_embeddings", lambda texts, **kwargs: vectors[:len(list(texts))])
+    save_path = str(tmp_path / "groups.json")
+    assert [g["size"] for g in clustering.detect_near_duplicates(include_comments=False, save_path=save_path)] == [3]
+    # 0.0 links every pair of non-negative vectors; it must not fall back to DUPLICATE_THRESHOLD
+    assert [g["size"] for g in clustering.detect_near_duplicates(threshold=0.0, include_comments=False, save_path=save_path)] == [4]
+
+
+def test_duplicates_without_embeddings_return_early(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+    clustering = Clustering(_duplicate_posts(), None)
+    monkeypatch.setattr(clustering, "create_embeddings", lambda texts, **kwargs: None)  # embedding failed
+    save_path = tmp_path / "groups.json"
+    assert clustering.detect_near_duplicates(include_comments=False, save_path=str(save_path)) == []
+    assert "No post embeddings" in caplog.text
+    assert "Error detecting near-duplicates" not in caplog.text
+    assert not save_path.exists()
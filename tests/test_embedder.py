@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+import src.embedder as embedder  # noqa: E402
+
+
+class FakeModel:
+    """
+    Records how it was asked to encode; a quantized model must never reach the worker pool.
+    """
+    def __init__(self, quantized):
+        self.quantized = quantized
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append("encode")
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    def start_multi_process_pool(self, target_devices):
+        if self.quantized:
+            raise AssertionError("quantized model sent to worker processes")
+        self.calls.append("pool")
+        return object()
+
+    def encode_multi_process(self, texts, pool, **kwargs):
+        return self.encode(texts)
+
+    def stop_multi_process_pool(self, pool):
+        pass
+
+
+@pytest.fixture
+def models(monkeypatch):
+    models = {False: FakeModel(False), True: FakeModel(True)}
+    monkeypatch.setattr(embedder, "load_model", lambda model, quantize=False: models[quantize])
+    return models
+
+
+def test_quantized_model_encodes_in_one_process(models):
+    texts = [f"text number {i}" for i in range(embedder.PARALLEL_MIN_TEXTS)]
+    encoder = embedder.Embedder("model", workers=4, quantize=True, min_cosine=0.0)
+    vectors = encoder.encode(texts)
+    assert vectors.shape == (len(texts), 2)
+    assert "pool" not in models[True].calls and "pool" not in models[False].calls
+
+
+def test_rejected_quantization_uses_the_pool(models):
+    texts = [f"text number {i}" for i in range(embedder.PARALLEL_MIN_TEXTS)]
+    encoder = embedder.Embedder("model", workers=4, quantize=True, min_cosine=1.1)  # no int8 model passes
+    encoder.encode(texts)
+    assert not encoder.quantize
+    assert "pool" in models[False].calls
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from src.embedding_store import EmbeddingStore
+
+
+def _encode(texts):
+    # Deterministic vectors derived from the text, so any row can be checked after a merge
+    return np.array([[len(t), sum(map(ord, t)) % 97, hash(t) % 13] for t in texts], dtype=np.float32)
+
+
+def _shards(store):
+    return sorted(f for f in os.listdir(store.store_dir) if f.endswith(".npy"))
+
+
+def test_compact_streams_latest_rows_into_one_shard(tmp_path, monkeypatch):
+    store = EmbeddingStore("model", root=str(tmp_path))
+    store.get_or_create([f"p{i}" for i in range(20)], [f"text {i}" for i in range(20)], _encode)
+    edited = [f"p{i}" for i in range(0, 20, 2)]
+    store.get_or_create(edited, [f"edited {p}" for p in edited], _encode)
+    assert store.dead_rows() == 10 and len(_shards(store)) == 2
+
+    fetched = []
+    fetch = store.fetch
+    monkeypatch.setattr(store, "fetch", lambda ids, hashes: fetched.append(len(ids)) or fetch(ids, hashes))
+    store.compact(chunk_rows=6)
+    assert max(fetched) <= 6  # rows are copied chunk by chunk, never the whole store at once
+    assert len(store) == 20 and store.dead_rows() == 0
+    assert len(_shards(store)) == 1
+
+    reopened = EmbeddingStore("model", root=str(tmp_path))
+    texts = [f"edited p{i}" if i % 2 == 0 else f"text {i}" for i in range(20)]
+    ids = [f"p{i}" for i in range(20)]
+    np.testing.assert_array_equal(reopened.get_or_create(ids, texts, lambda texts: 1 / 0), _encode(texts))
+
+
+def test_writes_merge_shards_past_the_cap(tmp_path):
+    store = EmbeddingStore("model", root=str(tmp_path), max_shards=3)
+    for write in range(7):
+        ids = [f"p{write}_{i}" for i in range(4)]
+        texts = [f"text {write} {i}" for i in range(4)]
+        np.testing.assert_array_equal(store.get_or_create(ids, texts, _encode), _encode(texts))
+        assert len(_shards(store)) <= 3
+    assert len(store) == 28
+    everything = [(f"p{w}_{i}", f"text {w} {i}") for w in range(7) for i in range(4)]
+    ids, texts = zip(*everything)
+    np.testing.assert_array_equal(store.get_or_create(ids, texts, lambda texts: 1 / 0), _encode(texts))
@@ -0,0 +1,20 @@
+from src.keywords import KeywordExtractor
+
+TEXTS = ["tax cuts for the rich", "tax policy and the budget", "election fraud claims", "election results today"]
+LABELS = [0, 0, 1, 1]
+
+
+def test_vocabulary_cache_reused_for_same_corpus(tmp_path):
+    path = str(tmp_path / "vocab.joblib")
+    first = KeywordExtractor(min_df=1, vocab_path=path).cluster_keywords(TEXTS, LABELS)
+    extractor = KeywordExtractor(min_df=1, vocab_path=path)
+    assert extractor._load_vocabulary("other corpus") is None
+    assert extractor.cluster_keywords(TEXTS, LABELS) == first
+
+
+def test_vocabulary_cache_rebuilt_when_corpus_changes(tmp_path):
+    path = str(tmp_path / "vocab.joblib")
+    KeywordExtractor(min_df=1, vocab_path=path).cluster_keywords(TEXTS, LABELS)
+    texts = TEXTS + ["climate summit agreement", "climate protest march"]
+    keywords = KeywordExtractor(min_df=1, vocab_path=path).cluster_keywords(texts, LABELS + [2, 2])
+    assert "climate" in keywords[2]
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+import main
+import src.tagger
+from src import config
+from src.clustering import Clustering
+from src.models import Comment, Post
+from src.storage import POSTS_FILE, SQLiteStore, load_columnar, save_csv
+
+
+def _posts(n, start=0, score=100):
+    return [
+        Post(post_id=f"p{i:03d}", subreddit="politics", author=f"user{i}", title=f"title {i}", selftext="",
+             score=score, num_comments=20, created_utc="2025-01-01T00:00:00", flair=None, url="",
+             collection_date="2025-01-02T00:00:00")
+        for i in range(start, start + n)
+    ]
+
+
+def _comments(post_ids):
+    return [
+        Comment(comment_id=f"{post_id}c{j}", post_id=post_id, subreddit="politics", author=f"commenter{j}",
+                body=f"comment {j} on {post_id}", score=j, created_utc="2025-01-01T01:00:00", parent_id="",
+                collection_date="2025-01-02T00:00:00")
+        for post_id in post_ids for j in range(3)
+    ]
+
+
+def test_cluster_then_load_keeps_snapshot_posts(tmp_path, monkeypatch):
+    # Relative config paths (data/, embeddings/, the DB) now resolve under tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "DETECT_DUPLICATES", False)
+    save_csv(_posts(60), save_dir=config.DATA_SAVE_DIR)
+    SQLiteStore(config.DB_PATH).close()  # an empty DB must not hide the snapshot
+
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(3, 8)) * 10
+    vectors = (np.repeat(centres, 20, axis=0) + rng.normal(size=(60, 8))).astype(np.float32)
+    monkeypatch.setattr(Clustering, "post_embeddings", lambda self, posts: vectors[posts.index.to_numpy()])
+
+    posts, comments = main.load_data()
+    assert len(posts) == 60 and comments is None
+    clustered, _ = main.cluster(posts, comments, mode="refit")
+
+    posts, _ = main.load_data()
+    assert sorted(posts["post_id"]) == [f"p{i:03d}" for i in range(60)]
+    labels = dict(zip(clustered["post_id"], clustered["cluster_labels"]))
+    assert [labels[p] for p in posts["post_id"]] == posts["cluster_labels"].tolist()
+    assert posts["cluster_labels"].nunique() == 3
+
+
+def test_enrich_only_tags_the_delta(tmp_path, monkeypatch):
+    src.tagger.get_tagger()  # loads the lexicon from the repo before leaving it
+    monkeypatch.chdir(tmp_path)
+    with SQLiteStore(config.DB_PATH) as store:
+        store.upsert_posts(_posts(30))
+        store.upsert_comments(_comments([f"p{i:03d}" for i in range(30)]))
+    assert main._enrich_and_save(chunk_size=7) == 30
+
+    tagged = []
+    tag_posts = src.tagger.tag_posts
+    monkeypatch.setattr(src.tagger, "tag_posts", lambda posts: tagged.extend(posts["post_id"]) or tag_posts(posts))
+    # A later run collects one new post and two posts whose score moved
+    with SQLiteStore(config.DB_PATH) as store:
+        store.upsert_posts(_posts(1, start=30) + _posts(2, start=5, score=500))
+        store.upsert_comments(_comments(["p030"]))
+    assert main._enrich_and_save(["p030", "p005", "p006"], chunk_size=7) == 3
+    assert sorted(tagged) == ["p005", "p006", "p030"]
+
+    parquet = load_columnar(f"{config.DATA_SAVE_DIR}/{POSTS_FILE}.parquet")
+    csv = pd.read_csv(f"{config.DATA_SAVE_DIR}/{POSTS_FILE}.csv")
+    for snapshot in (parquet, csv):
+        assert sorted(snapshot["post_id"]) == [f"p{i:03d}" for i in range(31)]
+        scores = dict(zip(snapshot["post_id"], snapshot["score"]))
+        assert scores["p005"] == scores["p006"] == 500 and scores["p007"] == 100
+    top = dict(zip(parquet["post_id"], parquet["top_comments"]))
+    assert top["p030"] == ["comment 2 on p030", "comment 1 on p030", "comment 0 on p030"]
+    assert top["p000"] == ["comment 2 on p000", "comment 1 on p000", "comment 0 on p000"]
@@ -0,0 +1,38 @@
+import builtins
+import importlib
+
+import numpy as np
+
+from src import metrics
+
+
+def test_stage_records_peak_growth():
+    run = metrics.RunMetrics()
+    with run.stage("outer"):
+        with run.stage("alloc"):
+            block = np.ones(64 * 2**20 // 8)  # 64 MB, touched
+        del block
+    summary = run.summary()
+    assert summary["stages"]["outer/alloc"]["peak_rss_growth_mb"] >= 0
+    assert summary["process_peak_rss_mb"] >= summary["stages"]["outer"]["rss_mb"]
+
+
+def test_imports_without_resource(monkeypatch):
+    real_import = builtins.__import__
+
+    def no_resource(name, *args, **kwargs):
+        if name in ("resource", "psutil"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_resource)
+    try:
+        module = importlib.reload(metrics)
+        assert module.resource is None
+        run = module.RunMetrics()
+        with run.stage("work"):
+            pass
+        assert "process_peak_rss_mb" in run.summary()
+    finally:
+        monkeypatch.undo()
+        importlib.reload(metrics)
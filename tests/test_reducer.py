@@ -0,0 +1,27 @@
+import numpy as np
+
+from src import reducer
+
+
+def _embeddings(n=600, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=(n, 4)) @ rng.normal(size=(4, dim)) + 0.1 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_chunk_bounds_merges_short_tail():
+    assert reducer.chunk_bounds(25, 10, min_rows=6) == [(0, 10), (10, 25)]
+    assert reducer.chunk_bounds(25, 10) == [(0, 10), (10, 20), (20, 25)]
+
+
+def test_chunked_transform_matches_in_memory(tmp_path):
+    X = _embeddings()
+    np.save(tmp_path / "embeddings.npy", X)
+    mapped = np.load(tmp_path / "embeddings.npy", mmap_mode="r")
+    scaler, pca = reducer.fit_reducer(mapped, n_components=4, chunk_size=100)
+    in_memory = reducer.transform(X, scaler, pca, chunk_size=100)
+    out_path = str(tmp_path / "reduced.npy")
+    on_disk = reducer.transform(mapped, scaler, pca, out_path=out_path, chunk_size=64)
+    assert in_memory.shape == (len(X), 4)
+    np.testing.assert_allclose(np.load(out_path), in_memory, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(on_disk, in_memory, rtol=1e-5, atol=1e-5)
+    assert pca.explained_variance_ratio_.sum() > 0.9
@@ -0,0 +1,79 @@
+import pytest
+
+from fakes import FakeComment, FakeRedditClient, FakeSubmission
+from src.checkpoint import ScrapeCheckpoint
+from src.pooling import add_top_comments
+from src.reddit_client import RedditClient
+from src.reddit_scraper import RedditScraper
+
+DAY = 86_400.0
+T0 = 1_750_000_000.0
+
+
+def _submission(i, created_utc, score=100, num_comments=50):
+    comments = [FakeComment(id=f"s{i}c{j}", body=f"Comment {j} on submission {i} " * (j % 3 + 1), score=(j * 7) % 11)
+                for j in range(12)]
+    return FakeSubmission(id=f"s{i}", title=f"Title {i}", created_utc=created_utc, score=score,
+                          num_comments=num_comments, comments=comments)
+
+
+def _client():
+    top = [_submission(0, T0 + 10 * DAY), _submission(1, T0 + DAY), _submission(2, T0, score=1)]  # s2 below MIN_SCORE
+    hot = [_submission(1, T0 + DAY), _submission(3, T0 + 2 * DAY)]  # s1 repeats across listings
+    new = [_submission(4, T0 + 5 * DAY), _submission(5, T0 + 4 * DAY)]
+    return FakeRedditClient({("news", "top"): top, ("news", "hot"): hot, ("news", "new"): new})
+
+
+def _scraper(client, **kwargs):
+    kwargs = {"min_score": 10, "min_comments": 10, "max_comments_per_post": 10, "new_limit": 10, **kwargs}
+    return RedditScraper(subreddits=["news"], client=client, **kwargs)
+
+
+def test_client_interface_is_abstract():
+    with pytest.raises(TypeError):
+        RedditClient()
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_collects_posts_above_thresholds(workers):
+    client = _client()
+    scraper = _scraper(client, max_workers=workers)
+    scraper._run()
+    posts, comments = scraper.get_results()
+
+    assert sorted(posts["post_id"]) == ["s0", "s1", "s3", "s4", "s5"]
+    assert sorted(client.comment_calls) == ["s0", "s1", "s3", "s4", "s5"]  # s1 is fetched once
+    assert len(comments) == 5 * 10
+    assert comments["body"].str.islower().all()  # cleaned
+
+
+def test_streamed_top_comments_match_batch_path():
+    scraper = _scraper(_client())
+    scraper._run()
+    posts, comments = scraper.get_results()
+    expected, _ = add_top_comments(posts.drop(columns="top_comments"), comments, n=scraper.top_n_comments)
+    assert posts["top_comments"].tolist() == expected["top_comments"].tolist()
+
+
+def test_checkpoint_resumes_and_streams_comments(tmp_path):
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "test.db"), comment_paths=[str(tmp_path / "comments.jsonl")])
+    scraper = _scraper(_client(), checkpoint=checkpoint, checkpoint_every=2)
+    scraper._run()
+    checkpoint.close()
+    # With a checkpoint, comments go to storage instead of the scraper
+    assert len(scraper.get_results()[1]) == 0
+    assert scraper.n_comments == 50  # flushes mid-run do not stop the "new" listing at s4
+    with open(tmp_path / "comments.jsonl", encoding="utf-8") as f:
+        assert sum(1 for _ in f) == 50
+    # Only the "new" listing advances the high-water mark, though s0 (top) is newer
+    assert checkpoint.high_water["news"] == "2025-06-20T15:06:40"
+
+    client = _client()
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "test.db"))
+    rerun = _scraper(client, checkpoint=checkpoint)
+    rerun._run()
+    checkpoint.close()
+    assert len(rerun.get_results()[0]) == 0
+    assert rerun.skipped_unchanged == 4  # s0, s1, s3 unchanged; s2 was marked seen below thresholds
+    assert client.comment_calls == []
+    assert ("news", "new", 10) in client.listing_calls
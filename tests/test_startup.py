@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Report- and scrape-only runs must start in well under a second
+STARTUP_BUDGET_S = 1.0
+HEAVY_MODULES = ["torch", "sentence_transformers", "sklearn", "matplotlib", "praw"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {modules!r} if m in sys.modules]}}))
+"""
+
+
+def _probe(code, cwd, modules=HEAVY_MODULES) -> dict:
+    """
+    Runs `code` in a fresh interpreter; returns its run time and which of `modules` it loaded.
+    """
+    script = PROBE.format(root=ROOT, code=code, modules=modules)
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_cli_starts_without_heavy_dependencies(tmp_path):
+    # Run from an empty directory: importing main creates the data/report directories
+    probe = _probe("import main\nmain.parse_args(['report'])", tmp_path)
+    assert probe["loaded"] == []
+    assert probe["elapsed"] < STARTUP_BUDGET_S
+
+
+def test_clustering_imports_without_torch(tmp_path):
+    # Benchmarks and grid search use Clustering without embedding anything
+    probe = _probe("import src.clustering", tmp_path, modules=["torch", "sentence_transformers"])
+    assert probe["loaded"] == []
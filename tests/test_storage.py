@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.models import Post
+from src.storage import SQLiteStore, SnapshotWriter, load_columnar
+
+
+def _posts(n, offset=0):
+    return [
+        Post(post_id=f"p{offset + i:04d}", subreddit="politics", author="someone", title=f"title {i}", selftext="",
+             score=i, num_comments=i, created_utc="2025-01-01T00:00:00", flair=None, url="",
+             collection_date="2025-01-02T00:00:00")
+        for i in range(n)
+    ]
+
+
+def test_post_id_chunks_cover_every_post(tmp_path):
+    with SQLiteStore(str(tmp_path / "test.db")) as store:
+        store.upsert_posts(_posts(25))
+        chunks = list(store.post_id_chunks(10))
+        assert [len(c) for c in chunks] == [10, 10, 5]
+        assert sorted(p for c in chunks for p in c) == [f"p{i:04d}" for i in range(25)]
+        assert store.query_posts(post_ids=chunks[1])["post_id"].tolist() == chunks[1]
+
+
+@pytest.mark.parametrize("name", ["posts.parquet", "posts.csv"])
+def test_snapshot_writer_streams_chunks(tmp_path, name):
+    path = str(tmp_path / name)
+    with open(path + ".tmp", "w") as f:
+        f.write("stale,rows\n1,2\n")  # left by an interrupted run
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(_posts(3))
+        snapshot.write(_posts(2, offset=3))
+    written = load_columnar(path) if name.endswith(".parquet") else pd.read_csv(path)
+    assert written["post_id"].tolist() == [f"p{i:04d}" for i in range(5)]
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_snapshot_writer_keeps_old_snapshot_on_error(tmp_path):
+    path = str(tmp_path / "posts.parquet")
+    with SnapshotWriter(path) as snapshot:
+        snapshot.write(_posts(2))
+    with pytest.raises(RuntimeError):
+        with SnapshotWriter(path) as snapshot:
+            snapshot.write(_posts(5))
+            raise RuntimeError("interrupted")
+    assert len(load_columnar(path)) == 2
+    assert not os.path.exists(path + ".tmp")
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+from sklearn.cluster import HDBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+from benchmarks.run_benchmarks import SAMPLE_MIN_ARI, sample_agreement
+from src.two_stage import two_stage_hdbscan
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _blobs(n_per_blob=150, n_blobs=4, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_blobs, dim)) * 20
+    return (np.repeat(centres, n_per_blob, axis=0) + rng.normal(size=(n_blobs * n_per_blob, dim))).astype(np.float32)
+
+
+def test_two_stage_matches_exact_on_separated_blobs(tmp_path):
+    X = _blobs()
+    np.save(tmp_path / "reduced.npy", X)
+    # Far-apart blobs leave the neighbour graph disconnected until its parts are linked
+    labels = two_stage_hdbscan(np.load(tmp_path / "reduced.npy", mmap_mode="r"), n_micro=60)
+    exact = HDBSCAN(min_cluster_size=10, min_samples=5).fit_predict(X)
+    assert len(set(labels.tolist()) - {-1}) == 4
+    assert adjusted_rand_score(exact, labels) > 0.95
+
+
+def test_sample_agreement_floor(monkeypatch):
+    monkeypatch.chdir(ROOT)  # the shipped sample and the benchmark's shared dirs are relative paths
+    result = sample_agreement()
+    assert result["clusters"] == [result["exact_clusters"]] * len(result["seeds"])
+    assert min(result["ari_vs_exact"]) >= SAMPLE_MIN_ARI